@@ -21,11 +21,12 @@
 from __future__ import division
 
 from .error_handling import GPArgumentError, GPImpossibleParamsError
-from .kernel import Kernel, ZeroKernel, DiagonalNoiseKernel
-from .utils import wrap_fmin_slsqp, univariate_envelope_plot, CombinedBounds, unique_rows, plot_sampler, summarize_sampler
+from .kernel import Kernel, ZeroKernel, DiagonalNoiseKernel, PairGeometry
+from .utils import wrap_fmin_slsqp, univariate_envelope_plot, CombinedBounds, unique_rows, plot_sampler, summarize_sampler, cholupdate
 
 import scipy
 import scipy.linalg
+import scipy.sparse
 import scipy.optimize
 import scipy.stats
 import numpy.random
@@ -34,6 +35,11 @@ import sys
 import warnings
 import traceback
 import multiprocessing
+import multiprocessing.pool
+import multiprocessing.util
+import collections
+import copy
+import threading
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 try:
@@ -53,6 +59,67 @@ except ImportError:
         ImportWarning
     )
 
+def _eye_like(T, n):
+    """Make an `n`-by-`n` identity matrix, which is sparse if `T` is.
+    """
+    if scipy.sparse.issparse(T):
+        return scipy.sparse.eye(n, format='csr')
+    else:
+        return scipy.eye(n)
+
+def _nonzero_cols(T):
+    """Find the columns of the (possibly sparse) matrix `T` with any nonzero elements.
+    """
+    if scipy.sparse.issparse(T):
+        return scipy.asarray(abs(T).sum(axis=0)).ravel() != 0.0
+    else:
+        return (T != 0.0).any(axis=0)
+
+def _sum_columns(T, inv, num_cols):
+    """Sum the columns of the (possibly sparse) matrix `T` into `num_cols` columns.
+    
+    Column `j` of `T` is added to column `inv[j]` of the result. This is done
+    as a product with a sparse selection matrix, so the cost scales with the
+    number of nonzero elements of `T`. The result is sparse (CSR) if `T` is.
+    """
+    P = scipy.sparse.csr_matrix(
+        (scipy.ones(len(inv)), (scipy.arange(len(inv)), inv)),
+        shape=(len(inv), num_cols)
+    )
+    if scipy.sparse.issparse(T):
+        return scipy.sparse.csr_matrix(T.dot(P))
+    else:
+        return scipy.ascontiguousarray(P.T.dot(T.T).T)
+
+def _stack_condensed(T_old, T_new):
+    """Stack the rows of `T_new` below `T_old`, whose columns are a leading subset of those of `T_new`.
+    """
+    num_new = T_new.shape[1] - T_old.shape[1]
+    if scipy.sparse.issparse(T_old) or scipy.sparse.issparse(T_new):
+        T_old = scipy.sparse.hstack(
+            (T_old, scipy.sparse.csr_matrix((T_old.shape[0], num_new))),
+            format='csr'
+        )
+        return scipy.sparse.vstack((T_old, T_new), format='csr')
+    else:
+        return scipy.vstack(
+            (scipy.hstack((T_old, scipy.zeros((T_old.shape[0], num_new)))), T_new)
+        )
+
+def _add_to_diag(A, d):
+    """Add `d` to the diagonal of the square array `A` in place.
+    """
+    A.flat[::A.shape[0] + 1] += d
+
+def _transform_symmetric(T, K):
+    """Compute :math:`TKT^T` for a symmetric matrix `K`.
+    
+    This is written as :math:`T(TK)^T` so that `T` can be a
+    :py:mod:`scipy.sparse` matrix (which must always be the left operand), in
+    which case a dense array is returned.
+    """
+    return scipy.asarray(T.dot(scipy.asarray(T.dot(K)).T))
+
 class GaussianProcess(object):
     r"""Gaussian process.
     
@@ -64,6 +131,12 @@ class GaussianProcess(object):
     Note that the attributes have no write protection, but you should always
     add data with :py:meth:`add_data` to ensure internal consistency.
     
+    :py:meth:`predict` may be called from several threads at once: the
+    factorization is computed under a lock, and each call then works with the
+    factorization it saw. The hyperparameters and data must not be changed
+    while predictions are running. If that is needed, give each thread a
+    :py:meth:`freeze` snapshot instead.
+    
     Parameters
     ----------
     k : :py:class:`~gptools.kernel.core.Kernel` instance
@@ -79,10 +152,10 @@ class GaussianProcess(object):
         None, which results in the :py:class:`~gptools.kernel.noise.ZeroKernel`
         (noise specified elsewhere or not present).
     diag_factor : float, optional
-        Factor of :py:attr:`sys.float_info.epsilon` which is added to the
-        diagonal of the total `K` matrix to improve the stability of the
-        Cholesky decomposition. If you are having issues, try increasing this by
-        a factor of 10 at a time. Default is 1e2.
+        Factor of the machine epsilon of `dtype` which is added to the diagonal
+        of the total `K` matrix to improve the stability of the Cholesky
+        decomposition. If you are having issues, try increasing this by a factor
+        of 10 at a time. Default is 1e2.
     mu : :py:class:`~gptools.mean.MeanFunction` instance
         The mean function of the Gaussian process. Default is None (zero mean
         prior).
@@ -111,8 +184,8 @@ class GaussianProcess(object):
         transformed quantities, `T` is the transformation matrix and `Y(X)` is
         the underlying (untransformed) values of the function to be fit that
         enter into the transformation. When `T` is `M`-by-`N` and `y` has `M`
-        elements, `X` and `n` will both be `N`-by-`D`. Default is None (no
-        transformation).
+        elements, `X` and `n` will both be `N`-by-`D`. `T` may be a
+        :py:mod:`scipy.sparse` matrix. Default is None (no transformation).
     use_hyper_deriv : bool, optional
         If True, the elements needed to compute the derivatives of the
         log-likelihood with respect to the hyperparameters will be computed.
@@ -124,6 +197,44 @@ class GaussianProcess(object):
         will not be generated. This does not control when a warning happens in a
         routine which is called, however. Default is False (do not produce
         warnings).
+    max_bytes : positive int or None, optional
+        Approximate memory budget (in bytes) for the intermediate arrays formed
+        when evaluating the kernel in :py:meth:`compute_Kij`. If given,
+        covariance matrices are assembled in square blocks sized so that the
+        tiled inputs to the kernel for a single block fit in `max_bytes`. This
+        bounds the peak memory used for large prediction grids. Default is None
+        (evaluate each covariance matrix in one shot).
+    factor_cache_bytes : positive int or None, optional
+        If given, the results of :py:meth:`compute_K_L_alpha_ll` are kept in a
+        least-recently-used cache keyed by the hyperparameter vector, holding
+        at most approximately `factor_cache_bytes` bytes of arrays. Repeated
+        evaluations at the same hyperparameters (such as from rejected MCMC
+        proposals) then skip the kernel evaluation and Cholesky decomposition.
+        Default is None (no caching).
+    dtype : numpy dtype, optional
+        The floating point type used to store the covariance matrices and to
+        perform the Cholesky decomposition and the solves in
+        :py:meth:`predict`. Using `scipy.float32` halves the memory needed and
+        speeds up the linear algebra at the cost of accuracy, which may be
+        acceptable for exploratory fits on large datasets. The kernels
+        themselves are still evaluated in double precision. If the Cholesky
+        decomposition fails in a lower precision it is redone in double
+        precision. Default is `float` (double precision).
+    high_precision_ll : bool, optional
+        If True and `dtype` is not double precision, the solution :math:`\alpha`
+        (and hence the data fit term of the log-likelihood) is refined in double
+        precision using iterative refinement against the lower precision
+        Cholesky factor. Only the data fit term is refined: the log-determinant
+        and the matrix :math:`K^{-1}` used for the hyperparameter derivatives
+        still come from the lower precision factor. Default is False (use the
+        lower precision result directly).
+    num_threads : positive int, optional
+        The number of threads to split the evaluation of the covariance
+        matrices over. The results are identical to the serial evaluation.
+        The threads are started the first time they are needed and are kept
+        for the lifetime of the instance. Note that when `max_bytes` is given,
+        up to `num_threads` blocks are held in memory at once. Default is 1
+        (serial evaluation).
     
     Attributes
     ----------
@@ -142,7 +253,7 @@ class GaussianProcess(object):
     n : array, (`M`, `D`)
         The orders of derivatives that each of the `M` training points represent, indicating the order of derivative with respect to each of the `D` dimensions.
     T : array, (`M`, `N`)
-        The transformation matrix applied to the training data. If this is not None, `X` and `n` will be `N`-by-`D`.
+        The transformation matrix applied to the training data. If this is not None, `X` and `n` will be `N`-by-`D`. This is a :py:class:`scipy.sparse.csr_matrix` if a sparse `T` was passed to :py:meth:`add_data`.
     y : array, (`M`,)
         The `M` training target values.
     err_y : array, (`M`,)
@@ -158,13 +269,27 @@ class GaussianProcess(object):
     ll : float
         Log-posterior density of the model.
     diag_factor : float
-        The factor of :py:attr:`sys.float_info.epsilon` which is added to the diagonal of the :py:attr:`K` matrix to improve stability.
+        The factor of the machine epsilon of :py:attr:`dtype` which is added to the diagonal of the :py:attr:`K` matrix to improve stability.
     K_up_to_date : bool
         True if no data have been added since the last time the internal state was updated with a call to :py:meth:`compute_K_L_alpha_ll`.
     use_hyper_deriv : bool
          Whether or not the derivative of the log-posterior with respect to the hyperparameters should be computed/used.
     verbose : bool
         Whether or not to print non-critical, internally-generated warnings.
+    max_bytes : int or None
+        The memory budget for the blockwise assembly of covariance matrices. If None, blockwise assembly is not used.
+    factor_cache_bytes : int or None
+        The memory bound for the cache of factorizations. If None, factorizations are not cached.
+    dtype : numpy dtype
+        The floating point type used to store the covariance matrices.
+    high_precision_ll : bool
+        Whether or not :math:`\alpha` (and hence the data fit term of the log-likelihood) is refined in double precision when :py:attr:`dtype` is a lower precision.
+    num_threads : int
+        The number of threads used to evaluate the covariance matrices.
+    factor_cache_hits : int
+        The number of times :py:meth:`compute_K_L_alpha_ll` was satisfied from the cache of factorizations.
+    factor_cache_misses : int
+        The number of times :py:meth:`compute_K_L_alpha_ll` had to perform the factorization while the cache was enabled.
     params : :py:class:`~gptools.utils.CombinedBounds`
         The current values of the hyperparameters for the covariance kernel, noise covariance kernel and mean function (in that order). This is actually a getter method with a property decorator which returns a :py:class:`~gptools.utils.CombinedBounds` instance. This permits the hyperparameters to be modified in place.
     param_bounds : :py:class:`~gptools.utils.CombinedBounds`
@@ -194,7 +319,9 @@ class GaussianProcess(object):
     add_data : Used to process `X`, `y`, `err_y` and to add data.
     """
     def __init__(self, k, noise_k=None, X=None, y=None, err_y=0, n=0, T=None,
-                 diag_factor=1e2, mu=None, use_hyper_deriv=False, verbose=False):
+                 diag_factor=1e2, mu=None, use_hyper_deriv=False, verbose=False,
+                 max_bytes=None, factor_cache_bytes=None, dtype=float,
+                 high_precision_ll=False, num_threads=1):
         if not isinstance(k, Kernel):
             raise TypeError(
                 "Argument k must be an instance of Kernel when constructing "
@@ -215,6 +342,19 @@ class GaussianProcess(object):
         self.noise_k = noise_k
         self.use_hyper_deriv = use_hyper_deriv
         self.verbose = verbose
+        self.max_bytes = max_bytes
+        self._K_geometry = None
+        self._condense_index = None
+        self.factor_cache_bytes = factor_cache_bytes
+        self._factor_cache = collections.OrderedDict()
+        self._factor_cache_nbytes = 0
+        self.factor_cache_hits = 0
+        self.factor_cache_misses = 0
+        self.dtype = scipy.dtype(dtype)
+        self.high_precision_ll = high_precision_ll
+        self.num_threads = num_threads
+        self._thread_pool = None
+        self._lock = threading.RLock()
         
         # Set the placeholder shapes:
         self.y = scipy.array([], dtype=float)
@@ -222,6 +362,7 @@ class GaussianProcess(object):
         self.err_y = scipy.array([], dtype=float)
         self.n = None
         self.T = None
+        self.K_up_to_date = False
         
         if X is not None:
             if y is None:
@@ -243,6 +384,42 @@ class GaussianProcess(object):
     
     # TODO: These getters don't handle assignment by index!
     
+    def __getstate__(self):
+        """Get the state for pickling and copying, without the (unpicklable) lock and thread pool.
+        """
+        state = self.__dict__.copy()
+        del state['_lock']
+        state.pop('_thread_pool', None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._thread_pool = None
+    
+    def _lean_copy(self):
+        """Make a shallow copy without the covariance matrices and other caches.
+        
+        Everything which is dropped is recomputed the next time the
+        hyperparameters are updated, so the copy is suitable to send to other
+        processes which will fit the hyperparameters.
+        
+        Returns
+        -------
+        gp : :py:class:`GaussianProcess`
+            The copy, which shares the kernels and data with this instance.
+        """
+        with self._lock:
+            gp = copy.copy(self)
+        for name in ['K', 'L', 'alpha', 'll', 'll_deriv', '_noise_K']:
+            gp.__dict__.pop(name, None)
+        gp.K_up_to_date = False
+        gp._K_geometry = None
+        gp._condense_index = None
+        gp._factor_cache = collections.OrderedDict()
+        gp._factor_cache_nbytes = 0
+        return gp
+    
     @property
     def hyperprior(self):
         """Combined hyperprior for the kernel, noise kernel and (if present) mean function.
@@ -373,9 +550,31 @@ class GaussianProcess(object):
         if self.mu is not None:
             self.mu.free_param_names = value[self.k.num_free_params + self.noise_k.num_free_params:]
     
-    def add_data(self, X, y, err_y=0, n=0, T=None):   
+    @property
+    def noise_K(self):
+        """Noise portion of the covariance matrix between all of the training inputs.
+        
+        If the noise kernel is a
+        :py:class:`~gptools.kernel.noise.DiagonalNoiseKernel` only the diagonal
+        is stored, and the full matrix is only formed when it is accessed here.
+        """
+        if self._noise_K.ndim == 1:
+            return scipy.diag(self._noise_K)
+        else:
+            return self._noise_K
+    
+    @noise_K.setter
+    def noise_K(self, value):
+        self._noise_K = value
+    
+    def add_data(self, X, y, err_y=0, n=0, T=None, condense=False):
         """Add data to the training data set of the GaussianProcess instance.
         
+        If the factorization is up to date for the current hyperparameters
+        (i.e., :py:attr:`K_up_to_date` is True) and no transformation is
+        involved, the Cholesky factor is extended to include the new points
+        instead of being recomputed from scratch the next time it is needed.
+        
         Parameters
         ----------
         X : array, (`M`, `D`)
@@ -402,7 +601,18 @@ class GaussianProcess(object):
             `Y(X)` is the underlying (untransformed) values of the function to
             be fit that enter into the transformation. When `T` is `M`-by-`N`
             and `y` has `M` elements, `X` and `n` will both be `N`-by-`D`.
-            Default is None (no transformation).
+            `T` may be a :py:mod:`scipy.sparse` matrix, in which case
+            :py:attr:`T` is kept in sparse (CSR) form. Default is None (no
+            transformation).
+        condense : bool, optional
+            If True, new points whose [X, n] rows are already present in the
+            training data (or which are repeated within `X`) are not appended.
+            Instead, the corresponding columns of `T` are merged into the
+            existing ones, as :py:meth:`condense_duplicates` would do, and a
+            sparse transformation matrix is created if necessary. The lookup table
+            used for this is kept between calls, so condensing as the data
+            arrive costs time proportional to the size of each new batch.
+            Default is False (always append the new points).
         
         Raises
         ------
@@ -463,11 +673,27 @@ class GaussianProcess(object):
         if (n < 0).any():
             raise ValueError("All elements of n must be non-negative integers!")
         
+        # The existing factorization can only be extended if it is current and
+        # no transformation is involved:
+        append = (
+            self.K_up_to_date and self.X is not None and T is None and
+            self.T is None and not self.use_hyper_deriv and
+            not (self.high_precision_ll and self.dtype != float) and
+            not condense
+        )
+        
         # Handle transform:
         if T is None and self.T is not None:
-            T = scipy.eye(len(y))
+            T = _eye_like(self.T, len(y))
+        elif T is None and condense:
+            # Plain points are condensed through a sparse identity so that no
+            # dense transformation matrix is created for them:
+            T = scipy.sparse.eye(len(y), format='csr')
         if T is not None:
-            T = scipy.atleast_2d(scipy.asarray(T, dtype=float))
+            if scipy.sparse.issparse(T):
+                T = scipy.sparse.csr_matrix(T, dtype=float)
+            else:
+                T = scipy.atleast_2d(scipy.asarray(T, dtype=float))
             if T.ndim != 2:
                 raise ValueError("T must have exactly 2 dimensions!")
             if T.shape[0] != len(y):
@@ -479,10 +705,17 @@ class GaussianProcess(object):
                     "There must be as many columns in T as there are rows in X!"
                 )
             if self.T is None and self.X is not None:
-                self.T = scipy.eye(len(self.y))
+                self.T = _eye_like(T, len(self.y))
+            
+            if condense:
+                X, n, T = self._condense_new_points(X, n, T)
             
             if self.T is None:
                 self.T = T
+            elif condense:
+                self.T = _stack_condensed(self.T, T)
+            elif scipy.sparse.issparse(self.T) or scipy.sparse.issparse(T):
+                self.T = scipy.sparse.block_diag((self.T, T), format='csr')
             else:
                 self.T = scipy.linalg.block_diag(self.T, T)
         
@@ -496,7 +729,71 @@ class GaussianProcess(object):
             self.n = n
         else:
             self.n = scipy.vstack((self.n, n))
-        self.K_up_to_date = False
+        condense_index = self._condense_index
+        self._invalidate_data_caches()
+        if condense:
+            self._condense_index = condense_index
+        self.K_up_to_date = append and self._append_to_factorization(len(y))
+        if self.K_up_to_date:
+            self._store_cached_factorization()
+    
+    def _invalidate_data_caches(self):
+        """Discard any cached quantities which depend on the training data.
+        
+        Must be called whenever :py:attr:`X` or :py:attr:`n` are modified,
+        including in-place modifications.
+        """
+        self._K_geometry = None
+        self._condense_index = None
+        self.clear_factor_cache()
+    
+    def _condense_new_points(self, X, n, T):
+        """Map new points onto the existing training points for :py:meth:`add_data`.
+        
+        Parameters
+        ----------
+        X : array, (`N`, `D`)
+            New input values.
+        n : array, (`N`, `D`)
+            New derivative orders.
+        T : array or sparse matrix, (`M`, `N`)
+            Transformation matrix for the new data.
+        
+        Returns
+        -------
+        X : array, (`N_new`, `D`)
+            The rows of `X` which are not yet present in the training data.
+        n : array, (`N_new`, `D`)
+            The corresponding derivative orders.
+        T : array or sparse matrix, (`M`, `N_old` + `N_new`)
+            Transformation matrix acting on the existing points followed by
+            the new points.
+        """
+        num_old = 0 if self.X is None else len(self.X)
+        if self._condense_index is None:
+            self._condense_index = {}
+            if self.X is not None:
+                for i, row in enumerate(scipy.hstack((self.X, self.n))):
+                    self._condense_index.setdefault(row.tobytes(), i)
+        inv = scipy.empty(len(X), dtype=int)
+        keep = []
+        for i, row in enumerate(scipy.hstack((X, n))):
+            key = row.tobytes()
+            j = self._condense_index.get(key)
+            if j is None:
+                j = num_old + len(keep)
+                self._condense_index[key] = j
+                keep.append(i)
+            inv[i] = j
+        return X[keep, :], n[keep, :], _sum_columns(T, inv, num_old + len(keep))
+    
+    def clear_factor_cache(self):
+        """Empty the cache of factorizations.
+        
+        The hit and miss counters are not reset.
+        """
+        self._factor_cache.clear()
+        self._factor_cache_nbytes = 0
     
     def condense_duplicates(self):
         """Condense duplicate points using a transformation matrix.
@@ -506,8 +803,8 @@ class GaussianProcess(object):
         points.
         
         Won't change the GP if all of the rows of [X, n] are unique. Will create
-        a transformation matrix T if necessary. Note that the order of the
-        points in [X, n] will be arbitrary after this operation.
+        a sparse (CSR) transformation matrix T if necessary. Note that the order
+        of the points in [X, n] will be arbitrary after this operation.
         
         If there are any transformed quantities (i.e., `self.T` is not None), it
         will also remove any quadrature points for which all of the weights are
@@ -519,24 +816,28 @@ class GaussianProcess(object):
         )
         # Only proceed if there is anything to be gained:
         if len(unique) != len(self.X):
+            # Sum the columns which refer to the same point:
             if self.T is None:
-                self.T = scipy.eye(len(self.y))
-            new_T = scipy.zeros((len(self.y), unique.shape[0]))
-            for j in xrange(0, len(inv)):
-                new_T[:, inv[j]] += self.T[:, j]
-            self.T = new_T
+                self.T = _sum_columns(
+                    scipy.sparse.eye(len(self.y), format='csr'),
+                    inv,
+                    unique.shape[0]
+                )
+            else:
+                self.T = _sum_columns(self.T, inv, unique.shape[0])
             self.n = unique[:, self.X.shape[1]:]
             self.X = unique[:, :self.X.shape[1]]
         # Also remove any points which don't enter into the calculation:
         if self.T is not None:
             # Find the columns of T which actually enter in:
             # Recall that T is (n, n_Q), X is (n_Q, n_dim).
-            good_cols = (self.T != 0.0).any(axis=0)
+            good_cols = _nonzero_cols(self.T)
             self.T = self.T[:, good_cols]
             self.X = self.X[good_cols, :]
             self.n = self.n[good_cols, :]
+        self._invalidate_data_caches()
     
-    def remove_outliers(self, thresh=3, **predict_kwargs):
+    def remove_outliers(self, thresh=3, loo=False, **predict_kwargs):
         """Remove outliers from the GP with very simplistic outlier detection.
         
         Removes points that are more than `thresh` * `err_y` away from the GP
@@ -552,6 +853,13 @@ class GaussianProcess(object):
         thresh : float, optional
             The threshold as a multiplier times `err_y`. Default is 3 (i.e.,
             throw away all 3-sigma points).
+        loo : bool, optional
+            If True, each point is compared to the leave-one-out mean from
+            :py:meth:`loo_predict` (i.e., the prediction from all of the other
+            points) instead of the mean of the GP conditioned on all of the
+            points, so a point cannot pull the mean towards itself. This uses
+            the current values of the hyperparameters and `predict_kwargs` are
+            ignored. Default is False (use :py:meth:`predict`).
         **predict_kwargs : optional kwargs
             All additional kwargs are passed to :py:meth:`predict`. You can, for
             instance, use this to make it use MCMC to evaluate the mean. (If you
@@ -575,21 +883,62 @@ class GaussianProcess(object):
             Transformation matrix of returned points. Only returned if
             :py:attr:`T` is not None for the instance.
         """
-        mean = self.predict(
-            self.X, n=self.n, noise=False, return_std=False,
-            output_transform=self.T, **predict_kwargs
-        )
+        if loo:
+            mean = self.loo_predict()[0]
+        else:
+            mean = self.predict(
+                self.X, n=self.n, noise=False, return_std=False,
+                output_transform=self.T, **predict_kwargs
+            )
         deltas = scipy.absolute(mean - self.y) / self.err_y
         deltas[self.err_y == 0] = 0
         bad_idxs = (deltas >= thresh)
+        
+        removed = self.remove_data(bad_idxs)
+        if self.T is None:
+            return removed + (bad_idxs,)
+        else:
+            return removed[:4] + (bad_idxs, removed[4])
+    
+    def remove_data(self, idxs):
+        """Remove points from the training data set of the GaussianProcess instance.
+        
+        If the factorization is up to date for the current hyperparameters
+        (i.e., :py:attr:`K_up_to_date` is True) and no transformation is
+        involved, the Cholesky factor is downdated to remove the points in
+        :math:`O(kN^2)` operations instead of being recomputed from scratch
+        the next time it is needed.
+        
+        Parameters
+        ----------
+        idxs : array of int or array of bool, (`N`,)
+            The indices of the observations in :py:attr:`y` to remove, or a
+            boolean array which is True wherever a point is to be removed.
+        
+        Returns
+        -------
+        X_bad : array
+            Input values of the removed points.
+        y_bad : array
+            Removed values.
+        err_y_bad : array
+            Uncertainties on the removed values.
+        n_bad : array
+            Derivative order of the removed values.
+        T_bad : array
+            Transformation matrix of returned points. Only returned if
+            :py:attr:`T` is not None for the instance.
+        """
+        bad_idxs = scipy.zeros(len(self.y), dtype=bool)
+        bad_idxs[idxs] = True
         good_idxs = ~bad_idxs
         
         # Pull out the old values so they can be returned:
         y_bad = self.y[bad_idxs]
         err_y_bad = self.err_y[bad_idxs]
         if self.T is not None:
-            T_bad = self.T[bad_idxs, :]
-            non_zero_cols = (T_bad != 0).all(axis=0)
+            T_bad = self.T[scipy.nonzero(bad_idxs)[0], :]
+            non_zero_cols = _nonzero_cols(T_bad)
             T_bad = T_bad[:, non_zero_cols]
             X_bad = self.X[non_zero_cols, :]
             n_bad = self.n[non_zero_cols, :]
@@ -597,28 +946,71 @@ class GaussianProcess(object):
             X_bad = self.X[bad_idxs, :]
             n_bad = self.n[bad_idxs, :]
         
+        # The existing factorization can only be downdated if it is current
+        # and no transformation is involved:
+        downdate = (
+            self.K_up_to_date and self.T is None and bad_idxs.any() and
+            not self.use_hyper_deriv and
+            not (self.high_precision_ll and self.dtype != float)
+        )
+        
         # Delete the offending points:
         if self.T is None:
             self.X = self.X[good_idxs, :]
             self.n = self.n[good_idxs, :]
         else:
-            self.T = self.T[good_idxs, :]
-            non_zero_cols = (self.T != 0).all(axis=0)
+            self.T = self.T[scipy.nonzero(good_idxs)[0], :]
+            non_zero_cols = _nonzero_cols(self.T)
             self.T = self.T[:, non_zero_cols]
             self.X = self.X[non_zero_cols, :]
             self.n = self.n[non_zero_cols, :]
         self.y = self.y[good_idxs]
         self.err_y = self.err_y[good_idxs]
-        self.K_up_to_date = False
+        self._invalidate_data_caches()
+        if downdate:
+            self._remove_from_factorization(bad_idxs)
+        elif bad_idxs.any():
+            self.K_up_to_date = False
         
         if self.T is None:
-            return (X_bad, y_bad, err_y_bad, n_bad, bad_idxs)
+            return (X_bad, y_bad, err_y_bad, n_bad)
+        else:
+            return (X_bad, y_bad, err_y_bad, n_bad, T_bad)
+    
+    def _remove_from_factorization(self, bad_idxs):
+        r"""Downdate the current factorization to remove the given points.
+        
+        Removing row and column :math:`i` from :math:`K = LL^T` leaves the
+        leading block of :math:`L` unchanged, while the trailing block
+        :math:`L_{33}` must be replaced by the factor of
+        :math:`L_{33}L_{33}^T + l_{32}l_{32}^T`, where :math:`l_{32}` is the
+        part of column :math:`i` below the diagonal. This rank-one update is
+        applied for each point removed, in order of increasing index, so the
+        total cost is :math:`O(kN^2)`.
+        
+        Parameters
+        ----------
+        bad_idxs : array of bool, (`N`,)
+            True for each point (of the old training data) to remove.
+        """
+        good_idxs = ~bad_idxs
+        L = self.L.copy()
+        for i in scipy.nonzero(bad_idxs)[0]:
+            cholupdate(L[i + 1:, i + 1:], L[i + 1:, i].copy())
+        self.L = L[scipy.ix_(good_idxs, good_idxs)]
+        self.K = self.K[scipy.ix_(good_idxs, good_idxs)]
+        if self._noise_K.ndim == 1:
+            self._noise_K = self._noise_K[good_idxs]
         else:
-            return (X_bad, y_bad, err_y_bad, n_bad, bad_idxs, T_bad)
+            self._noise_K = self._noise_K[scipy.ix_(good_idxs, good_idxs)]
+        self._compute_alpha_ll(None)
+        self.K_up_to_date = True
+        self._store_cached_factorization()
     
     def optimize_hyperparameters(self, method='SLSQP', opt_kwargs={},
                                  verbose=False, random_starts=None,
-                                 num_proc=None, max_tries=1):
+                                 num_proc=None, max_tries=1, pool=None,
+                                 race_margin=None, race_iter=5):
         r"""Optimize the hyperparameters by maximizing the log-posterior.
         
         Leaves the :py:class:`GaussianProcess` instance in the optimized state.
@@ -663,6 +1055,32 @@ class GaussianProcess(object):
             Number of times to run through the random start procedure if a
             solution is not found. Default is to only go through the procedure
             once.
+        pool : object with a `map` method, optional
+            Pool or executor to run the random starts with, such as a
+            :py:class:`multiprocessing.Pool` or a
+            :py:class:`concurrent.futures.ProcessPoolExecutor`. The pool is not
+            closed, so it can be reused across many fits. Only a lean copy of
+            the :py:class:`GaussianProcess` (without the covariance matrices
+            and other cached quantities) is sent along with the starting
+            guesses, but since an arbitrary pool has no way of keeping it
+            between tasks it is pickled again with every chunk of tasks the
+            pool sends out. If None, a pool of `num_proc` processes is created for
+            this call and is shared between all of the `max_tries` attempts,
+            with the lean copy sent to each process once when it starts.
+            Default is None.
+        race_margin : float or None, optional
+            If given, the random starts are raced: they share the best value of
+            the objective (the negative log-posterior) reached by the starts of
+            the current trial which have completed, and a start whose own best
+            value is still worse than that by more than `race_margin` after
+            `race_iter` iterations is cancelled. Cancelled
+            starts are not counted as completed. This uses the `callback`
+            keyword of :py:func:`scipy.optimize.minimize`, so it only applies
+            to methods which support it. Default is None (run every start to
+            convergence).
+        race_iter : positive int, optional
+            Number of iterations each start is allowed before it can be
+            cancelled when racing. Default is 5.
         """
         if opt_kwargs is None:
             opt_kwargs = {}
@@ -701,42 +1119,71 @@ class GaussianProcess(object):
             opt_kwargs['bounds'] = param_ranges
         if self.use_hyper_deriv:
             opt_kwargs['jac'] = True
+        
+        race = None
+        manager = None
+        if race_margin is not None:
+            if pool is not None:
+                # Tasks sent to an arbitrary pool can only share state
+                # through a server process:
+                manager = multiprocessing.Manager()
+                race = _RaceState(
+                    race_margin, race_iter,
+                    manager.Value('d', scipy.inf), manager.Lock()
+                )
+            else:
+                best = multiprocessing.Value('d', scipy.inf)
+                race = _RaceState(race_margin, race_iter, best, best.get_lock())
+        own_pool = False
+        if pool is not None:
+            map_fun = pool.map
+            opt_eval = _OptimizeHyperparametersEval(self._lean_copy(), opt_kwargs, race=race)
+        elif num_proc > 1:
+            # Each worker process receives the lean copy once when it starts,
+            # after that only the starting guesses are sent:
+            pool = InterruptiblePool(
+                processes=num_proc,
+                initializer=_init_optimize_worker,
+                initargs=(self._lean_copy(), opt_kwargs, race)
+            )
+            own_pool = True
+            map_fun = pool.map
+            opt_eval = _optimize_worker_eval
+        else:
+            map_fun = map
+            opt_eval = _OptimizeHyperparametersEval(self, opt_kwargs, race=race)
         trial = 0
         res_min = None
-        while trial < max_tries and res_min is None:
-            if trial >= 1:
-                if self.verbose:
-                    warnings.warn(
-                        "No solutions found on trial %d, retrying random starts." % (trial - 1,),
-                        RuntimeWarning
-                    )
-                # Produce a new initial guess:
-                if random_starts != 0:
-                    param_samples = self.hyperprior.random_draw(size=random_starts).T
-                    param_samples = param_samples[:, ~self.fixed_params]
-            trial += 1
-            if num_proc > 1:
-                pool = InterruptiblePool(processes=num_proc)
-                map_fun = pool.map
-            else:
-                map_fun = map
-            try:
-                res = map_fun(
-                    _OptimizeHyperparametersEval(self, opt_kwargs),
-                    param_samples
-                )
-            finally:
-                if num_proc > 1:
-                    pool.close()
-            # Filter out the failed convergences:
-            res = [r for r in res if r is not None]
-            
-            try:
-                res_min = min(res, key=lambda r: r.fun)
-                if scipy.isnan(res_min.fun) or scipy.isinf(res_min.fun):
+        try:
+            while trial < max_tries and res_min is None:
+                if trial >= 1:
+                    if self.verbose:
+                        warnings.warn(
+                            "No solutions found on trial %d, retrying random starts." % (trial - 1,),
+                            RuntimeWarning
+                        )
+                    # Produce a new initial guess:
+                    if random_starts != 0:
+                        param_samples = self.hyperprior.random_draw(size=random_starts).T
+                        param_samples = param_samples[:, ~self.fixed_params]
+                trial += 1
+                if race is not None:
+                    # Only race against the starts of this trial:
+                    race.reset()
+                # Filter out the failed convergences:
+                res = [r for r in map_fun(opt_eval, param_samples) if r is not None]
+                
+                try:
+                    res_min = min(res, key=lambda r: r.fun)
+                    if scipy.isnan(res_min.fun) or scipy.isinf(res_min.fun):
+                        res_min = None
+                except ValueError:
                     res_min = None
-            except ValueError:
-                res_min = None
+        finally:
+            if own_pool:
+                pool.close()
+            if manager is not None:
+                manager.shutdown()
         
         if res_min is None:
             raise ValueError(
@@ -858,6 +1305,7 @@ class GaussianProcess(object):
         output_transform: array, (`L`, `M`), optional
             Matrix to use to transform the output vector of length `M` to one of
             length `L`. This can, for instance, be used to compute integrals.
+            May be a :py:mod:`scipy.sparse` matrix.
         **kwargs : optional kwargs
             All additional kwargs are passed to :py:meth:`predict_MCMC` if
             `use_MCMC` is True.
@@ -919,7 +1367,10 @@ class GaussianProcess(object):
             
             # Process T:
             if output_transform is not None:
-                output_transform = scipy.atleast_2d(scipy.asarray(output_transform, dtype=float))
+                if scipy.sparse.issparse(output_transform):
+                    output_transform = scipy.sparse.csr_matrix(output_transform, dtype=float)
+                else:
+                    output_transform = scipy.atleast_2d(scipy.asarray(output_transform, dtype=float))
                 if output_transform.ndim != 2:
                     raise ValueError(
                         "output_transform must have exactly 2 dimensions! Shape "
@@ -952,13 +1403,17 @@ class GaussianProcess(object):
             if (n < 0).any():
                 raise ValueError("All elements of n must be non-negative integers!")
             
-            self.compute_K_L_alpha_ll()
-            Kstar = self.compute_Kij(self.X, Xstar, self.n, n)
+            # Take a consistent snapshot of the factorization, so that
+            # concurrent calls do not see each other's updates:
+            with self._lock:
+                self.compute_K_L_alpha_ll()
+                X, n_train, T, L, alpha = self.X, self.n, self.T, self.L, self.alpha
+            Kstar = self.compute_Kij(X, Xstar, n_train, n)
             if noise:
-                Kstar = Kstar + self.compute_Kij(self.X, Xstar, self.n, n, noise=True)
-            if self.T is not None:
-                Kstar = self.T.dot(Kstar)
-            mean = Kstar.T.dot(self.alpha)
+                Kstar = Kstar + self.compute_Kij(X, Xstar, n_train, n, noise=True)
+            if T is not None:
+                Kstar = T.dot(Kstar)
+            mean = Kstar.T.dot(alpha)
             if self.mu is not None:
                 mean_func = scipy.atleast_2d(self.mu(Xstar, n)).T
                 mean += mean_func
@@ -969,14 +1424,23 @@ class GaussianProcess(object):
             mean = mean.ravel()
             if return_mean_func and self.mu is not None:
                 mean_func = mean_func.ravel()
-            if return_std or return_cov or full_output or full_MC:
-                v = scipy.linalg.solve_triangular(self.L, Kstar, lower=True)
+            if (return_std and not (return_cov or full_output or full_MC) and
+                    output_transform is None):
+                # Only the diagonal of the posterior covariance is needed, so
+                # neither Kstarstar nor v.T.dot(v) have to be formed:
+                v = scipy.linalg.solve_triangular(L, Kstar, lower=True)
+                var = self.compute_Kij_diag(Xstar, n) - (v**2).sum(axis=0)
+                if noise:
+                    var += self.compute_Kij_diag(Xstar, n, noise=True)
+                return (mean, scipy.sqrt(var))
+            elif return_std or return_cov or full_output or full_MC:
+                v = scipy.linalg.solve_triangular(L, Kstar, lower=True)
                 Kstarstar = self.compute_Kij(Xstar, None, n, None)
                 if noise:
                     Kstarstar = Kstarstar + self.compute_Kij(Xstar, None, n, None, noise=True)
                 covariance = Kstarstar - v.T.dot(v)
                 if output_transform is not None:
-                    covariance = output_transform.dot(covariance.dot(output_transform.T))
+                    covariance = _transform_symmetric(output_transform, covariance)
                 if return_samples or full_MC:
                     samps = self.draw_sample(
                         Xstar, n=n, num_samp=num_samples, mean=mean,
@@ -1023,6 +1487,66 @@ class GaussianProcess(object):
             else:
                 return mean
     
+    def loo_predict(self):
+        r"""Compute the leave-one-out predictions at each of the training points.
+        
+        Uses the closed-form expressions from section 5.4.2 of R&W, so only the
+        existing Cholesky factor :py:attr:`L` and :py:attr:`alpha` are needed
+        (no kernel evaluations):
+        
+        .. math::
+        
+            \mu_{-i} = y_i - \frac{\alpha_i}{[K^{-1}]_{ii}},\quad
+            \sigma^2_{-i} = \frac{1}{[K^{-1}]_{ii}}
+        
+        where :math:`K` is the total covariance matrix of the observations
+        (including the noise). Note that the hyperparameters are not refit with
+        each point left out.
+        
+        Returns
+        -------
+        mean : array, (`M`,)
+            The mean of each observation in :py:attr:`y` predicted from all of
+            the others.
+        var : array, (`M`,)
+            The corresponding predictive variances. These include the noise,
+            since they are for the observations themselves.
+        lpd : array, (`M`,)
+            The log predictive density of each observation given all of the
+            others. The sum of these is the leave-one-out log predictive
+            density (pseudo-likelihood) of the model.
+        """
+        self.compute_K_L_alpha_ll()
+        L_inv = scipy.linalg.solve_triangular(
+            self.L, scipy.eye(len(self.y), dtype=self.L.dtype), lower=True
+        )
+        K_inv_diag = (L_inv**2).sum(axis=0)
+        alpha = self.alpha.ravel()
+        var = 1.0 / K_inv_diag
+        mean = self.y - alpha * var
+        lpd = (
+            -0.5 * scipy.log(2.0 * scipy.pi * var) -
+            0.5 * alpha**2 * var
+        )
+        return (mean, var, lpd)
+    
+    def freeze(self):
+        """Make an immutable predictor from the GP at the current hyperparameters.
+        
+        The factorization is computed if it is not up to date, then copies of
+        the quantities needed for prediction are stored in a
+        :py:class:`FrozenGaussianProcess`. Subsequent changes to this GP do not
+        affect the frozen predictor.
+        
+        Returns
+        -------
+        frozen : :py:class:`FrozenGaussianProcess`
+            The frozen predictor.
+        """
+        with self._lock:
+            self.compute_K_L_alpha_ll()
+            return FrozenGaussianProcess(self)
+    
     def plot(self, X=None, n=0, ax=None, envelopes=[1, 3], base_alpha=0.375,
              return_prediction=False, return_std=True, full_output=False,
              plot_kwargs={}, **kwargs):
@@ -1319,6 +1843,29 @@ class GaussianProcess(object):
             raise ValueError("method %s not recognized!" % (method,))
         return scipy.atleast_2d(mean).T + L.dot(rand_vars[:num_eig, :])
     
+    def posterior_sampler(self, Xstar, n=0, **kwargs):
+        """Make a :py:class:`PosteriorSampler` which draws samples at the given points `Xstar`.
+        
+        The factorization needed to draw the samples is computed once, so this
+        is much faster than repeated calls to :py:meth:`draw_sample`.
+        
+        Parameters
+        ----------
+        Xstar : array, (`M`, `D`)
+            `M` test input values of dimension `D`.
+        n : array, (`M`, `D`) or scalar, non-negative int, optional
+            Derivative order to evaluate at. Default is 0 (evaluate value).
+        **kwargs : optional kwargs
+            All extra keyword arguments are passed to
+            :py:class:`PosteriorSampler`.
+        
+        Returns
+        -------
+        sampler : :py:class:`PosteriorSampler`
+            The sampler.
+        """
+        return PosteriorSampler(self, Xstar, n=n, **kwargs)
+    
     def update_hyperparameters(self, new_params, hyper_deriv_handling='default', exit_on_bounds=True, inf_on_error=True):
         r"""Update the kernel's hyperparameters to the new parameters.
         
@@ -1409,53 +1956,86 @@ class GaussianProcess(object):
         
         Computes `K` and the noise portion of `K` using :py:meth:`compute_Kij`,
         computes `L` using :py:func:`scipy.linalg.cholesky`, then computes
-        `alpha` as `L.T\\(L\\y)`.
+        `alpha` as `L.T\\(L\\y)`. The total covariance matrix is assembled in
+        a single buffer, with the diagonal noise contributions added in place,
+        and is then overwritten by the Cholesky factorization.
         
         Only does the computation if :py:attr:`K_up_to_date` is False --
-        otherwise leaves the existing values.
+        otherwise leaves the existing values. If :py:attr:`factor_cache_bytes`
+        is set, previously computed results for the current hyperparameters are
+        taken from the cache when available.
+        
+        The computation is done while holding the instance's lock, so it is
+        safe to call from several threads.
+        """
+        with self._lock:
+            self._compute_K_L_alpha_ll()
+    
+    def _compute_K_L_alpha_ll(self, load_cached=True):
+        """Implementation of :py:meth:`compute_K_L_alpha_ll`, called with the lock held.
+        
+        Parameters
+        ----------
+        load_cached : bool, optional
+            If False, the cache of factorizations is not searched (and no miss
+            is counted). Default is True.
         """
+        if not self.K_up_to_date and load_cached and self._load_cached_factorization():
+            return
         if not self.K_up_to_date:
             y = self.y
-            err_y = self.err_y
-            self.K = self.compute_Kij(self.X, None, self.n, None, noise=False)
-            # If the noise kernel is meant to be strictly diagonal, it should
-            # yield a diagonal noise_K:
+            self.K = self._compute_K_training(self.k)
+            # If the noise kernel is meant to be strictly diagonal, only the
+            # diagonal of noise_K is stored:
             if isinstance(self.noise_k, ZeroKernel):
-                self.noise_K = scipy.zeros((self.X.shape[0], self.X.shape[0]))
+                self._noise_K = scipy.zeros(self.X.shape[0], dtype=self.dtype)
             elif isinstance(self.noise_k, DiagonalNoiseKernel):
-                self.noise_K = self.noise_k.params[0]**2.0 * scipy.eye(self.X.shape[0])
+                self._noise_K = scipy.full(
+                    self.X.shape[0], self.noise_k.params[0]**2.0, dtype=self.dtype
+                )
             else:
-                self.noise_K = self.compute_Kij(self.X, None, self.n, None, noise=True)
+                self._noise_K = self._compute_K_training(self.noise_k)
             
-            K = self.K
-            noise_K = self.noise_K
-            if self.T is not None:
-                KnK = self.T.dot(K + noise_K).dot(self.T.T)
+            if isinstance(self.noise_k, ZeroKernel):
+                K_tot = self.K if self.T is not None else self.K.copy()
+            elif self._noise_K.ndim == 1:
+                K_tot = self.K.copy()
+                _add_to_diag(K_tot, self._noise_K)
             else:
-                KnK = K + noise_K
-            K_tot = (
-                KnK +
-                scipy.diag(err_y**2.0) +
-                self.diag_factor * sys.float_info.epsilon * scipy.eye(len(y))
+                K_tot = self.K + self._noise_K
+            if self.T is not None:
+                K_tot = _transform_symmetric(self.T, K_tot)
+            K_tot = K_tot.astype(self.dtype, copy=False)
+            _add_to_diag(
+                K_tot,
+                self.err_y**2.0 + self.diag_factor * numpy.finfo(self.dtype).eps
             )
-            self.L = scipy.linalg.cholesky(K_tot, lower=True)
-            # Need to make the mean-subtracted y that appears in the expression
-            # for alpha:
-            if self.mu is not None:
-                mu_alph = self.mu(self.X, self.n)
-                if self.T is not None:
-                    mu_alph = self.T.dot(mu_alph)
-                y_alph = self.y - mu_alph
-            else:
-                y_alph = self.y
-            self.alpha = scipy.linalg.cho_solve((self.L, True), scipy.atleast_2d(y_alph).T)
-            self.ll = (
-                -0.5 * scipy.atleast_2d(y_alph).dot(self.alpha) -
-                scipy.log(scipy.diag(self.L)).sum() - 
-                0.5 * len(y) * scipy.log(2.0 * scipy.pi)
-            )[0, 0]
-            # Apply hyperpriors:
-            self.ll += self.hyperprior(self.params)
+            # K_tot is only needed after the factorization to refine alpha:
+            overwrite = not (self.high_precision_ll and self.dtype != float)
+            try:
+                # K_tot is symmetric, so its transpose is a Fortran-ordered
+                # view which LAPACK can factor in place:
+                self.L = scipy.linalg.cholesky(K_tot.T, lower=True, overwrite_a=overwrite)
+            except numpy.linalg.LinAlgError:
+                if self.dtype == float:
+                    raise
+                # Redo the whole computation in double precision, which may
+                # rescue a covariance matrix which is only numerically
+                # indefinite in the lower precision:
+                if self.verbose:
+                    warnings.warn(
+                        "Cholesky decomposition failed in %s, retrying in "
+                        "double precision." % (self.dtype,)
+                    )
+                dtype = self.dtype
+                self.dtype = scipy.dtype(float)
+                try:
+                    # The cache was already searched for this state:
+                    self._compute_K_L_alpha_ll(load_cached=False)
+                finally:
+                    self.dtype = dtype
+                return
+            self._compute_alpha_ll(K_tot)
             
             if self.use_hyper_deriv:
                 warnings.warn("Use of hyperparameter derivatives is experimental!")
@@ -1463,17 +2043,25 @@ class GaussianProcess(object):
                 # Only compute for the free parameters, since that is what we
                 # want to optimize:
                 self.ll_deriv = scipy.zeros(len(self.free_params))
+                # Form W = alpha alpha^T - K^{-1} once, and express it in terms
+                # of the training points so the kernel derivatives never need
+                # to be transformed:
+                W = (
+                    self.alpha.dot(self.alpha.T) -
+                    scipy.linalg.cho_solve((self.L, True), scipy.eye(len(y), dtype=self.L.dtype))
+                ).astype(float)
+                if self.T is not None:
+                    W = _transform_symmetric(self.T.T, W)
                 # Combine the kernel and noise kernel so we only need one loop:
                 if isinstance(self.noise_k, ZeroKernel):
                     knk = self.k
                 elif isinstance(self.noise_k, DiagonalNoiseKernel):
                     knk = self.k
-                    # Handle DiagonalNoiseKernel specially:
+                    # Handle DiagonalNoiseKernel specially, since its derivative
+                    # is proportional to the identity:
                     if not self.noise_k.fixed_params[0]:
-                        dK_dtheta_i = 2.0 * self.noise_k.params[0] * scipy.eye(len(y))
-                        self.ll_deriv[len(self.k.free_params)] = 0.5 * (
-                            self.alpha.T.dot(dK_dtheta_i.dot(self.alpha)) -
-                            scipy.trace(scipy.linalg.cho_solve((self.L, True), dK_dtheta_i))
+                        self.ll_deriv[len(self.k.free_params)] = (
+                            self.noise_k.params[0] * scipy.trace(W)
                         )
                 else:
                     knk = self.k + self.noise_k
@@ -1481,16 +2069,9 @@ class GaussianProcess(object):
                 # Get the indices of the free params in knk.params:
                 free_param_idxs = scipy.arange(0, len(knk.params), dtype=int)[~knk.fixed_params]
                 # Handle the kernel and noise kernel:
-                for i, pi in enumerate(free_param_idxs):
-                    dK_dtheta_i = self.compute_Kij(
-                        self.X, None, self.n, None, k=knk, hyper_deriv=pi
-                    )
-                    if self.T is not None:
-                        dK_dtheta_i = self.T.dot(dK_dtheta_i).dot(self.T.T)
-                    self.ll_deriv[i] = 0.5 * (
-                        self.alpha.T.dot(dK_dtheta_i.dot(self.alpha)) -
-                        scipy.trace(scipy.linalg.cho_solve((self.L, True), dK_dtheta_i))
-                    )
+                self.ll_deriv[:len(free_param_idxs)] = self._compute_ll_deriv_kernel(
+                    knk, free_param_idxs, W
+                )
                 
                 # Handle the mean function:
                 if self.mu is not None:
@@ -1500,7 +2081,9 @@ class GaussianProcess(object):
                         dmu_dtheta_i = scipy.atleast_2d(self.mu(self.X, self.n, hyper_deriv=pi)).T
                         if self.T is not None:
                             dmu_dtheta_i = self.T.dot(dmu_dtheta_i)
-                        self.ll_deriv[i + len(knk.free_params)] = dmu_dtheta_i.T.dot(self.alpha)
+                        self.ll_deriv[
+                            i + len(self.k.free_params) + len(self.noise_k.free_params)
+                        ] = dmu_dtheta_i.T.dot(self.alpha)[0, 0]
                 
                 # Handle the hyperprior:
                 # Get the indices of the free params in self.params:
@@ -1509,6 +2092,207 @@ class GaussianProcess(object):
                     self.ll_deriv[i] += self.hyperprior(self.params, hyper_deriv=pi)
             
             self.K_up_to_date = True
+            self._store_cached_factorization()
+    
+    def _compute_alpha_ll(self, K_tot):
+        """Compute :py:attr:`alpha` and :py:attr:`ll` from the Cholesky factor :py:attr:`L`.
+        
+        If :py:attr:`high_precision_ll` is True only :py:attr:`alpha` is refined,
+        the log-determinant is always taken from the diagonal of :py:attr:`L`.
+        
+        Parameters
+        ----------
+        K_tot : array, (`M`, `M`)
+            The total covariance matrix which was factored to get :py:attr:`L`.
+            Only used if :py:attr:`high_precision_ll` is True and :py:attr:`L`
+            is not double precision.
+        """
+        # Need to make the mean-subtracted y that appears in the expression
+        # for alpha:
+        if self.mu is not None:
+            mu_alph = self.mu(self.X, self.n)
+            if self.T is not None:
+                mu_alph = self.T.dot(mu_alph)
+            y_alph = self.y - mu_alph
+        else:
+            y_alph = self.y
+        self.alpha = scipy.linalg.cho_solve((self.L, True), scipy.atleast_2d(y_alph).T)
+        if self.high_precision_ll and self.L.dtype != float:
+            self.alpha = self._refine_alpha(K_tot, scipy.atleast_2d(y_alph).T)
+        self.ll = (
+            -0.5 * scipy.atleast_2d(y_alph).dot(self.alpha) -
+            scipy.log(scipy.diag(self.L).astype(float)).sum() - 
+            0.5 * len(self.y) * scipy.log(2.0 * scipy.pi)
+        )[0, 0]
+        # Apply hyperpriors:
+        self.ll += self.hyperprior(self.params)
+    
+    def _append_to_factorization(self, num_new):
+        r"""Extend the current factorization to include the last `num_new` training points.
+        
+        With the total covariance matrix partitioned into the old and new
+        points, the Cholesky factor is extended with a block append:
+        
+        .. math::
+        
+            L = \begin{bmatrix} L_{11} & 0 \\ L_{21} & L_{22} \end{bmatrix},
+            \quad L_{21} = (L_{11}^{-1}K_{12})^T,
+            \quad L_{22}L_{22}^T = K_{22} - L_{21}L_{21}^T
+        
+        so only the covariances involving the new points are evaluated and the
+        cost is :math:`O(N^2 M)` rather than :math:`O(N^3)`. :py:attr:`alpha`
+        and :py:attr:`ll` are then recomputed from the new factor.
+        
+        Parameters
+        ----------
+        num_new : positive int
+            The number of points which have been appended to :py:attr:`X`,
+            :py:attr:`y`, :py:attr:`err_y` and :py:attr:`n` since the
+            factorization was computed.
+        
+        Returns
+        -------
+        success : bool
+            True if the factorization was extended, False if the Schur
+            complement was not positive definite (in which case nothing is
+            modified).
+        """
+        num_old = len(self.y) - num_new
+        X_old = self.X[:num_old, :]
+        n_old = self.n[:num_old, :]
+        X_new = self.X[num_old:, :]
+        n_new = self.n[num_old:, :]
+        
+        K12 = self.compute_Kij(X_old, X_new, n_old, n_new)
+        K22 = self.compute_Kij(X_new, None, n_new, None)
+        if isinstance(self.noise_k, ZeroKernel):
+            noise_K22 = scipy.zeros(num_new, dtype=self.dtype)
+        elif isinstance(self.noise_k, DiagonalNoiseKernel):
+            noise_K22 = scipy.full(num_new, self.noise_k.params[0]**2.0, dtype=self.dtype)
+        else:
+            noise_K12 = self.compute_Kij(X_old, X_new, n_old, n_new, noise=True)
+            noise_K22 = self.compute_Kij(X_new, None, n_new, None, noise=True)
+        
+        if noise_K22.ndim == 1:
+            L21 = scipy.linalg.solve_triangular(self.L, K12, lower=True).T
+            S = K22.copy()
+            _add_to_diag(S, noise_K22)
+        else:
+            L21 = scipy.linalg.solve_triangular(self.L, K12 + noise_K12, lower=True).T
+            S = K22 + noise_K22
+        _add_to_diag(
+            S,
+            self.err_y[num_old:]**2.0 + self.diag_factor * numpy.finfo(self.L.dtype).eps
+        )
+        S -= L21.dot(L21.T)
+        S = S.astype(self.L.dtype, copy=False)
+        try:
+            L22 = scipy.linalg.cholesky(S.T, lower=True, overwrite_a=True)
+        except numpy.linalg.LinAlgError:
+            return False
+        
+        L = scipy.zeros((len(self.y), len(self.y)), dtype=self.L.dtype)
+        L[:num_old, :num_old] = self.L
+        L[num_old:, :num_old] = L21
+        L[num_old:, num_old:] = L22
+        self.L = L
+        self.K = scipy.vstack((scipy.hstack((self.K, K12)), scipy.hstack((K12.T, K22))))
+        if noise_K22.ndim == 1:
+            self._noise_K = scipy.append(self._noise_K, noise_K22)
+        else:
+            self._noise_K = scipy.vstack(
+                (scipy.hstack((self._noise_K, noise_K12)), scipy.hstack((noise_K12.T, noise_K22)))
+            )
+        self._compute_alpha_ll(None)
+        return True
+    
+    def _refine_alpha(self, K_tot, y, num_iter=3):
+        r"""Refine the solution :math:`\alpha` to :math:`K\alpha = y` in double precision.
+        
+        Uses iterative refinement: the residual is computed in double precision
+        and the correction is found with the (lower precision) Cholesky factor
+        :py:attr:`L`.
+        
+        Parameters
+        ----------
+        K_tot : array, (`M`, `M`)
+            The total covariance matrix which was factored to get :py:attr:`L`.
+        y : array, (`M`, 1)
+            The (mean-subtracted) targets.
+        num_iter : int, optional
+            The number of refinement steps to perform. Default is 3.
+        
+        Returns
+        -------
+        alpha : array of float, (`M`, 1)
+            The refined solution.
+        """
+        K_tot = K_tot.astype(float, copy=False)
+        alpha = self.alpha.astype(float)
+        for i in xrange(0, num_iter):
+            r = y - K_tot.dot(alpha)
+            alpha += scipy.linalg.cho_solve((self.L, True), r).astype(float, copy=False)
+        return alpha
+    
+    def _factor_cache_key(self):
+        """Get the key for the current state in the cache of factorizations.
+        """
+        return (tuple(self.params), self.use_hyper_deriv)
+    
+    def _load_cached_factorization(self):
+        """Restore the state computed by :py:meth:`compute_K_L_alpha_ll` from the cache.
+        
+        Returns
+        -------
+        found : bool
+            True if the current hyperparameters were found in the cache, in
+            which case the state has been restored and :py:attr:`K_up_to_date`
+            set to True.
+        """
+        if self.factor_cache_bytes is None:
+            return False
+        key = self._factor_cache_key()
+        try:
+            entry = self._factor_cache.pop(key)
+        except KeyError:
+            self.factor_cache_misses += 1
+            return False
+        # Re-insert to mark as most recently used:
+        self._factor_cache[key] = entry
+        self.factor_cache_hits += 1
+        self.K, self._noise_K, self.L, self.alpha, self.ll, ll_deriv = entry
+        if ll_deriv is not None:
+            self.ll_deriv = ll_deriv
+        self.K_up_to_date = True
+        return True
+    
+    def _store_cached_factorization(self):
+        """Put the state computed by :py:meth:`compute_K_L_alpha_ll` into the cache.
+        
+        The least recently used entries are discarded until the cache fits in
+        :py:attr:`factor_cache_bytes`. States which are too large to fit on
+        their own are not stored.
+        """
+        if self.factor_cache_bytes is None:
+            return
+        ll_deriv = self.ll_deriv.copy() if self.use_hyper_deriv else None
+        entry = (self.K, self._noise_K, self.L, self.alpha, self.ll, ll_deriv)
+        nbytes = sum(a.nbytes for a in entry if isinstance(a, scipy.ndarray))
+        if nbytes > self.factor_cache_bytes:
+            return
+        key = self._factor_cache_key()
+        old_entry = self._factor_cache.pop(key, None)
+        if old_entry is not None:
+            self._factor_cache_nbytes -= sum(
+                a.nbytes for a in old_entry if isinstance(a, scipy.ndarray)
+            )
+        while self._factor_cache and self._factor_cache_nbytes + nbytes > self.factor_cache_bytes:
+            _, old_entry = self._factor_cache.popitem(last=False)
+            self._factor_cache_nbytes -= sum(
+                a.nbytes for a in old_entry if isinstance(a, scipy.ndarray)
+            )
+        self._factor_cache[key] = entry
+        self._factor_cache_nbytes += nbytes
     
     @property
     def num_dim(self):
@@ -1529,7 +2313,13 @@ class GaussianProcess(object):
         indicate whether noise is to be included (i.e., for evaluation of
         :math:`K+\sigma I` versus :math:`K_*`).
         
-        If `Xj` is None, the symmetric matrix :math:`K(X, X)` is formed.
+        If `Xj` is None, the symmetric matrix :math:`K(X, X)` is formed. Only
+        its upper triangle is evaluated.
+        
+        If :py:attr:`max_bytes` is not None, the matrix is assembled in blocks
+        to bound the memory used by the intermediate arrays.
+        
+        The result is stored with type :py:attr:`dtype`.
         
         Note that type and dimension checking is NOT performed, as it is assumed
         the data are from inside the instance and have hence been sanitized by
@@ -1573,42 +2363,397 @@ class GaussianProcess(object):
         else:
             symmetric = False
         
-        # TODO: This technically doesn't take advantage of the symmetric case.
-        # Might be worth trying to do that at some point, but this is vastly
-        # superior to the double for loop implementation for which using
-        # symmetry is easy.
-        Xi_tile = scipy.repeat(Xi, Xj.shape[0], axis=0)
-        ni_tile = scipy.repeat(ni, Xj.shape[0], axis=0)
-        Xj_tile = scipy.tile(Xj, (Xi.shape[0], 1))
-        nj_tile = scipy.tile(nj, (Xi.shape[0], 1))
-        Kij = k(
-            Xi_tile,
-            Xj_tile,
-            ni_tile,
-            nj_tile,
-            hyper_deriv=hyper_deriv,
-            symmetric=symmetric
-        )
-        Kij = scipy.reshape(Kij, (Xi.shape[0], -1))
+        block_size = self._compute_block_size(Xi.shape[1])
+        if symmetric and block_size >= Xi.shape[0]:
+            return self._compute_Kij_symmetric(Xi, ni, hyper_deriv, k)
+        
+        # Split the matrix into blocks, which can be evaluated in parallel.
+        # Only the upper triangle of blocks is needed when symmetric:
+        if block_size >= max(Xi.shape[0], Xj.shape[0]):
+            # Only need to split the rows to spread the work across threads:
+            row_size = max(-(-Xi.shape[0] // self.num_threads), 1)
+            blocks = [
+                (i_start, min(i_start + row_size, Xi.shape[0]), 0, Xj.shape[0])
+                for i_start in xrange(0, Xi.shape[0], row_size)
+            ]
+        else:
+            # Assemble the matrix one block at a time so that only the inputs
+            # for a single block (per thread) are ever held in memory:
+            blocks = [
+                (i_start, min(i_start + block_size, Xi.shape[0]),
+                 j_start, min(j_start + block_size, Xj.shape[0]))
+                for i_start in xrange(0, Xi.shape[0], block_size)
+                for j_start in xrange(i_start if symmetric else 0, Xj.shape[0], block_size)
+            ]
+        
+        def eval_block(block):
+            i_start, i_stop, j_start, j_stop = block
+            if symmetric and j_start == i_start:
+                return self._compute_Kij_symmetric(
+                    Xi[i_start:i_stop, :], ni[i_start:i_stop, :], hyper_deriv,
+                    k, num_chunks=1
+                )
+            else:
+                return k.pairwise(
+                    Xi[i_start:i_stop, :],
+                    Xj[j_start:j_stop, :],
+                    ni[i_start:i_stop, :],
+                    nj[j_start:j_stop, :],
+                    hyper_deriv=hyper_deriv,
+                    symmetric=symmetric
+                )
+        
+        if len(blocks) == 1:
+            return eval_block(blocks[0]).astype(self.dtype, copy=False)
+        
+        Kij = scipy.zeros((Xi.shape[0], Xj.shape[0]), dtype=self.dtype)
+        for (i_start, i_stop, j_start, j_stop), Kij_block in zip(
+                blocks, self._map_threads(eval_block, blocks)):
+            Kij[i_start:i_stop, j_start:j_stop] = Kij_block
+            if symmetric and j_start != i_start:
+                Kij[j_start:j_stop, i_start:i_stop] = Kij_block.T
         
         return Kij
     
-    def compute_ll_matrix(self, bounds, num_pts):
-        """Compute the log likelihood over the (free) parameter space.
+    def compute_Kij_diag(self, X, n, noise=False, k=None):
+        r"""Compute the diagonal of the covariance matrix :math:`K(X, X)`.
+        
+        Only the `M` covariances of each point with itself are evaluated, so
+        the cost is :math:`O(M)` instead of :math:`O(M^2)`.
         
         Parameters
         ----------
-        bounds : 2-tuple or list of 2-tuples with length equal to the number of free parameters
-            Bounds on the range to use for each of the parameters. If a single
-            2-tuple is given, it will be used for each of the parameters.
-        num_pts : int or list of ints with length equal to the number of free parameters
-            If a single int is given, it will be used for each of the parameters.
+        X : array, (`M`, `D`)
+            `M` input values of dimension `D`.
+        n : array, (`M`, `D`), non-negative integers
+            `M` derivative orders with respect to the `X` coordinates.
+        noise : bool, optional
+            If True, uses the noise kernel, otherwise uses the regular kernel.
+            Default is False (use regular kernel).
+        k : :py:class:`~gptools.kernel.core.Kernel` instance, optional
+            The covariance kernel to used. Overrides `noise` if present.
         
         Returns
         -------
-            ll_vals : :py:class:`Array`
-                The log likelihood for each of the parameter possibilities.
-            param_vals : List of :py:class:`Array`
+        Kii : array, (`M`,)
+            The variance at each point in `X`.
+        """
+        if k is None:
+            if not noise:
+                k = self.k
+            else:
+                k = self.noise_k
+        return scipy.asarray(k(X, X, n, n, symmetric=True), dtype=self.dtype).ravel()
+    
+    def _compute_Kij_symmetric(self, X, n, hyper_deriv, k, geometry=None, num_chunks=None):
+        """Compute the symmetric covariance matrix :math:`K(X, X)`.
+        
+        Only the upper triangle (including the diagonal) is evaluated, then it
+        is mirrored. This holds for derivative observations as well, since
+        element (j, i) is the covariance between the same two quantities as
+        element (i, j).
+        
+        Parameters
+        ----------
+        X : array, (`M`, `D`)
+            `M` input values of dimension `D`.
+        n : array, (`M`, `D`), non-negative integers
+            `M` derivative orders with respect to the `X` coordinates.
+        hyper_deriv : None or non-negative int
+            Index of the hyperparameter to compute the first derivative with
+            respect to. If None, no derivatives are taken.
+        k : :py:class:`~gptools.kernel.core.Kernel` instance
+            The covariance kernel to use.
+        geometry : tuple, optional
+            The output of :py:meth:`_compute_symmetric_geometry` for `X`, `n`.
+            If None (the default), it is computed.
+        num_chunks : positive int, optional
+            The number of chunks to split the upper triangle into when
+            computing `geometry`. Default is :py:attr:`num_threads`.
+        
+        Returns
+        -------
+        K : array, (`M`, `M`)
+            Covariance matrix between `X` and itself.
+        """
+        if geometry is None:
+            geometry = self._compute_symmetric_geometry(X, n, num_chunks=num_chunks)
+        triu_i, triu_j, chunks = geometry
+        K_triu = scipy.zeros(len(triu_i), dtype=self.dtype)
+        for (start, stop, groups), K_chunk in zip(
+                chunks,
+                self._map_threads(
+                    lambda chunk: k.eval_geometry(
+                        self._chunk_geometry(X, n, triu_i, triu_j, chunk),
+                        hyper_deriv=hyper_deriv,
+                        symmetric=True
+                    ),
+                    chunks
+                )):
+            K_triu[start:stop] = K_chunk
+        K = scipy.zeros((X.shape[0], X.shape[0]), dtype=self.dtype)
+        K[triu_i, triu_j] = K_triu
+        K[triu_j, triu_i] = K_triu
+        return K
+    
+    def _compute_symmetric_geometry(self, X, n, num_chunks=None):
+        """Set up the pairs of points in the upper triangle of :math:`K(X, X)`.
+        
+        Parameters
+        ----------
+        X : array, (`M`, `D`)
+            `M` input values of dimension `D`.
+        n : array, (`M`, `D`), non-negative integers
+            `M` derivative orders with respect to the `X` coordinates.
+        num_chunks : positive int, optional
+            The number of chunks to split the pairs into so that they can be
+            evaluated in parallel. Default is :py:attr:`num_threads`.
+        
+        Returns
+        -------
+        triu_i, triu_j : arrays of int
+            The row and column indices of the upper triangle.
+        chunks : list of tuples
+            Each entry is (`start`, `stop`, `groups`) for the pairs `start` to
+            `stop` of the upper triangle, which are gathered when they are
+            needed with :py:meth:`_chunk_geometry`. `groups` is None here,
+            :py:meth:`_training_geometry` fills in the
+            :py:attr:`~gptools.kernel.core.PairGeometry.combined_groups` of the
+            chunk.
+        """
+        if num_chunks is None:
+            num_chunks = self.num_threads
+        triu_i, triu_j = scipy.triu_indices(X.shape[0])
+        chunk_size = max(-(-len(triu_i) // num_chunks), 1)
+        chunks = []
+        for start in xrange(0, len(triu_i), chunk_size):
+            stop = min(start + chunk_size, len(triu_i))
+            chunks.append((start, stop, None))
+        return (triu_i, triu_j, chunks)
+    
+    def _chunk_geometry(self, X, n, triu_i, triu_j, chunk):
+        """Gather the pairs of one chunk from :py:meth:`_compute_symmetric_geometry`.
+        
+        Parameters
+        ----------
+        X : array, (`M`, `D`)
+            `M` input values of dimension `D`.
+        n : array, (`M`, `D`), non-negative integers
+            `M` derivative orders with respect to the `X` coordinates.
+        triu_i, triu_j : arrays of int
+            The row and column indices of the upper triangle.
+        chunk : tuple
+            The (`start`, `stop`, `groups`) entry for the chunk. If `groups` is
+            None it is computed when it is needed.
+        
+        Returns
+        -------
+        geom : :py:class:`~gptools.kernel.core.PairGeometry`
+            The pairs `start` to `stop` of the upper triangle.
+        """
+        start, stop, groups = chunk
+        return PairGeometry(
+            X[triu_i[start:stop], :],
+            X[triu_j[start:stop], :],
+            n[triu_i[start:stop], :],
+            n[triu_j[start:stop], :],
+            combined_groups=groups
+        )
+    
+    def _compute_K_training(self, k, hyper_deriv=None):
+        """Compute the covariance matrix between the training points.
+        
+        The hyperparameter-independent geometry of the training points (the
+        indices of the pairs in the upper triangle and their grouping by
+        derivative order) is cached on first use and reused until the training
+        data change, since this is called for every evaluation of the
+        log-posterior. The pairs themselves are gathered for each evaluation,
+        so only index arrays are held. The cache is not used when :py:attr:`max_bytes` is set,
+        since holding it would defeat the memory budget.
+        
+        Parameters
+        ----------
+        k : :py:class:`~gptools.kernel.core.Kernel` instance
+            The covariance kernel to use.
+        hyper_deriv : None or non-negative int, optional
+            Index of the hyperparameter to compute the first derivative with
+            respect to. If None, no derivatives are taken. Default is None (no
+            hyperparameter derivatives).
+        
+        Returns
+        -------
+        K : array, (`N`, `N`)
+            Covariance matrix between the training points.
+        """
+        if self.max_bytes is not None:
+            return self.compute_Kij(self.X, None, self.n, None, hyper_deriv=hyper_deriv, k=k)
+        return self._compute_Kij_symmetric(
+            self.X, self.n, hyper_deriv, k, geometry=self._training_geometry()
+        )
+    
+    def _training_geometry(self):
+        """Get the cached output of :py:meth:`_compute_symmetric_geometry` for the training points.
+        
+        The grouping of the pairs of each chunk by derivative order is filled
+        in, so it is not recomputed for every evaluation.
+        """
+        # The geometry is split for the number of threads, so it must be
+        # rebuilt if that has changed:
+        if self._K_geometry is None or self._K_geometry[0] != self.num_threads:
+            triu_i, triu_j, chunks = self._compute_symmetric_geometry(self.X, self.n)
+            # Only the grouping by derivative order is kept for each chunk:
+            chunks = [
+                (
+                    start,
+                    stop,
+                    self._chunk_geometry(
+                        self.X, self.n, triu_i, triu_j, (start, stop, groups)
+                    ).combined_groups
+                )
+                for start, stop, groups in chunks
+            ]
+            self._K_geometry = (self.num_threads, (triu_i, triu_j, chunks))
+        return self._K_geometry[1]
+    
+    def _compute_ll_deriv_kernel(self, k, hyper_derivs, W):
+        r"""Compute the kernel part of the gradient of the log-likelihood.
+        
+        With :math:`W=\alpha\alpha^T-K^{-1}` (expressed in terms of the
+        training points, i.e., with any transformation already applied), the
+        derivative with respect to :math:`\theta_i` is
+        :math:`\frac{1}{2}\sum W\circ\partial K/\partial\theta_i`. Both
+        matrices are symmetric, so only the upper triangle of the derivatives
+        is evaluated, with the off-diagonal elements weighted twice. All of
+        the derivatives are evaluated in a single pass over the cached
+        training geometry.
+        
+        Parameters
+        ----------
+        k : :py:class:`~gptools.kernel.core.Kernel` instance
+            The covariance kernel to use.
+        hyper_derivs : array of int
+            The indices of the hyperparameters of `k` to differentiate with
+            respect to.
+        W : array, (`N`, `N`)
+            The matrix :math:`\alpha\alpha^T-K^{-1}`.
+        
+        Returns
+        -------
+        ll_deriv : array, (`len(hyper_derivs)`,)
+            The derivatives of the log-likelihood.
+        """
+        if self.max_bytes is not None:
+            return scipy.asarray([
+                0.5 * (W * self._compute_K_training(k, hyper_deriv=pi)).sum()
+                for pi in hyper_derivs
+            ])
+        triu_i, triu_j, chunks = self._training_geometry()
+        w = W[triu_i, triu_j]
+        w[triu_i == triu_j] *= 0.5
+        ll_deriv = scipy.zeros(len(hyper_derivs))
+        for (start, stop, groups), dK_chunk in zip(
+                chunks,
+                self._map_threads(
+                    lambda chunk: k.eval_geometry_hyper_derivs(
+                        self._chunk_geometry(self.X, self.n, triu_i, triu_j, chunk),
+                        hyper_derivs,
+                        symmetric=True
+                    ),
+                    chunks
+                )):
+            ll_deriv += scipy.asarray(dK_chunk).dot(w[start:stop])
+        return ll_deriv
+    
+    def _map_threads(self, fun, tasks):
+        """Apply `fun` to each of `tasks`, using :py:attr:`num_threads` threads.
+        
+        Threads (rather than processes) are used since the kernels spend most
+        of their time in NumPy and compiled code which releases the GIL, and
+        this avoids having to pickle the kernel. The threads are kept between
+        calls, see :py:meth:`_get_thread_pool`.
+        
+        Parameters
+        ----------
+        fun : callable
+            The function to apply.
+        tasks : list
+            The arguments to apply `fun` to.
+        
+        Returns
+        -------
+        results : list
+            The result of `fun` for each element of `tasks`, in order.
+        """
+        if self.num_threads > 1 and len(tasks) > 1:
+            return self._get_thread_pool().map(fun, tasks)
+        else:
+            return [fun(t) for t in tasks]
+    
+    def _get_thread_pool(self):
+        """Get the pool of :py:attr:`num_threads` threads, starting it if necessary.
+        
+        The pool is created on first use and reused until :py:attr:`num_threads`
+        changes, so the threads are not restarted for every evaluation of the
+        log-posterior. It is closed when the instance is garbage collected, and
+        is not copied or pickled.
+        
+        Returns
+        -------
+        pool : :py:class:`multiprocessing.pool.ThreadPool`
+            The pool.
+        """
+        with self._lock:
+            if self._thread_pool is None or self._thread_pool[0] != self.num_threads:
+                if self._thread_pool is not None:
+                    # Run the finalizer to close the old pool:
+                    self._thread_pool[2]()
+                pool = multiprocessing.pool.ThreadPool(processes=self.num_threads)
+                self._thread_pool = (
+                    self.num_threads,
+                    pool,
+                    multiprocessing.util.Finalize(self, pool.close)
+                )
+            return self._thread_pool[1]
+    
+    def _compute_block_size(self, num_dim):
+        """Compute the number of rows/columns per block for the assembly of covariance matrices.
+        
+        The tiled evaluation of a (`B`, `B`) block holds four (`B` * `B`,
+        `num_dim`) arrays (the inputs and derivative orders) plus the output,
+        so `B` is chosen to keep these within :py:attr:`max_bytes`.
+        
+        Parameters
+        ----------
+        num_dim : int
+            Number of dimensions of the inputs.
+        
+        Returns
+        -------
+        block_size : int or float
+            Number of rows/columns per block. If :py:attr:`max_bytes` is None,
+            :py:data:`scipy.inf` is returned.
+        """
+        if self.max_bytes is None:
+            return scipy.inf
+        bytes_per_pair = 8 * (4 * num_dim + 1)
+        return max(int(scipy.sqrt(self.max_bytes / bytes_per_pair)), 1)
+    
+    def compute_ll_matrix(self, bounds, num_pts):
+        """Compute the log likelihood over the (free) parameter space.
+        
+        Parameters
+        ----------
+        bounds : 2-tuple or list of 2-tuples with length equal to the number of free parameters
+            Bounds on the range to use for each of the parameters. If a single
+            2-tuple is given, it will be used for each of the parameters.
+        num_pts : int or list of ints with length equal to the number of free parameters
+            If a single int is given, it will be used for each of the parameters.
+        
+        Returns
+        -------
+            ll_vals : :py:class:`Array`
+                The log likelihood for each of the parameter possibilities.
+            param_vals : List of :py:class:`Array`
                 The parameter values used.
         """
         present_free_params = self.free_params[:]
@@ -2242,6 +3387,375 @@ class GaussianProcess(object):
         
         return out
 
+class FrozenGaussianProcess(object):
+    """Immutable posterior predictor for a fitted :py:class:`GaussianProcess`.
+    
+    Holds copies of the training inputs, the Cholesky factor, `alpha`, the
+    kernels and the mean function, so it is cheap to pickle and can be shared
+    between threads. :py:meth:`mean`, :py:meth:`std` and :py:meth:`predict`
+    skip the argument checking done by :py:meth:`GaussianProcess.predict`.
+    Normally constructed with :py:meth:`GaussianProcess.freeze`.
+    
+    Parameters
+    ----------
+    gp : :py:class:`GaussianProcess` instance
+        The GP to freeze. Its factorization must be up to date.
+    
+    Raises
+    ------
+    ValueError
+        If the factorization of `gp` is not up to date.
+    """
+    def __init__(self, gp):
+        if not gp.K_up_to_date:
+            raise ValueError(
+                "The factorization must be up to date to freeze a GaussianProcess!"
+            )
+        state = {
+            'num_dim': gp.num_dim,
+            'k': copy.deepcopy(gp.k),
+            'noise_k': copy.deepcopy(gp.noise_k),
+            'mu': copy.deepcopy(gp.mu),
+            'X': scipy.array(gp.X, dtype=float),
+            'n': scipy.array(gp.n, dtype=int),
+            'T': copy.deepcopy(gp.T),
+            'L': scipy.array(gp.L),
+            'alpha': scipy.array(gp.alpha.ravel())
+        }
+        self.__setstate__(state)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenGaussianProcess instances are immutable!")
+    
+    def __delattr__(self, name):
+        raise AttributeError("FrozenGaussianProcess instances are immutable!")
+    
+    def __getstate__(self):
+        return self.__dict__.copy()
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in ['X', 'n', 'L', 'alpha']:
+            self.__dict__[name].flags.writeable = False
+    
+    def _process_inputs(self, Xstar, n):
+        """Convert `Xstar` to a 2d array and broadcast `n` to its shape.
+        """
+        Xstar = scipy.atleast_2d(scipy.asarray(Xstar, dtype=float))
+        if self.num_dim == 1 and Xstar.shape[0] == 1:
+            Xstar = Xstar.T
+        n = scipy.asarray(n, dtype=int)
+        if n.ndim > 0:
+            n = scipy.atleast_2d(n)
+            if self.num_dim == 1 and n.shape[0] == 1:
+                n = n.T
+        return Xstar, scipy.ascontiguousarray(scipy.broadcast_to(n, Xstar.shape))
+    
+    def _compute_Kstar(self, Xstar, n):
+        """Compute the covariance between the training data and `Xstar`.
+        """
+        Kstar = self.k.pairwise(self.X, Xstar, self.n, n)
+        if self.T is not None:
+            Kstar = self.T.dot(Kstar)
+        return Kstar
+    
+    def _mean(self, Xstar, n, Kstar):
+        mean = Kstar.T.dot(self.alpha)
+        if self.mu is not None:
+            mean += scipy.asarray(self.mu(Xstar, n), dtype=float).ravel()
+        return mean
+    
+    def _std(self, Xstar, n, Kstar, noise):
+        v = scipy.linalg.solve_triangular(self.L, Kstar, lower=True)
+        var = (
+            scipy.asarray(self.k(Xstar, Xstar, n, n, symmetric=True), dtype=float).ravel() -
+            (v**2).sum(axis=0)
+        )
+        if noise:
+            var += scipy.asarray(
+                self.noise_k(Xstar, Xstar, n, n, symmetric=True), dtype=float
+            ).ravel()
+        return scipy.sqrt(var)
+    
+    def mean(self, Xstar, n=0):
+        """Compute the posterior mean at the inputs `Xstar`.
+        
+        Parameters
+        ----------
+        Xstar : array, (`M`, `D`)
+            `M` test input values of dimension `D`.
+        n : array, (`M`, `D`) or scalar, non-negative int, optional
+            Order of derivative to predict. Default is 0 (return base quantity).
+        
+        Returns
+        -------
+        mean : array, (`M`,)
+            Predicted mean.
+        """
+        Xstar, n = self._process_inputs(Xstar, n)
+        return self._mean(Xstar, n, self._compute_Kstar(Xstar, n))
+    
+    def std(self, Xstar, n=0, noise=False):
+        """Compute the posterior standard deviation at the inputs `Xstar`.
+        
+        Parameters
+        ----------
+        Xstar : array, (`M`, `D`)
+            `M` test input values of dimension `D`.
+        n : array, (`M`, `D`) or scalar, non-negative int, optional
+            Order of derivative to predict. Default is 0 (return base quantity).
+        noise : bool, optional
+            Whether or not noise should be included. Default is False.
+        
+        Returns
+        -------
+        std : array, (`M`,)
+            Predicted standard deviation.
+        """
+        Xstar, n = self._process_inputs(Xstar, n)
+        return self._std(Xstar, n, self._compute_Kstar(Xstar, n), noise)
+    
+    def predict(self, Xstar, n=0, noise=False):
+        """Compute the posterior mean and standard deviation at the inputs `Xstar`.
+        
+        The covariance with the training data is only computed once.
+        
+        Parameters
+        ----------
+        Xstar : array, (`M`, `D`)
+            `M` test input values of dimension `D`.
+        n : array, (`M`, `D`) or scalar, non-negative int, optional
+            Order of derivative to predict. Default is 0 (return base quantity).
+        noise : bool, optional
+            Whether or not noise should be included in the standard deviation.
+            Default is False.
+        
+        Returns
+        -------
+        mean : array, (`M`,)
+            Predicted mean.
+        std : array, (`M`,)
+            Predicted standard deviation.
+        """
+        Xstar, n = self._process_inputs(Xstar, n)
+        Kstar = self._compute_Kstar(Xstar, n)
+        return (self._mean(Xstar, n, Kstar), self._std(Xstar, n, Kstar, noise))
+
+class PosteriorSampler(object):
+    r"""Draws samples from the posterior of a :py:class:`GaussianProcess` at fixed points.
+    
+    The factorization is computed when the sampler is constructed, after which
+    any number of samples can be drawn, either all at once with :py:meth:`draw`
+    or in chunks with :py:meth:`iter_draws`. Normally constructed with
+    :py:meth:`GaussianProcess.posterior_sampler`.
+    
+    Two methods are available:
+    
+        * 'cholesky': The posterior covariance matrix :math:`\Sigma_*` is
+          formed and factored as :math:`\Sigma_*=L_*L_*^T`, and samples are
+          drawn as :math:`\mu_* + L_*u`.
+        * 'pathwise': Samples are drawn with Matheron's rule. The prior is
+          sampled at the training and test points with `num_features` random
+          Fourier features :math:`\phi(x)=\sqrt{2\sigma^2/F}\cos(\omega\cdot x+b)`
+          (and their derivatives), as :math:`f=\Phi w` with standard normal
+          weights :math:`w`. Together with simulated observation noise
+          :math:`\epsilon`, each prior sample is corrected with the cached
+          Cholesky factor of the training data:
+          
+          .. math::
+          
+              f_*|y = \mu_* + f_* - K_*^T K^{-1}(Tf + \epsilon)
+          
+          Neither the posterior covariance matrix nor the joint covariance
+          matrix of the training and test points is formed, so this is much
+          cheaper than 'cholesky' for many test points. The samples are
+          approximate, with an error in the covariance which decreases as
+          :math:`1/\sqrt{F}`. This requires a stationary kernel which
+          implements :py:meth:`~gptools.kernel.core.Kernel._draw_frequencies`
+          (the squared exponential, Matern and rational quadratic kernels),
+          a noise kernel which is either zero or diagonal, and `noise` =
+          False.
+    
+    Parameters
+    ----------
+    gp : :py:class:`GaussianProcess` instance
+        The GP to draw samples from, at its current hyperparameters.
+    Xstar : array, (`M`, `D`)
+        `M` test input values of dimension `D`.
+    n : array, (`M`, `D`) or scalar, non-negative int, optional
+        Derivative order to evaluate at. Default is 0 (evaluate value).
+    noise : bool, optional
+        Whether or not to include the noise components of the kernel in the
+        samples. Default is False (no noise in samples).
+    method : {'cholesky', 'pathwise'}, optional
+        Method to use to draw the samples, as described above. Default is
+        'cholesky'.
+    diag_factor : float, optional
+        Number (times machine epsilon) added to the diagonal of the covariance
+        matrix which is factored when `method` is 'cholesky'. Default is 1e3.
+    num_features : positive int, optional
+        The number of random Fourier features to use when `method` is
+        'pathwise'. Default is 1000.
+    
+    Attributes
+    ----------
+    mean : array, (`M`,)
+        The posterior mean at `Xstar`.
+    num_rand_vars : int
+        The number of standard normal variables needed for each sample.
+    
+    Raises
+    ------
+    ValueError
+        If `method` is invalid, `n` is not consistent with the shape of
+        `Xstar` or the GP is not supported by the 'pathwise' method.
+    numpy.linalg.LinAlgError
+        If the covariance matrix cannot be factored. Try increasing
+        `diag_factor`.
+    """
+    def __init__(self, gp, Xstar, n=0, noise=False, method='cholesky', diag_factor=1e3,
+                 num_features=1000):
+        Xstar = scipy.atleast_2d(scipy.asarray(Xstar, dtype=float))
+        if gp.num_dim == 1 and Xstar.shape[0] == 1:
+            Xstar = Xstar.T
+        try:
+            iter(n)
+        except TypeError:
+            n = n * scipy.ones(Xstar.shape, dtype=int)
+        else:
+            n = scipy.atleast_2d(scipy.asarray(n, dtype=int))
+            if gp.num_dim == 1 and n.shape[0] == 1:
+                n = n.T
+        self.method = method
+        jitter = diag_factor * sys.float_info.epsilon
+        if method == 'cholesky':
+            self.mean, cov = gp.predict(Xstar, n=n, noise=noise, return_cov=True)
+            _add_to_diag(cov, jitter)
+            self._L = scipy.linalg.cholesky(cov, lower=True, check_finite=False)
+            self.num_rand_vars = len(self.mean)
+        elif method == 'pathwise':
+            if noise:
+                raise ValueError("method 'pathwise' does not support noise=True!")
+            if not isinstance(gp.noise_k, (ZeroKernel, DiagonalNoiseKernel)):
+                raise ValueError(
+                    "method 'pathwise' only supports zero or diagonal noise kernels!"
+                )
+            try:
+                omega, var = gp.k._draw_frequencies(num_features)
+            except NotImplementedError as e:
+                raise ValueError("method 'pathwise' is not available: %s" % (e,))
+            phase = numpy.random.uniform(0.0, 2.0 * scipy.pi, size=num_features)
+            self.mean = gp.predict(Xstar, n=n, return_std=False)
+            with gp._lock:
+                gp.compute_K_L_alpha_ll()
+                X, n_train, T, L = gp.X, gp.n, gp.T, gp.L
+                # Only the diagonal of noise_K is stored for these noise kernels:
+                noise_sd = scipy.sqrt(gp._noise_K) if gp._noise_K.any() else None
+                err_y = gp.err_y
+                jitter_y = gp.diag_factor * numpy.finfo(L.dtype).eps
+            Kstar = gp.compute_Kij(X, Xstar, n_train, n)
+            self._Phi = _fourier_features(X, n_train, omega, phase, var)
+            self._Phi_star = _fourier_features(Xstar, n, omega, phase, var)
+            self._noise_sd = noise_sd
+            self._T = T
+            self._L = L
+            self._Kstar = T.dot(Kstar) if T is not None else Kstar
+            self._err_y = scipy.sqrt(err_y**2.0 + jitter_y)
+            self.num_rand_vars = num_features + len(err_y)
+            if noise_sd is not None:
+                self.num_rand_vars += len(X)
+        else:
+            raise ValueError("method %s not recognized!" % (method,))
+    
+    def draw(self, num_samp=1, rand_vars=None):
+        """Draw samples from the posterior.
+        
+        Parameters
+        ----------
+        num_samp : positive int, optional
+            Number of samples to draw. Default is 1. Ignored if `rand_vars` is
+            given.
+        rand_vars : array, (:py:attr:`num_rand_vars`, `P`), optional
+            Standard normal random variables to use to construct `P` samples.
+            Default is None (draw them with
+            :py:func:`numpy.random.standard_normal`).
+        
+        Returns
+        -------
+        samples : array, (`M`, `P`) or (`M`, `num_samp`)
+            Samples evaluated at the `M` points.
+        """
+        if rand_vars is None:
+            rand_vars = numpy.random.standard_normal((self.num_rand_vars, num_samp))
+        if self.method == 'cholesky':
+            return scipy.atleast_2d(self.mean).T + self._L.dot(rand_vars)
+        else:
+            num_features = self._Phi.shape[1]
+            w = rand_vars[:num_features, :]
+            f_train = self._Phi.dot(w)
+            f_star = self._Phi_star.dot(w)
+            eps = rand_vars[num_features:, :]
+            if self._noise_sd is not None:
+                f_train += self._noise_sd[:, None] * eps[:f_train.shape[0], :]
+                eps = eps[f_train.shape[0]:, :]
+            if self._T is not None:
+                f_train = self._T.dot(f_train)
+            y_sim = f_train + self._err_y[:, None] * eps
+            return (
+                scipy.atleast_2d(self.mean).T + f_star -
+                self._Kstar.T.dot(scipy.linalg.cho_solve((self._L, True), y_sim))
+            )
+    
+    def iter_draws(self, num_samp, chunk_size=100):
+        """Draw samples from the posterior in chunks.
+        
+        Parameters
+        ----------
+        num_samp : positive int
+            Total number of samples to draw.
+        chunk_size : positive int, optional
+            Number of samples in each chunk. Default is 100.
+        
+        Yields
+        ------
+        samples : array, (`M`, `chunk_size`)
+            Samples evaluated at the `M` points. The last chunk may be smaller.
+        """
+        for start in xrange(0, num_samp, chunk_size):
+            yield self.draw(num_samp=min(chunk_size, num_samp - start))
+
+def _fourier_features(X, n, omega, phase, var):
+    r"""Evaluate random Fourier features, or their derivatives, at the given points.
+    
+    The derivative of order :math:`n` of
+    :math:`\phi(x)=\sqrt{2\sigma^2/F}\cos(\omega\cdot x+b)` is
+    :math:`\sqrt{2\sigma^2/F}\prod_d\omega_d^{n_d}\cos(\omega\cdot x+b+\frac{\pi}{2}\sum_d n_d)`.
+    
+    Parameters
+    ----------
+    X : array, (`M`, `D`)
+        `M` input values of dimension `D`.
+    n : array, (`M`, `D`), non-negative integers
+        `M` derivative orders with respect to the `X` coordinates.
+    omega : array, (`F`, `D`)
+        The frequencies of the `F` features.
+    phase : array, (`F`,)
+        The phases of the features.
+    var : float
+        The prior variance of the kernel.
+    
+    Returns
+    -------
+    Phi : array, (`M`, `F`)
+        The features evaluated at each of the `M` points.
+    """
+    Phi = scipy.cos(X.dot(omega.T) + phase + 0.5 * scipy.pi * n.sum(axis=1)[:, None])
+    for d in xrange(0, X.shape[1]):
+        if (n[:, d] != 0).any():
+            Phi *= omega[None, :, d]**n[:, d, None]
+    Phi *= scipy.sqrt(2.0 * var / len(phase))
+    return Phi
+
 class _ComputeGPWrapper(object):
     """Wrapper to allow parallel evaluation of means, covariances and random draws.
     
@@ -2426,6 +3940,139 @@ class _ComputeLnProbEval(object):
         """
         return -1 * self.gp.update_hyperparameters(x.flatten())
 
+# The evaluator used by each process of the pool created by
+# GaussianProcess.optimize_hyperparameters, set by _init_optimize_worker:
+_optimize_worker_state = {}
+
+def _init_optimize_worker(gp, opt_kwargs, race=None):
+    """Store the :py:class:`GaussianProcess` to optimize in a worker process.
+    
+    Parameters
+    ----------
+    gp : :py:class:`GaussianProcess` instance
+        The instance to optimize.
+    opt_kwargs : dict
+        Dictionary of keyword arguments to be passed to
+        :py:func:`scipy.optimize.minimize`.
+    race : :py:class:`_RaceState` instance, optional
+        State shared between racing starts. Default is None (no racing).
+    """
+    _optimize_worker_state['eval'] = _OptimizeHyperparametersEval(gp, opt_kwargs, race=race)
+
+def _optimize_worker_eval(samp):
+    """Run one random start in a worker process set up by :py:func:`_init_optimize_worker`.
+    
+    Parameters
+    ----------
+    samp : array
+        The starting guess for the free hyperparameters.
+    """
+    return _optimize_worker_state['eval'](samp)
+
+class _StartCancelled(Exception):
+    """Raised to stop a random start which has lost the race.
+    """
+    pass
+
+class _RaceState(object):
+    """Best objective value shared between racing random starts.
+    
+    Only starts which have completed successfully with a finite objective
+    value publish it, so a start is never cancelled in favor of one which later
+    fails.
+    
+    Parameters
+    ----------
+    margin : float
+        Starts whose best objective value is more than `margin` above the best
+        value found by any completed start are cancelled.
+    num_iter : positive int
+        Number of iterations each start is allowed before it can be cancelled.
+    best : object with a `value` attribute
+        Holds the best objective value of the completed starts, such as a
+        :py:class:`multiprocessing.Value`.
+    lock : lock
+        Lock to hold while updating `best`.
+    """
+    def __init__(self, margin, num_iter, best, lock):
+        self.margin = margin
+        self.num_iter = num_iter
+        self.best = best
+        self.lock = lock
+    
+    def reset(self):
+        """Forget the best value, as is done at the start of each trial.
+        """
+        with self.lock:
+            self.best.value = scipy.inf
+    
+    def publish(self, fun):
+        """Report the final objective value `fun` of a completed start.
+        
+        Parameters
+        ----------
+        fun : float
+            The objective value at the solution found by the calling start.
+            Non-finite values are ignored.
+        """
+        if scipy.isfinite(fun):
+            with self.lock:
+                if fun < self.best.value:
+                    self.best.value = fun
+    
+    def is_beaten(self, fun):
+        """Return True if `fun` is worse than the best completed start by more than :py:attr:`margin`.
+        
+        Parameters
+        ----------
+        fun : float
+            The best objective value found so far by the calling start.
+        """
+        with self.lock:
+            return fun > self.best.value + self.margin
+
+class _RacingObjective(object):
+    """Wraps the objective of one random start to report its progress to a :py:class:`_RaceState`.
+    
+    Parameters
+    ----------
+    fun : callable
+        The objective function, which may also return its gradient.
+    race : :py:class:`_RaceState` instance
+        The state shared with the other starts.
+    callback : callable, optional
+        Callback from the user's `opt_kwargs` to call after each iteration.
+    """
+    def __init__(self, fun, race, callback=None):
+        self.fun = fun
+        self.race = race
+        self.user_callback = callback
+        self.best = scipy.inf
+        self.nit = 0
+    
+    def __call__(self, x, *args):
+        out = self.fun(x, *args)
+        fun = out[0] if isinstance(out, tuple) else out
+        if fun < self.best:
+            self.best = fun
+        return out
+    
+    def callback(self, xk, *args):
+        """Report the progress at the end of an iteration.
+        
+        Raises
+        ------
+        _StartCancelled
+            If the start has run for at least :py:attr:`race.num_iter`
+            iterations and is worse than the best start by more than
+            :py:attr:`race.margin`.
+        """
+        if self.user_callback is not None:
+            self.user_callback(xk, *args)
+        self.nit += 1
+        if self.nit >= self.race.num_iter and self.race.is_beaten(self.best):
+            raise _StartCancelled()
+
 class _OptimizeHyperparametersEval(object):
     """Helper class to support parallel random starts of MAP estimation of hyperparameters.
     
@@ -2436,17 +4083,27 @@ class _OptimizeHyperparametersEval(object):
     opt_kwargs : dict
         Dictionary of keyword arguments to be passed to
         :py:func:`scipy.optimize.minimize`.
+    race : :py:class:`_RaceState` instance, optional
+        If present, the starts report their progress to it and hopeless starts
+        are cancelled. Default is None (run all starts to convergence).
     """
-    def __init__(self, gp, opt_kwargs):
+    def __init__(self, gp, opt_kwargs, race=None):
         self.gp = gp
         self.opt_kwargs = opt_kwargs
+        self.race = race
     
     def __call__(self, samp):
+        fun = self.gp.update_hyperparameters
+        opt_kwargs = self.opt_kwargs
+        if self.race is not None:
+            fun = _RacingObjective(fun, self.race, callback=opt_kwargs.get('callback', None))
+            opt_kwargs = dict(opt_kwargs)
+            opt_kwargs['callback'] = fun.callback
         try:
-            return scipy.optimize.minimize(
-                self.gp.update_hyperparameters,
+            res = scipy.optimize.minimize(
+                fun,
                 samp,
-                **self.opt_kwargs
+                **opt_kwargs
             )
         except AttributeError:
             if self.gp.verbose:
@@ -2459,6 +4116,8 @@ class _OptimizeHyperparametersEval(object):
                 samp,
                 opt_kwargs=self.opt_kwargs
             )
+        except _StartCancelled:
+            return None
         except:
             if self.gp.verbose:
                 warnings.warn(
@@ -2471,6 +4130,9 @@ class _OptimizeHyperparametersEval(object):
                     RuntimeWarning
                 )
             return None
+        if self.race is not None:
+            self.race.publish(res.fun)
+        return res
 
 class Constraint(object):
     """Implements an inequality constraint on the value of the mean or its derivatives.
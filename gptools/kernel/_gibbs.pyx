@@ -0,0 +1,28 @@
+import cython
+import numpy as np
+from libc.stdint cimport int32_t
+
+cdef extern from "gibbs.h":
+    double gibbs1d(double lx, double ly, double lx1, double ly1, double x_y,
+                   int32_t ni, int32_t nj) nogil
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef _gibbs1d(const double[::1] lx, const double[::1] ly,
+               const double[::1] lx1, const double[::1] ly1,
+               const double[::1] x_y, const int32_t[::1] ni, const int32_t[::1] nj):
+
+    cdef int i, n
+    n = lx.shape[0]
+    if not (n == len(ly) == len(lx1) == len(ly1) == len(x_y) == len(ni) == len(nj)):
+        raise ValueError("Lengths don't match")
+
+    cdef double[::1] out = np.zeros(n, dtype=np.float64)
+
+    with nogil:
+        for i in range(n):
+            out[i] = gibbs1d(lx[i], ly[i], lx1[i], ly1[i], x_y[i], ni[i], nj[i])
+
+    return out
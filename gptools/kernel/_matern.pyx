@@ -3,17 +3,17 @@ import numpy as np
 from libc.stdint cimport int32_t
 
 cdef extern from "matern.h":
-    double matern52(double *xi, double *xj,
-                    int32_t* ni, int32_t* nj,
-                    int32_t d, double* var) nogil
+    double matern52(const double *xi, const double *xj,
+                    const int32_t* ni, const int32_t* nj,
+                    int32_t d, const double* var) nogil
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 @cython.cdivision(True)
-cpdef _matern52(double[:, ::1] Xi, double[:, ::1] Xj,
-                int32_t[:, ::1] ni, int32_t[:, ::1] nj,
-                double[::1] var):
+cpdef _matern52(const double[:, ::1] Xi, const double[:, ::1] Xj,
+                const int32_t[:, ::1] ni, const int32_t[:, ::1] nj,
+                const double[::1] var):
 
     cdef int i, d, n
     n = Xi.shape[0]
@@ -30,3 +30,29 @@ cpdef _matern52(double[:, ::1] Xi, double[:, ::1] Xj,
             out[i] = matern52(&Xi[i, 0], &Xj[i, 0], &ni[i, 0], &nj[i, 0], d, &var[0])
 
     return out
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef _matern52_pairwise(const double[:, ::1] Xi, const double[:, ::1] Xj,
+                         const int32_t[:, ::1] ni, const int32_t[:, ::1] nj,
+                         const double[::1] var):
+
+    cdef int i, j, d, m, p
+    m = Xi.shape[0]
+    p = Xj.shape[0]
+    d = Xi.shape[1]
+    if not (m == len(ni) and p == len(nj)):
+        raise ValueError("Lengths don't match")
+    if not (d == Xj.shape[1] == ni.shape[1] == nj.shape[1] == len(var)):
+        raise ValueError("Widths don't match")
+
+    cdef double[:, ::1] out = np.zeros((m, p), dtype=np.float64)
+
+    with nogil:
+        for i in range(m):
+            for j in range(p):
+                out[i, j] = matern52(&Xi[i, 0], &Xj[j, 0], &ni[i, 0], &nj[j, 0], d, &var[0])
+
+    return out
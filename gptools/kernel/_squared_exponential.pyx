@@ -0,0 +1,59 @@
+import cython
+import numpy as np
+from libc.stdint cimport int32_t
+
+cdef extern from "squared_exponential.h":
+    double squared_exponential(const double *xi, const double *xj,
+                               const int32_t* ni, const int32_t* nj,
+                               int32_t d, const double* params,
+                               int32_t hyper_deriv) nogil
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef _squared_exponential(const double[:, ::1] Xi, const double[:, ::1] Xj,
+                           const int32_t[:, ::1] ni, const int32_t[:, ::1] nj,
+                           const double[::1] params, int32_t hyper_deriv):
+
+    cdef int i, d, n
+    n = Xi.shape[0]
+    d = Xi.shape[1]
+    if not (n == len(Xi) == len(Xj) == len(ni) == len(nj)):
+        raise ValueError("Lengths don't match")
+    if not (d == Xi.shape[1] == Xj.shape[1] == ni.shape[1] == nj.shape[1] == len(params) - 1):
+        raise ValueError("Widths don't match")
+
+    cdef double[::1] out = np.zeros(n, dtype=np.float64)
+
+    with nogil:
+        for i in range(n):
+            out[i] = squared_exponential(&Xi[i, 0], &Xj[i, 0], &ni[i, 0], &nj[i, 0], d, &params[0], hyper_deriv)
+
+    return out
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef _squared_exponential_pairwise(const double[:, ::1] Xi, const double[:, ::1] Xj,
+                                    const int32_t[:, ::1] ni, const int32_t[:, ::1] nj,
+                                    const double[::1] params, int32_t hyper_deriv):
+
+    cdef int i, j, d, m, p
+    m = Xi.shape[0]
+    p = Xj.shape[0]
+    d = Xi.shape[1]
+    if not (m == len(ni) and p == len(nj)):
+        raise ValueError("Lengths don't match")
+    if not (d == Xj.shape[1] == ni.shape[1] == nj.shape[1] == len(params) - 1):
+        raise ValueError("Widths don't match")
+
+    cdef double[:, ::1] out = np.zeros((m, p), dtype=np.float64)
+
+    with nogil:
+        for i in range(m):
+            for j in range(p):
+                out[i, j] = squared_exponential(&Xi[i, 0], &Xj[j, 0], &ni[i, 0], &nj[j, 0], d, &params[0], hyper_deriv)
+
+    return out
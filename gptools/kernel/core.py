@@ -27,6 +27,7 @@ from ..error_handling import GPArgumentError
 import scipy
 import scipy.special
 import scipy.stats
+import numpy.random
 import warnings
 try:
     import mpmath
@@ -37,6 +38,140 @@ except ImportError:
     )
 import inspect
 import multiprocessing
+import copy
+
+def _bounded_steps(p, bounds):
+    r"""Find the steps to take in a parameter for a finite difference.
+    
+    The nominal step is :math:`10^{-5}\max(|p|, 1)`, which is shortened on
+    either side so that the perturbed values stay within `bounds`. At a bound
+    the difference becomes one-sided.
+    
+    Parameters
+    ----------
+    p : float
+        The value of the parameter.
+    bounds : 2-tuple
+        The (lower, upper) bounds of the parameter. Either may be None or NaN
+        to indicate that there is no bound.
+    
+    Returns
+    -------
+    h_plus : float
+        The (non-negative) step to take upwards.
+    h_minus : float
+        The (non-negative) step to take downwards. The derivative is
+        approximated as :math:`(f(p+h_+)-f(p-h_-))/(h_++h_-)`.
+    """
+    h = 1e-5 * max(abs(p), 1.0)
+    lb, ub = scipy.asarray(bounds, dtype=float)
+    h_plus = h if scipy.isnan(ub) else max(min(h, ub - p), 0.0)
+    h_minus = h if scipy.isnan(lb) else max(min(h, p - lb), 0.0)
+    if h_plus + h_minus == 0.0:
+        # The bounds leave no room, so ignore them:
+        h_plus = h
+        h_minus = h
+    return h_plus, h_minus
+
+class PairGeometry(object):
+    """Hyperparameter-independent quantities for a fixed set of pairs of points.
+    
+    Holds the (`M`, `D`) arrays of pairs passed to a kernel along with the
+    quantities derived from them which do not depend on the hyperparameters
+    (the difference vectors and the grouping of the pairs by derivative
+    order). These are computed on first access and then reused, so a single
+    instance can be evaluated repeatedly with
+    :py:meth:`Kernel.eval_geometry` while the hyperparameters change.
+    
+    Parameters
+    ----------
+    Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+        `M` inputs with dimension `D`.
+    Xj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+        `M` inputs with dimension `D`.
+    ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+        `M` derivative orders for set `i`.
+    nj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+        `M` derivative orders for set `j`.
+    combined_groups : list of tuples, optional
+        The value of :py:attr:`combined_groups` for these pairs, if it is
+        already known. Default is None (compute it on first access).
+    
+    Attributes
+    ----------
+    Xi, Xj : :py:class:`Array`, (`M`, `D`)
+        The inputs.
+    ni, nj : :py:class:`Array` of int, (`M`, `D`)
+        The derivative orders.
+    tau : :py:class:`Array`, (`M`, `D`)
+        The difference vectors `Xi` - `Xj`. Actually a getter method with a property decorator.
+    n_combined : :py:class:`Array` of int, (`M`, `D`)
+        The combined derivative orders `ni` + `nj`. Actually a getter method with a property decorator.
+    n_tot_j : :py:class:`Array` of int, (`M`,)
+        The total number of derivatives with respect to `Xj`. Actually a getter method with a property decorator.
+    only_values : bool
+        True if none of the pairs involve derivatives. Actually a getter method with a property decorator.
+    combined_groups : list of tuples
+        The unique rows of :py:attr:`n_combined`, each paired with the indices
+        of the pairs having that derivative order. If there is only one unique
+        row the indices are given as a slice so that no copies are made.
+        Actually a getter method with a property decorator.
+    """
+    def __init__(self, Xi, Xj, ni, nj, combined_groups=None):
+        # Stored as contiguous arrays of double and 32-bit int so they can be
+        # passed directly to the compiled kernels:
+        self.Xi = scipy.ascontiguousarray(Xi, dtype=scipy.float64)
+        self.Xj = scipy.ascontiguousarray(Xj, dtype=scipy.float64)
+        self.ni = scipy.ascontiguousarray(ni, dtype=scipy.int32)
+        self.nj = scipy.ascontiguousarray(nj, dtype=scipy.int32)
+        self._tau = None
+        self._n_combined = None
+        self._n_tot_j = None
+        self._only_values = None
+        self._combined_groups = combined_groups
+    
+    @property
+    def tau(self):
+        if self._tau is None:
+            self._tau = self.Xi - self.Xj
+        return self._tau
+    
+    @property
+    def n_combined(self):
+        if self._n_combined is None:
+            self._n_combined = self.ni + self.nj
+        return self._n_combined
+    
+    @property
+    def n_tot_j(self):
+        if self._n_tot_j is None:
+            self._n_tot_j = scipy.sum(self.nj, axis=1)
+        return self._n_tot_j
+    
+    @property
+    def only_values(self):
+        if self._only_values is None:
+            self._only_values = bool((self.ni == 0).all() and (self.nj == 0).all())
+        return self._only_values
+    
+    @property
+    def combined_groups(self):
+        if self._combined_groups is None:
+            if self.only_values:
+                n_combined_unique = scipy.zeros((1, self.ni.shape[1]), dtype=int)
+            else:
+                n_combined_unique = unique_rows(self.n_combined)
+            if len(n_combined_unique) == 1:
+                self._combined_groups = [(n_combined_unique[0], slice(None))]
+            else:
+                self._combined_groups = [
+                    (
+                        n_combined_state,
+                        scipy.where((self.n_combined == n_combined_state).all(axis=1))[0]
+                    )
+                    for n_combined_state in n_combined_unique
+                ]
+        return self._combined_groups
 
 class Kernel(object):
     """Covariance kernel base class. Not meant to be explicitly instantiated!
@@ -233,6 +368,207 @@ class Kernel(object):
             "This is an abstract method -- please use one of the implementing subclasses!"
         )
     
+    def eval_geometry(self, geom, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance for the pairs of points stored in a :py:class:`PairGeometry`.
+        
+        This is equivalent to calling the kernel with the arrays held in
+        `geom`, but lets kernels reuse the hyperparameter-independent
+        quantities cached in `geom` across evaluations. This default
+        implementation simply falls back to :py:meth:`__call__`.
+        
+        Parameters
+        ----------
+        geom : :py:class:`PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None
+            (no hyperparameter derivatives).
+        symmetric : bool, optional
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`,)
+            Covariances for each of the `M` pairs.
+        """
+        return self(
+            geom.Xi, geom.Xj, geom.ni, geom.nj,
+            hyper_deriv=hyper_deriv,
+            symmetric=symmetric
+        )
+    
+    def _hyper_deriv_steps(self, hyper_deriv):
+        r"""Find the steps to take in a hyperparameter for a finite difference.
+        
+        See :py:func:`_bounded_steps` for how the steps are chosen.
+        
+        Parameters
+        ----------
+        hyper_deriv : non-negative int
+            The index of the hyperparameter to differentiate with respect to.
+        
+        Returns
+        -------
+        h_plus : float
+            The (non-negative) step to take upwards.
+        h_minus : float
+            The (non-negative) step to take downwards. The derivative is
+            approximated as :math:`(f(p+h_+)-f(p-h_-))/(h_++h_-)`.
+        """
+        return _bounded_steps(self.params[hyper_deriv], self.param_bounds[hyper_deriv])
+    
+    def _central_difference_hyper_deriv(self, hyper_deriv, method, *args, **kwargs):
+        """Approximate a hyperparameter derivative with a central difference.
+        
+        The perturbed hyperparameters are set on shallow copies of the kernel,
+        so the kernel itself is never modified and this is safe to use while
+        other threads are evaluating it. The steps are chosen with
+        :py:meth:`_hyper_deriv_steps`, so the kernel is never evaluated outside
+        of the bounds of the hyperparameter.
+        
+        Parameters
+        ----------
+        hyper_deriv : non-negative int
+            The index of the hyperparameter to differentiate with respect to.
+        method : str
+            The name of the method to evaluate, which must not be passed a
+            `hyper_deriv` keyword. All remaining arguments are passed to it.
+        
+        Returns
+        -------
+        dKij : :py:class:`Array`
+            The derivative of the output of `method`.
+        """
+        h_plus, h_minus = self._hyper_deriv_steps(hyper_deriv)
+        values = []
+        for step in (h_plus, -h_minus):
+            k = copy.copy(self)
+            k.params = scipy.array(self.params, dtype=float)
+            k.params[hyper_deriv] += step
+            values.append(getattr(k, method)(*args, **kwargs))
+        return (values[0] - values[1]) / (h_plus + h_minus)
+    
+    def eval_geometry_hyper_derivs(self, geom, hyper_derivs, symmetric=False):
+        """Evaluate several hyperparameter derivatives for the pairs of points stored in a :py:class:`PairGeometry`.
+        
+        This default implementation calls :py:meth:`eval_geometry` once for
+        each hyperparameter. Kernels which can share the work between the
+        derivatives should override it.
+        
+        Parameters
+        ----------
+        geom : :py:class:`PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_derivs : list of non-negative int
+            The indices of the hyperparameters to compute the first derivatives
+            with respect to.
+        symmetric : bool, optional
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
+        
+        Returns
+        -------
+        dKij : :py:class:`Array`, (`len(hyper_derivs)`, `M`)
+            The derivatives of the covariances for each of the `M` pairs.
+        """
+        dKij = scipy.zeros((len(hyper_derivs), len(geom.Xi)))
+        for i, hyper_deriv in enumerate(hyper_derivs):
+            dKij[i, :] = self.eval_geometry(geom, hyper_deriv=hyper_deriv, symmetric=symmetric)
+        return dKij
+    
+    def pairwise(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance matrix between all pairs of points in `Xi` and `Xj`.
+        
+        Unlike :py:meth:`__call__`, which takes the (`M`, `D`) arrays of pairs
+        to evaluate at, this takes the two sets of points directly and returns
+        the full (`M`, `P`) matrix. This default implementation simply tiles
+        the inputs and falls back to :py:meth:`__call__`. Kernels which can
+        broadcast over the two sets of points should override it to avoid
+        forming the tiled (`M` * `P`, `D`) arrays.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` derivative orders for set `j`.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None
+            (no hyperparameter derivatives).
+        symmetric : bool, optional
+            Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
+            Default is False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        Xi = scipy.asarray(Xi)
+        Xj = scipy.asarray(Xj)
+        Kij = self(
+            scipy.repeat(Xi, Xj.shape[0], axis=0),
+            scipy.tile(Xj, (Xi.shape[0], 1)),
+            scipy.repeat(ni, Xj.shape[0], axis=0),
+            scipy.tile(nj, (Xi.shape[0], 1)),
+            hyper_deriv=hyper_deriv,
+            symmetric=symmetric
+        )
+        return scipy.reshape(Kij, (Xi.shape[0], Xj.shape[0]))
+    
+    def _pairwise_by_state(self, fun, Xi, Xj, ni, nj):
+        """Assemble a pairwise covariance matrix from blocks of constant derivative order.
+        
+        Helper for implementations of :py:meth:`pairwise`. The points in `Xi`
+        and `Xj` are grouped according to their derivative orders and `fun` is
+        called once for each combination of groups.
+        
+        Parameters
+        ----------
+        fun : callable
+            Called as `fun(Xi_s, Xj_s, ni_state, nj_state)`, where `Xi_s` and
+            `Xj_s` are the points having derivative orders `ni_state` and
+            `nj_state`, respectively. Must return the (`len(Xi_s)`,
+            `len(Xj_s)`) block of the covariance matrix.
+        Xi : :py:class:`Array`, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Array`, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni : :py:class:`Array`, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Array`, (`P`, `D`)
+            `P` derivative orders for set `j`.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            The assembled covariance matrix.
+        """
+        ni = scipy.asarray(ni, dtype=int)
+        nj = scipy.asarray(nj, dtype=int)
+        ni_unique = unique_rows(ni)
+        nj_unique = unique_rows(nj)
+        # Avoid the extra indexing in the (common) case of a single state:
+        if len(ni_unique) == 1 and len(nj_unique) == 1:
+            return fun(Xi, Xj, ni_unique[0], nj_unique[0])
+        Kij = scipy.zeros((Xi.shape[0], Xj.shape[0]))
+        for ni_state in ni_unique:
+            i_idxs = scipy.where((ni == ni_state).all(axis=1))[0]
+            for nj_state in nj_unique:
+                j_idxs = scipy.where((nj == nj_state).all(axis=1))[0]
+                Kij[scipy.ix_(i_idxs, j_idxs)] = fun(
+                    Xi[i_idxs, :], Xj[j_idxs, :], ni_state, nj_state
+                )
+        return Kij
+    
     def set_hyperparams(self, new_params):
         """Sets the free hyperparameters to the new parameter values in new_params.
         
@@ -376,14 +712,68 @@ class Kernel(object):
             The (`D`,) array of length scales repeated for each of the `M`
             inputs. Only returned if `return_l` is True.
         """
-        l_mat = scipy.tile(self.params[-self.num_dim:], (tau.shape[0], 1))
-        tau_over_l = tau / l_mat
-        tau_over_l[(tau == 0) & (l_mat == 0)] = 0.0
+        l = self.params[-self.num_dim:]
+        tau_over_l = tau / l
+        tau_over_l[(tau == 0) & (l == 0)] = 0.0
         r2l2 = scipy.sum((tau_over_l)**2, axis=1)
         if return_l:
-            return (r2l2, l_mat)
+            return (r2l2, l * scipy.ones_like(tau))
         else:
             return r2l2
+    
+    def _draw_frequencies(self, num_features):
+        r"""Draw frequencies from the spectral density of the kernel.
+        
+        For a stationary kernel, Bochner's theorem gives
+        :math:`k(\tau)=\sigma^2 E[\cos(\omega\cdot\tau)]` with
+        :math:`\omega` drawn from the normalized spectral density. This is
+        used to build random Fourier features, see
+        :py:class:`~gptools.gaussian_process.PosteriorSampler`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        var : float
+            The prior variance :math:`\sigma^2`.
+        
+        Notes
+        -----
+        THIS IS ONLY A METHOD STUB TO DEFINE THE NEEDED CALLING FINGERPRINT!
+        Only some of the stationary kernels implement it.
+        """
+        raise NotImplementedError(
+            "Kernel %s does not support random Fourier features!" % (self.__class__.__name__,)
+        )
+    
+    def _draw_mixture_frequencies(self, num_features, g=None):
+        r"""Draw frequencies for a kernel which is a scale mixture of squared exponentials.
+        
+        The frequencies are :math:`\omega_d=z_d\sqrt{g}/l_d` with
+        :math:`z_d` standard normal. Assumes that the length parameters are the
+        last `num_dim` elements of :py:attr:`self.params`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        g : :py:class:`Array`, (`num_features`,), optional
+            The mixing variables. Default is None (a squared exponential).
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        """
+        omega = numpy.random.standard_normal((num_features, self.num_dim))
+        if g is not None:
+            omega *= scipy.sqrt(g)[:, None]
+        return omega / self.params[-self.num_dim:]
 
 class BinaryKernel(Kernel):
     """Abstract class for binary operations on kernels (addition, multiplication, etc.).
@@ -525,6 +915,79 @@ class SumKernel(BinaryKernel):
                 return self.k2(*args, hyper_deriv=hd - len(self.k1.params), **kwargs)
         else:
             return self.k1(*args, **kwargs) + self.k2(*args, **kwargs)
+    
+    def eval_geometry(self, geom, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance for the pairs of points stored in a :py:class:`PairGeometry`.
+        
+        Uses the :py:meth:`~gptools.kernel.core.Kernel.eval_geometry` methods
+        of the two kernels, so that both share the cached quantities.
+        
+        Parameters
+        ----------
+        geom : :py:class:`PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None
+            (no hyperparameter derivatives).
+        symmetric : bool, optional
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`,)
+            Covariances for each of the `M` pairs.
+        """
+        if hyper_deriv is not None:
+            if hyper_deriv < len(self.k1.params):
+                return self.k1.eval_geometry(geom, hyper_deriv=hyper_deriv, symmetric=symmetric)
+            else:
+                return self.k2.eval_geometry(
+                    geom,
+                    hyper_deriv=hyper_deriv - len(self.k1.params),
+                    symmetric=symmetric
+                )
+        else:
+            return (
+                self.k1.eval_geometry(geom, symmetric=symmetric) +
+                self.k2.eval_geometry(geom, symmetric=symmetric)
+            )
+    
+    def pairwise(self, *args, **kwargs):
+        """Evaluate the covariance matrix between all pairs of points in `Xi` and `Xj`.
+        
+        Uses the :py:meth:`~gptools.kernel.core.Kernel.pairwise` methods of the
+        two kernels, so that any native implementations are used.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` derivative orders for set `j`.
+        symmetric : bool, optional
+            Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
+            Default is False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        hd = kwargs.pop('hyper_deriv', None)
+        if hd is not None:
+            if hd < len(self.k1.params):
+                return self.k1.pairwise(*args, hyper_deriv=hd, **kwargs)
+            else:
+                return self.k2.pairwise(*args, hyper_deriv=hd - len(self.k1.params), **kwargs)
+        else:
+            return self.k1.pairwise(*args, **kwargs) + self.k2.pairwise(*args, **kwargs)
 
 class ProductKernel(BinaryKernel):
     """The product of two kernels.
@@ -542,6 +1005,12 @@ class ProductKernel(BinaryKernel):
             `M` derivative orders for set `i`.
         nj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
             `M` derivative orders for set `j`.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Since each
+            hyperparameter belongs to only one of the kernels, the derivative
+            is taken by differentiating that factor. Default is None (no
+            hyperparameter derivatives).
         symmetric : bool, optional
             Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
             Default is False.
@@ -550,14 +1019,15 @@ class ProductKernel(BinaryKernel):
         -------
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
-        
-        Raises
-        ------
-        NotImplementedError
-            If the `hyper_deriv` keyword is given and is not None.
         """
-        if kwargs.get('hyper_deriv', None) is not None:
-            raise NotImplementedError("hyper_deriv keyword not yet supported!")
+        hd = kwargs.pop('hyper_deriv', None)
+        kwargs1 = dict(kwargs)
+        kwargs2 = dict(kwargs)
+        if hd is not None:
+            if hd < len(self.k1.params):
+                kwargs1['hyper_deriv'] = hd
+            else:
+                kwargs2['hyper_deriv'] = hd - len(self.k1.params)
         # Need to process ni, nj to handle the product rule properly.
         nij = scipy.hstack((ni, nj))
         nij_unique = unique_rows(nij)
@@ -591,8 +1061,8 @@ class ProductKernel(BinaryKernel):
                 for i in sC:
                     nij_2[:, i] += 1
                 result[idxs] += (
-                    self.k1(Xi[idxs, :], Xj[idxs, :], nij_1[:, :self.num_dim], nij_1[:, self.num_dim:], **kwargs) *
-                    self.k2(Xi[idxs, :], Xj[idxs, :], nij_2[:, :self.num_dim], nij_2[:, self.num_dim:], **kwargs)
+                    self.k1(Xi[idxs, :], Xj[idxs, :], nij_1[:, :self.num_dim], nij_1[:, self.num_dim:], **kwargs1) *
+                    self.k2(Xi[idxs, :], Xj[idxs, :], nij_2[:, :self.num_dim], nij_2[:, self.num_dim:], **kwargs2)
                 )
         return result
 
@@ -627,8 +1097,9 @@ class ChainRuleKernel(Kernel):
             `M` derivative orders for set `j`.
         hyper_deriv : Non-negative int or None, optional
             The index of the hyperparameter to compute the first derivative
-            with respect to. If None, no derivatives are taken. Hyperparameter
-            derivatives are not supported at this point. Default is None.
+            with respect to. If None, no derivatives are taken. See
+            :py:meth:`eval_geometry` for how the derivatives are computed.
+            Default is None.
         symmetric : bool
             Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
             Default is False.
@@ -637,37 +1108,161 @@ class ChainRuleKernel(Kernel):
         -------
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
-        
-        Raises
-        ------
-        NotImplementedError
-            If the `hyper_deriv` keyword is not None.
         """
-        if hyper_deriv is not None:
-            raise NotImplementedError("Hyperparameter derivatives have not been implemented!")
+        return self.eval_geometry(
+            PairGeometry(Xi, Xj, ni, nj),
+            hyper_deriv=hyper_deriv,
+            symmetric=symmetric
+        )
+    
+    def eval_geometry(self, geom, hyper_deriv=None, symmetric=False):
+        r"""Evaluate the covariance for the pairs of points stored in a :py:class:`PairGeometry`.
+        
+        The derivative with respect to the prefactor is found from the value
+        of the kernel. Since the kernel only depends on the length scales
+        through :math:`\tau_d/l_d`, the derivative of the derivative
+        observation :math:`k_{\mathbf{n}}` with respect to the length scale
+        :math:`l_d` follows from the next higher derivative with respect to
+        :math:`\tau_d`:
+        
+        .. math::
+        
+            \frac{\partial k_{\mathbf{n}}}{\partial l_d} = -\frac{n_d}{l_d}k_{\mathbf{n}} - \frac{\tau_d}{l_d}k_{\mathbf{n}+\mathbf{e}_d}
+        
+        Derivatives with respect to any other hyperparameters (such as the
+        order of the kernel) are found with finite differences which stay
+        within the bounds of the hyperparameter.
+        
+        Parameters
+        ----------
+        geom : :py:class:`PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None.
+        symmetric : bool
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
         
-        tau = scipy.asarray(Xi - Xj, dtype=float)
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`,)
+            Covariances for each of the `M` pairs.
+        """
+        if hyper_deriv is not None and hyper_deriv == 0:
+            if self.params[0] == 0.0:
+                return scipy.zeros(geom.tau.shape[0], dtype=float)
+            return 2.0 * self.eval_geometry(geom, symmetric=symmetric) / self.params[0]
+        elif hyper_deriv is not None and hyper_deriv < len(self.params) - self.num_dim:
+            return self._central_difference_hyper_deriv(
+                hyper_deriv, 'eval_geometry', geom, symmetric=symmetric
+            )
         
-        # Account for derivatives:
-        # Get total number of differentiations:
-        n_tot_j = scipy.asarray(scipy.sum(nj, axis=1), dtype=int).flatten()
-        n_combined = scipy.asarray(ni + nj, dtype=int)
-        n_combined_unique = unique_rows(n_combined)
+        tau = geom.tau
         
         # Evaluate the kernel:
-        k = scipy.zeros(Xi.shape[0], dtype=float)
-        # First compute dk/dtau
-        for n_combined_state in n_combined_unique:
-            idxs = (n_combined == n_combined_state).all(axis=1)
-            k[idxs] = self._compute_dk_dtau(tau[idxs], n_combined_state)
+        k = scipy.zeros(tau.shape[0], dtype=float)
+        if hyper_deriv is None:
+            # First compute dk/dtau
+            for n_combined_state, idxs in geom.combined_groups:
+                k[idxs] = self._compute_dk_dtau(tau[idxs], n_combined_state)
+        else:
+            # Compute the derivative of dk/dtau with respect to a length scale:
+            d = hyper_deriv - (len(self.params) - self.num_dim)
+            for n_combined_state, idxs in geom.combined_groups:
+                tau_g = tau[idxs]
+                n_up = scipy.array(n_combined_state, dtype=int)
+                n_up[d] += 1
+                dk_dl = -n_combined_state[d] * self._compute_dk_dtau(tau_g, n_combined_state)
+                # The second term vanishes where tau_d is zero, even if the
+                # higher derivative does not exist there:
+                nonzero = tau_g[:, d] != 0
+                dk_dl[nonzero] -= (
+                    tau_g[nonzero, d] * self._compute_dk_dtau(tau_g[nonzero], n_up)
+                )
+                k[idxs] = dk_dl / self.params[hyper_deriv]
         
         # Compute factor from the dtau_d/dx_d_j terms in the chain rule:
-        j_chain_factors = (-1.0)**(n_tot_j)
+        j_chain_factors = (-1.0)**(geom.n_tot_j)
         
         # Multiply by the chain rule factor to get dk/dXi or dk/dXj:
         k = (self.params[0])**2.0 * j_chain_factors * k
         return k
     
+    def pairwise(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance matrix between all pairs of points in `Xi` and `Xj`.
+        
+        Broadcasts over the two sets of points to form `tau` instead of tiling
+        the inputs.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` derivative orders for set `j`.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Derivatives are
+            evaluated with :py:meth:`__call__`. Default is None.
+        symmetric : bool
+            Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
+            Default is False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        if hyper_deriv is not None:
+            return super(ChainRuleKernel, self).pairwise(
+                Xi, Xj, ni, nj, hyper_deriv=hyper_deriv, symmetric=symmetric
+            )
+        return self._pairwise_by_state(
+            self._compute_pairwise_block,
+            scipy.asarray(Xi, dtype=float),
+            scipy.asarray(Xj, dtype=float),
+            ni,
+            nj
+        )
+    
+    def _compute_pairwise_block(self, Xi, Xj, ni_state, nj_state):
+        """Evaluate the block of the pairwise covariance matrix for one pair of derivative orders.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Array`, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Array`, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni_state : :py:class:`Array`, (`D`,)
+            Derivative orders for all of the points in `Xi`.
+        nj_state : :py:class:`Array`, (`D`,)
+            Derivative orders for all of the points in `Xj`.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        # Only tau itself needs to be formed, the tiled copies of the inputs and
+        # the derivative orders are avoided:
+        tau = scipy.reshape(
+            Xi[:, scipy.newaxis, :] - Xj[scipy.newaxis, :, :],
+            (-1, self.num_dim)
+        )
+        k = (
+            (self.params[0])**2.0 * (-1.0)**(scipy.sum(nj_state)) *
+            self._compute_dk_dtau(tau, ni_state + nj_state)
+        )
+        return scipy.reshape(k, (Xi.shape[0], Xj.shape[0]))
+    
     def _compute_dk_dtau(self, tau, n):
         r"""Evaluate :math:`dk/d\tau` at the specified locations with the specified derivatives.
         
@@ -805,8 +1400,9 @@ class ArbitraryKernel(Kernel):
             `M` derivative orders for set `j`.
         hyper_deriv : Non-negative int or None, optional
             The index of the hyperparameter to compute the first derivative
-            with respect to. If None, no derivatives are taken. Hyperparameter
-            derivatives are not supported at this point. Default is None.
+            with respect to. If None, no derivatives are taken. The derivative
+            is taken with :py:func:`mpmath.diff` together with any derivatives
+            with respect to `Xi` and `Xj`. Default is None.
         symmetric : bool, optional
             Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
             Default is False.
@@ -815,14 +1411,7 @@ class ArbitraryKernel(Kernel):
         -------
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
-        
-        Raises
-        ------
-        NotImplementedError
-            If the `hyper_deriv` keyword is not None.
         """
-        if hyper_deriv is not None:
-            raise NotImplementedError("Hyperparameter derivatives have not been implemented!")
         n_cat = scipy.asarray(scipy.concatenate((ni, nj), axis=1), dtype=int)
         X_cat = scipy.asarray(scipy.concatenate((Xi, Xj), axis=1), dtype=float)
         n_cat_unique = unique_rows(n_cat)
@@ -832,42 +1421,39 @@ class ArbitraryKernel(Kernel):
             pool = multiprocessing.Pool(processes=self.num_proc)
         for n_cat_state in n_cat_unique:
             idxs = scipy.where(scipy.asarray((n_cat == n_cat_state).all(axis=1)).squeeze())[0]
-            if (n_cat_state == 0).all():
+            if (n_cat_state == 0).all() and hyper_deriv is None:
                 k[idxs] = self.cov_func(Xi[idxs, :], Xj[idxs, :], *self.params)
             else:
+                eval_func = _ArbitraryKernelEval(self, n_cat_state, hyper_deriv=hyper_deriv)
                 if self.num_proc > 1 and len(idxs) > 1:
                     k[idxs] = scipy.asarray(
-                        pool.map(_ArbitraryKernelEval(self, n_cat_state), X_cat[idxs, :]),
+                        pool.map(eval_func, X_cat[idxs, :]),
                         dtype=float
                     )
                 else:
                     for idx in idxs:
-                        k[idx] = mpmath.chop(
-                            mpmath.diff(
-                                self._mask_cov_func,
-                                X_cat[idx, :],
-                                n=n_cat_state,
-                                singular=True
-                            )
-                        )
+                        k[idx] = eval_func(X_cat[idx, :])
         
         if self.num_proc > 0:
             pool.close()
         return k
     
-    def _mask_cov_func(self, *args):
+    def _mask_cov_func(self, *args, **kwargs):
         """Masks the covariance function into a form usable by :py:func:`mpmath.diff`.
         
         Parameters
         ----------
         *args : `num_dim` * 2 floats
             The individual elements of Xi and Xj to be passed to :py:attr:`cov_func`.
+        params : array, optional
+            The hyperparameters to use. Default is :py:attr:`params`.
         """
+        params = kwargs.get('params', self.params)
         # Have to do it in two cases to get the 1d unwrapped properly:
         if self.num_dim == 1:
-            return self.cov_func(args[0], args[1], *self.params)
+            return self.cov_func(args[0], args[1], *params)
         else:
-            return self.cov_func(args[:self.num_dim], args[self.num_dim:], *self.params)
+            return self.cov_func(args[:self.num_dim], args[self.num_dim:], *params)
 
 class _ArbitraryKernelEval(object):
     """Helper class to support parallel evaluation of the :py:class:ArbitraryKernel:.
@@ -878,12 +1464,16 @@ class _ArbitraryKernelEval(object):
         Instance to wrap to allow parallel computation of.
     n_cat_state : Array-like, (2,)
         Derivative orders to take with respect to `Xi` and `Xj`.
+    hyper_deriv : non-negative int or None, optional
+        The index of the hyperparameter to also differentiate with respect to.
+        Default is None (no hyperparameter derivative).
     """
     # TODO: Generalize this for higher dimensions, since ArbitraryKernel is
     # supposed to be more general than univariate.
-    def __init__(self, obj, n_cat_state):
+    def __init__(self, obj, n_cat_state, hyper_deriv=None):
         self.obj = obj
         self.n_cat_state = n_cat_state
+        self.hyper_deriv = hyper_deriv
     
     def __call__(self, X_cat_row):
         """Return the covariance function of object evaluated at the given `X_cat_row`.
@@ -893,12 +1483,29 @@ class _ArbitraryKernelEval(object):
         X_cat_row : Array-like, (2,)
             The `Xi` and `Xj` point to evaluate at.
         """
-        return mpmath.chop(mpmath.diff(self.obj._mask_cov_func,
-                                       X_cat_row,
-                                       n=self.n_cat_state,
-                                       singular=True))
+        if self.hyper_deriv is None:
+            return mpmath.chop(mpmath.diff(self.obj._mask_cov_func,
+                                           X_cat_row,
+                                           n=self.n_cat_state,
+                                           singular=True))
+        else:
+            # Append the hyperparameter to the arguments being differentiated:
+            return mpmath.chop(mpmath.diff(self._cov_func_with_param,
+                                           list(X_cat_row) + [self.obj.params[self.hyper_deriv]],
+                                           n=list(self.n_cat_state) + [1],
+                                           singular=True))
+    
+    def _cov_func_with_param(self, *args):
+        """Evaluate the covariance function with the last argument as the hyperparameter `hyper_deriv`.
+        """
+        params = list(self.obj.params)
+        params[self.hyper_deriv] = args[-1]
+        return self.obj._mask_cov_func(*args[:-1], params=params)
 
-MASKEDKERNEL_RESERVED_NAMES = ['base', 'mask', 'maskC', 'num_dim', 'scale']
+MASKEDKERNEL_RESERVED_NAMES = [
+    'base', 'mask', 'maskC', 'num_dim', 'scale', 'pairwise', 'eval_geometry',
+    'eval_geometry_hyper_derivs'
+]
 
 class MaskedKernel(Kernel):
     """Creates a kernel that is only masked to operate on certain dimensions, or has scaling/shifting.
@@ -951,9 +1558,10 @@ class MaskedKernel(Kernel):
     def __getattribute__(self, name):
         """Gets all attributes from the base kernel.
         
-        The exceptions are 'base', 'mask', 'maskC', 'num_dim', 'scale' and any
-        special method (i.e., a method/attribute having leading and trailing
-        double underscores), which are taken from :py:class:`MaskedKernel`.
+        The exceptions are 'base', 'mask', 'maskC', 'num_dim', 'scale',
+        'pairwise', 'eval_geometry' and any special method (i.e., a
+        method/attribute having leading and trailing double underscores), which
+        are taken from :py:class:`MaskedKernel`.
         """
         if not (name.startswith('__') and name.endswith('__')) and name not in MASKEDKERNEL_RESERVED_NAMES:
             try:
@@ -966,9 +1574,10 @@ class MaskedKernel(Kernel):
     def __setattr__(self, name, value):
         """Sets all attributes in the base kernel.
         
-        The exceptions are 'base', 'mask', 'maskC', 'num_dim', 'scale' and any
-        special method (i.e., a method/attribute having leading and trailing
-        double underscores), which are set in :py:class:`MaskedKernel`.
+        The exceptions are 'base', 'mask', 'maskC', 'num_dim', 'scale',
+        'pairwise', 'eval_geometry' and any special method (i.e., a
+        method/attribute having leading and trailing double underscores), which
+        are set in :py:class:`MaskedKernel`.
         """
         if not (name.startswith('__') and name.endswith('__')) and name not in MASKEDKERNEL_RESERVED_NAMES:
             return self.base.__setattr__(name, value)
@@ -33,6 +33,11 @@ except ImportError:
 import scipy
 import scipy.interpolate
 import inspect
+try:
+    from ._gibbs import _gibbs1d
+except ImportError:
+    # Fall back on the pure Python implementation:
+    _gibbs1d = None
 
 def tanh_warp_arb(X, l1, l2, lw, x0):
     r"""Warps the `X` coordinate with the tanh model
@@ -238,6 +243,9 @@ class GibbsKernel1d(Kernel):
         k = \left ( \frac{2l(x)l(x')}{l^2(x)+l^2(x')} \right )^{1/2}\exp\left ( -\frac{(x-x')^2}{l^2(x)+l^2(x')} \right )
     
     The derivatives are hard-coded using expressions obtained from Mathematica.
+    If the compiled extension :py:mod:`gptools.kernel._gibbs` has been built
+    it is used to evaluate these expressions, otherwise they are evaluated with
+    NumPy.
     
     Parameters
     ----------
@@ -283,8 +291,10 @@ class GibbsKernel1d(Kernel):
             `M` derivative orders for set `j`.
         hyper_deriv : Non-negative int or None, optional
             The index of the hyperparameter to compute the first derivative
-            with respect to. If None, no derivatives are taken. Hyperparameter
-            derivatives are not supported at this point. Default is None.
+            with respect to. If None, no derivatives are taken. The derivatives
+            with respect to the parameters of the length scale function are
+            found with the chain rule, see :py:meth:`_compute_hyper_deriv`.
+            Default is None.
         symmetric : bool, optional
             Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
             Default is False.
@@ -293,20 +303,18 @@ class GibbsKernel1d(Kernel):
         -------
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
-        
-        Raises
-        ------
-        NotImplementedError
-            If the `hyper_deriv` keyword is not None.
         """
-        if hyper_deriv is not None:
-            raise NotImplementedError("Hyperparameter derivatives have not been implemented!")
+        if hyper_deriv == 0:
+            if self.params[0] == 0.0:
+                return scipy.zeros(len(Xi), dtype=float)
+            return 2.0 * self(Xi, Xj, ni, nj, symmetric=symmetric) / self.params[0]
+        elif hyper_deriv is not None:
+            return self._compute_hyper_deriv(Xi, Xj, ni, nj, hyper_deriv)
         
         n_combined = scipy.asarray(scipy.hstack((ni, nj)), dtype=int)
-        n_combined_unique = unique_rows(n_combined)
         
-        x = scipy.asarray(Xi, dtype=float)
-        y = scipy.asarray(Xj, dtype=float)
+        x = scipy.asarray(Xi, dtype=float).ravel()
+        y = scipy.asarray(Xj, dtype=float).ravel()
         
         lx = self.l_func(x, 0, *self.params[1:])
         ly = self.l_func(y, 0, *self.params[1:])
@@ -314,6 +322,24 @@ class GibbsKernel1d(Kernel):
         ly1 = self.l_func(y, 1, *self.params[1:])
         
         x_y = x - y
+        
+        if _gibbs1d is not None:
+            if (n_combined > 1).any():
+                raise NotImplementedError("Derivatives greater than [1, 1] are not supported!")
+            k = scipy.asarray(
+                _gibbs1d(
+                    scipy.ascontiguousarray(scipy.broadcast_to(lx, x.shape), dtype=float),
+                    scipy.ascontiguousarray(scipy.broadcast_to(ly, y.shape), dtype=float),
+                    scipy.ascontiguousarray(scipy.broadcast_to(lx1, x.shape), dtype=float),
+                    scipy.ascontiguousarray(scipy.broadcast_to(ly1, y.shape), dtype=float),
+                    scipy.ascontiguousarray(x_y, dtype=float),
+                    scipy.ascontiguousarray(n_combined[:, 0], dtype=scipy.int32),
+                    scipy.ascontiguousarray(n_combined[:, 1], dtype=scipy.int32)
+                )
+            )
+            return self.params[0]**2 * k
+        
+        n_combined_unique = unique_rows(n_combined)
         lx2ly2 = lx**2 + ly**2
         
         k = scipy.zeros(Xi.shape[0], dtype=float)
@@ -397,6 +423,130 @@ class GibbsKernel1d(Kernel):
                 raise NotImplementedError("Derivatives greater than [1, 1] are not supported!")
         k = self.params[0]**2 * k
         return k
+    
+    def _l_func_hyper_deriv(self, x, hyper_deriv):
+        """Find the derivatives of the length scale function with respect to one of its parameters.
+        
+        The length scale function does not provide these itself, so they are
+        found with a finite difference of :py:attr:`l_func` (which is much
+        cheaper than a finite difference of the whole kernel), with the steps
+        from :py:meth:`_hyper_deriv_steps`.
+        
+        Parameters
+        ----------
+        x : :py:class:`Array`, (`M`,)
+            The locations to evaluate at.
+        hyper_deriv : positive int
+            The index of the hyperparameter of the kernel to differentiate with
+            respect to.
+        
+        Returns
+        -------
+        dl : :py:class:`Array`, (`M`,)
+            The derivative of :math:`l(x)`.
+        dl1 : :py:class:`Array`, (`M`,)
+            The derivative of :math:`l'(x)`.
+        """
+        h_plus, h_minus = self._hyper_deriv_steps(hyper_deriv)
+        values = []
+        for step in (h_plus, -h_minus):
+            params = scipy.array(self.params[1:], dtype=float)
+            params[hyper_deriv - 1] += step
+            values.append([
+                scipy.broadcast_to(self.l_func(x, n, *params), x.shape) for n in (0, 1)
+            ])
+        return [(p - m) / (h_plus + h_minus) for p, m in zip(*values)]
+    
+    def _compute_hyper_deriv(self, Xi, Xj, ni, nj, hyper_deriv):
+        r"""Evaluate the derivative of the covariance with respect to a parameter of the length scale function.
+        
+        Writing :math:`u=l(x)`, :math:`v=l(x')`, :math:`S=u^2+v^2` and
+        :math:`d=x-x'`, the logarithm of the kernel is
+        
+        .. math::
+        
+            g = \ln k = \ln\sigma^2 + \frac{1}{2}\ln\frac{2uv}{S} - \frac{d^2}{S}
+        
+        and the derivative observations are :math:`k_x=kg_x`, :math:`k_{x'}=kg_{x'}`
+        and :math:`k_{xx'}=k(g_xg_{x'}+g_{xx'})`, where the derivatives of
+        :math:`g` involve :math:`u'=l'(x)` and :math:`v'=l'(x')`. These
+        expressions are differentiated analytically with respect to
+        :math:`u`, :math:`u'`, :math:`v` and :math:`v'`, which are in turn
+        differentiated with respect to the hyperparameter with
+        :py:meth:`_l_func_hyper_deriv`.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `j`.
+        hyper_deriv : positive int
+            The index of the hyperparameter to differentiate with respect to.
+        
+        Returns
+        -------
+        dKij : :py:class:`Array`, (`M`,)
+            Derivatives of the covariances for each of the `M` `Xi`, `Xj` pairs.
+        """
+        n_combined = scipy.asarray(scipy.hstack((ni, nj)), dtype=int)
+        if (n_combined > 1).any():
+            raise NotImplementedError("Derivatives greater than [1, 1] are not supported!")
+        
+        x = scipy.asarray(Xi, dtype=float).ravel()
+        y = scipy.asarray(Xj, dtype=float).ravel()
+        xy = scipy.concatenate((x, y))
+        
+        u, v = scipy.split(scipy.broadcast_to(self.l_func(xy, 0, *self.params[1:]), xy.shape), 2)
+        u1, v1 = scipy.split(scipy.broadcast_to(self.l_func(xy, 1, *self.params[1:]), xy.shape), 2)
+        dl, dl1 = self._l_func_hyper_deriv(xy, hyper_deriv)
+        a, b = scipy.split(dl, 2)
+        a1, b1 = scipy.split(dl1, 2)
+        
+        d = x - y
+        d2 = d**2
+        S = u**2 + v**2
+        k = self.params[0]**2 * scipy.sqrt(2.0 * u * v / S) * scipy.exp(-d2 / S)
+        
+        # Derivatives of g with respect to x, x' and the hyperparameter:
+        G_u = 0.5 / u - u / S + 2.0 * d2 * u / S**2
+        G_v = 0.5 / v - v / S + 2.0 * d2 * v / S**2
+        p = u * u1
+        q = v * v1
+        g_x = u1 * G_u - 2.0 * d / S
+        g_y = v1 * G_v + 2.0 * d / S
+        g_xy = 2.0 / S + (2.0 * p * q + 4.0 * d * (q - p)) / S**2 - 8.0 * d2 * p * q / S**3
+        
+        dS = 2.0 * (u * a + v * b)
+        dg = 0.5 * a / u + 0.5 * b / v - 0.5 * dS / S + d2 * dS / S**2
+        dG_u = -0.5 * a / u**2 - a / S + (u * dS + 2.0 * d2 * a) / S**2 - 4.0 * d2 * u * dS / S**3
+        dG_v = -0.5 * b / v**2 - b / S + (v * dS + 2.0 * d2 * b) / S**2 - 4.0 * d2 * v * dS / S**3
+        dp = a * u1 + u * a1
+        dq = b * v1 + v * b1
+        dg_x = a1 * G_u + u1 * dG_u + 2.0 * d * dS / S**2
+        dg_y = b1 * G_v + v1 * dG_v - 2.0 * d * dS / S**2
+        dg_xy = (
+            (2.0 * (dp * q + p * dq) - 2.0 * dS + 4.0 * d * (dq - dp)) / S**2 +
+            (-4.0 * p * q * dS + 8.0 * d * (p - q) * dS - 8.0 * d2 * (dp * q + p * dq)) / S**3 +
+            24.0 * d2 * p * q * dS / S**4
+        )
+        
+        has_i = n_combined[:, 0] == 1
+        has_j = n_combined[:, 1] == 1
+        dk = scipy.where(
+            has_i & has_j,
+            dg * (g_x * g_y + g_xy) + dg_x * g_y + g_x * dg_y + dg_xy,
+            scipy.where(
+                has_i,
+                dg * g_x + dg_x,
+                scipy.where(has_j, dg * g_y + dg_y, dg)
+            )
+        )
+        return k * dk
 
 def tanh_warp(x, n, l1, l2, lw, x0):
     r"""Implements a tanh warping function and its derivative.
@@ -651,7 +801,7 @@ class GibbsKernel1dCubicBucket(GibbsKernel1d):
         All parameters are passed to :py:class:`~gptools.kernel.core.Kernel`.
     """
     def __init__(self, **kwargs):
-        super(GibbsKernel1dBucket, self).__init__(
+        super(GibbsKernel1dCubicBucket, self).__init__(
             cubic_bucket_warp,
             param_names=[r'\sigma_f', 'l_1', 'l_2', 'l_3', 'x_0', 'w_1', 'w_2', 'w_3'],
             **kwargs
@@ -987,6 +1137,8 @@ class GPWarp(object):
         y_grid = hpXy[len(self.gp.free_params) + self.npts:]
         self.gp.X[:, 0] = X_grid
         self.gp.y[:] = y_grid
+        # X was modified in place, so the cached geometry is no longer valid:
+        self.gp._invalidate_data_caches()
         self.gp.update_hyperparameters(hp)
         return self.gp.predict(X, n=n, return_std=False)
 
@@ -0,0 +1,27 @@
+#ifndef GIBBS_KERNEL_H_
+#define GIBBS_KERNEL_H_
+#ifdef _MSC_VER
+typedef __int32 int32_t;
+#else
+#include <stdint.h>
+#endif
+
+/**
+ * Evaluate the univariate Gibbs kernel (less the sigma_f^2 prefactor) between
+ * a pair of points x, y, for derivative orders up to 1 with respect to each.
+ *
+ * Parameters
+ * ----------
+ * lx, ly : double
+ *   The length scale function evaluated at x and y
+ * lx1, ly1 : double
+ *   The first derivative of the length scale function evaluated at x and y
+ * x_y : double
+ *   The difference x - y
+ * ni, nj : int
+ *   The derivative orders with respect to x and y, each 0 or 1
+ */
+double gibbs1d(double lx, double ly, double lx1, double ly1, double x_y,
+               int32_t ni, int32_t nj);
+
+#endif
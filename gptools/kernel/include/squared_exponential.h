@@ -0,0 +1,33 @@
+#ifndef SQUARED_EXPONENTIAL_KERNEL_H_
+#define SQUARED_EXPONENTIAL_KERNEL_H_
+#ifdef _MSC_VER
+typedef __int32 int32_t;
+#else
+#include <stdint.h>
+#endif
+
+/**
+ * Evaluate the squared exponential kernel between a pair of points xi, xj in
+ * R^d, with arbitrary derivative orders.
+ *
+ * Parameters
+ * ----------
+ * xi : array, (d,)
+ * xj : array, (d,)
+ * ni : array, (d,)
+ *   The derivative orders with respect to xi
+ * nj : array, (d,)
+ *   The derivative orders with respect to xj
+ * d : int
+ * params : array, (d + 1,)
+ *   The hyperparameters: the prefactor sigma followed by the d length scales
+ * hyper_deriv : int
+ *   The index of the hyperparameter to take the first derivative with respect
+ *   to, or -1 for no hyperparameter derivative
+ */
+double squared_exponential(const double *xi, const double *xj,
+                           const int32_t* ni, const int32_t* nj,
+                           int32_t d, const double* params,
+                           int32_t hyper_deriv);
+
+#endif
@@ -25,7 +25,7 @@ import warnings
 from .core import ChainRuleKernel, ArbitraryKernel, Kernel
 from ..utils import generate_set_partitions, unique_rows, yn2Kn2Der, fixed_poch
 try:
-    from ._matern import _matern52
+    from ._matern import _matern52, _matern52_pairwise
 except ImportError:
     warnings.warn(
         "Could not import _matern, the extension might not have been built "
@@ -35,6 +35,7 @@ except ImportError:
 
 import scipy
 import scipy.special
+import numpy.random
 try:
     import mpmath
 except ImportError:
@@ -180,6 +181,29 @@ class MaternKernel1d(Kernel):
             **kwargs
         )
     
+    def _draw_frequencies(self, num_features):
+        r"""Draw frequencies from the spectral density of the kernel.
+        
+        The spectral density is a multivariate Student's t distribution with
+        :math:`2\nu` degrees of freedom, which is a scale mixture of normal
+        distributions with mixing variable :math:`g=2\nu/\chi^2_{2\nu}`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        var : float
+            The prior variance :math:`\sigma^2`.
+        """
+        nu = self.params[1]
+        g = 2.0 * nu / numpy.random.chisquare(2.0 * nu, size=num_features)
+        return (self._draw_mixture_frequencies(num_features, g=g), self.params[0]**2)
+    
     def __call__(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
         """Evaluate the covariance between points `Xi` and `Xj` with derivative order `ni`, `nj`.
         
@@ -195,8 +219,9 @@ class MaternKernel1d(Kernel):
             `M` derivative orders for set `j`.
         hyper_deriv : Non-negative int or None, optional
             The index of the hyperparameter to compute the first derivative
-            with respect to. If None, no derivatives are taken. Hyperparameter
-            derivatives are not supported at this point. Default is None.
+            with respect to. If None, no derivatives are taken. The derivatives
+            with respect to `sigma` and `l1` are exact, the derivative with
+            respect to `nu` is found with finite differences. Default is None.
         symmetric : bool, optional
             Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
             Default is False.
@@ -205,14 +230,17 @@ class MaternKernel1d(Kernel):
         -------
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
-        
-        Raises
-        ------
-        NotImplementedError
-            If the `hyper_deriv` keyword is not None.
         """
-        if hyper_deriv is not None:
-            raise NotImplementedError("Hyperparameter derivatives have not been implemented!")
+        if hyper_deriv == 0:
+            if self.params[0] == 0.0:
+                return scipy.zeros(len(Xi), dtype=float)
+            return 2.0 * self(Xi, Xj, ni, nj, symmetric=symmetric) / self.params[0]
+        elif hyper_deriv == 2:
+            return self._compute_dk_dl(Xi, Xj, ni, nj)
+        elif hyper_deriv is not None:
+            return self._central_difference_hyper_deriv(
+                hyper_deriv, '__call__', Xi, Xj, ni, nj, symmetric=symmetric
+            )
         
         n_combined = scipy.asarray(scipy.hstack((ni, nj)), dtype=int)
         n_combined_unique = unique_rows(n_combined)
@@ -226,20 +254,22 @@ class MaternKernel1d(Kernel):
         k = scipy.zeros(Xi.shape[0], dtype=float)
         for n_combined_state in n_combined_unique:
             idxs = (n_combined == n_combined_state).all(axis=1)
+            # Only evaluate away from tau=0, the limits are filled in below:
+            nz = idxs & ~zero_mask
             # Derviative expressions evaluated with Mathematica, assuming l>0.
             if (n_combined_state == scipy.asarray([0, 0])).all():
-                k[idxs] = q[idxs]**self.params[1] * scipy.special.kv(self.params[1], q[idxs])
+                k[nz] = q[nz]**self.params[1] * scipy.special.kv(self.params[1], q[nz])
                 k[idxs & zero_mask] = 2**(self.params[1] - 1) * scipy.special.gamma(self.params[1])
             elif (n_combined_state == scipy.asarray([1, 0])).all():
-                k[idxs] = -1.0 / x_y[idxs] * q[idxs]**(1 + self.params[1]) * scipy.special.kv(self.params[1] - 1, q[idxs])
+                k[nz] = -1.0 / x_y[nz] * q[nz]**(1 + self.params[1]) * scipy.special.kv(self.params[1] - 1, q[nz])
                 k[idxs & zero_mask] = 0.0
             elif (n_combined_state == scipy.asarray([0, 1])).all():
-                k[idxs] = 1.0 / x_y[idxs] * q[idxs]**(1 + self.params[1]) * scipy.special.kv(self.params[1] - 1, q[idxs])
+                k[nz] = 1.0 / x_y[nz] * q[nz]**(1 + self.params[1]) * scipy.special.kv(self.params[1] - 1, q[nz])
                 k[idxs & zero_mask] = 0.0
             elif (n_combined_state == scipy.asarray([1, 1])).all():
-                k[idxs] = 2.0 * self.params[1] / (self.params[2])**2 * q[idxs]**self.params[1] * (
-                    -scipy.special.kv(self.params[1] - 2, q[idxs]) +
-                    scipy.special.kv(self.params[1] - 1, q[idxs]) / q[idxs]
+                k[nz] = 2.0 * self.params[1] / (self.params[2])**2 * q[nz]**self.params[1] * (
+                    -scipy.special.kv(self.params[1] - 2, q[nz]) +
+                    scipy.special.kv(self.params[1] - 1, q[nz]) / q[nz]
                 )
                 # Had to assume nu > 1 for this to work: CHECK THIS!
                 k[idxs & zero_mask] = 2**(self.params[1] - 1) * self.params[1] * scipy.special.gamma(self.params[1] - 1) / (self.params[2]**2)
@@ -247,6 +277,74 @@ class MaternKernel1d(Kernel):
                 raise NotImplementedError("Derivatives greater than [1, 1] are not supported!")
         k = (self.params[0]**2 * 2**(1 - self.params[1]) / scipy.special.gamma(self.params[1])) * k
         return k
+    
+    def _compute_dk_dl(self, Xi, Xj, ni, nj):
+        r"""Evaluate the derivative of the covariance with respect to the length scale.
+        
+        The kernel only depends on :math:`l_1` through
+        :math:`q=\sqrt{2\nu}|\tau|/l_1` (and the :math:`1/l_1^2` prefactor of
+        the [1, 1] derivative), so the derivatives follow from
+        :math:`\partial q/\partial l_1=-q/l_1` and the recurrence
+        :math:`\mathrm{d}(q^\nu K_\nu(q))/\mathrm{d}q=-q^\nu K_{\nu-1}(q)`.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `j`.
+        
+        Returns
+        -------
+        dKij : :py:class:`Array`, (`M`,)
+            Derivatives of the covariances for each of the `M` `Xi`, `Xj` pairs.
+        """
+        nu = self.params[1]
+        l = self.params[2]
+        n_combined = scipy.asarray(scipy.hstack((ni, nj)), dtype=int)
+        n_combined_unique = unique_rows(n_combined)
+        
+        x_y = scipy.asarray(Xi, dtype=float).ravel() - scipy.asarray(Xj, dtype=float).ravel()
+        
+        zero_mask = x_y == 0
+        
+        q = scipy.sqrt(2 * nu * x_y**2) / l
+        
+        # The expressions are only evaluated away from tau=0. The limits there
+        # are zero, except for the [1, 1] derivative:
+        dk = scipy.zeros(Xi.shape[0], dtype=float)
+        for n_combined_state in n_combined_unique:
+            idxs = (n_combined == n_combined_state).all(axis=1)
+            nz = idxs & ~zero_mask
+            q_i = q[nz]
+            if (n_combined_state == scipy.asarray([0, 0])).all():
+                dk[nz] = q_i**(nu + 1) * scipy.special.kv(nu - 1, q_i) / l
+            elif (n_combined_state == scipy.asarray([1, 0])).all():
+                dk[nz] = 1.0 / (x_y[nz] * l) * (
+                    2.0 * q_i**(nu + 1) * scipy.special.kv(nu - 1, q_i) -
+                    q_i**(nu + 2) * scipy.special.kv(nu - 2, q_i)
+                )
+            elif (n_combined_state == scipy.asarray([0, 1])).all():
+                dk[nz] = -1.0 / (x_y[nz] * l) * (
+                    2.0 * q_i**(nu + 1) * scipy.special.kv(nu - 1, q_i) -
+                    q_i**(nu + 2) * scipy.special.kv(nu - 2, q_i)
+                )
+            elif (n_combined_state == scipy.asarray([1, 1])).all():
+                dk[nz] = -2.0 * nu / l**3 * (
+                    q_i**(nu + 1) * scipy.special.kv(nu - 3, q_i) -
+                    5.0 * q_i**nu * scipy.special.kv(nu - 2, q_i) +
+                    2.0 * q_i**(nu - 1) * scipy.special.kv(nu - 1, q_i)
+                )
+                # The [1, 1] covariance is proportional to 1/l**2 at tau=0:
+                dk[idxs & zero_mask] = -2.0**nu * nu * scipy.special.gamma(nu - 1) / l**3
+            else:
+                raise NotImplementedError("Derivatives greater than [1, 1] are not supported!")
+        dk = (self.params[0]**2 * 2**(1 - nu) / scipy.special.gamma(nu)) * dk
+        return dk
 
 class MaternKernel(ChainRuleKernel):
     r"""Matern covariance kernel. Supports arbitrary derivatives. Treats order as a hyperparameter.
@@ -293,6 +391,29 @@ class MaternKernel(ChainRuleKernel):
                                            param_names=param_names,
                                            **kwargs)
     
+    def _draw_frequencies(self, num_features):
+        r"""Draw frequencies from the spectral density of the kernel.
+        
+        The spectral density is a multivariate Student's t distribution with
+        :math:`2\nu` degrees of freedom, which is a scale mixture of normal
+        distributions with mixing variable :math:`g=2\nu/\chi^2_{2\nu}`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        var : float
+            The prior variance :math:`\sigma^2`.
+        """
+        nu = self.params[1]
+        g = 2.0 * nu / numpy.random.chisquare(2.0 * nu, size=num_features)
+        return (self._draw_mixture_frequencies(num_features, g=g), self.params[0]**2)
+    
     def _compute_k(self, tau):
         r"""Evaluate the kernel directly at the given values of `tau`.
         
@@ -509,6 +630,29 @@ class Matern52Kernel(Kernel):
                                              num_params=num_dim + 1,
                                              param_names=param_names,
                                              **kwargs)
+    
+    def _draw_frequencies(self, num_features):
+        r"""Draw frequencies from the spectral density of the kernel.
+        
+        The spectral density is a multivariate Student's t distribution with
+        :math:`2\nu=5` degrees of freedom, which is a scale mixture of normal
+        distributions with mixing variable :math:`g=2\nu/\chi^2_{2\nu}`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        var : float
+            The prior variance :math:`\sigma^2`.
+        """
+        g = 5.0 / numpy.random.chisquare(5.0, size=num_features)
+        return (self._draw_mixture_frequencies(num_features, g=g), self.params[0]**2)
+    
     def __call__(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
         """Evaluate the covariance between points `Xi` and `Xj` with derivative order `ni`, `nj`.
 
@@ -524,8 +668,7 @@ class Matern52Kernel(Kernel):
             `M` derivative orders for set `j`.
         hyper_deriv : Non-negative int or None, optional
             The index of the hyperparameter to compute the first derivative
-            with respect to. If None, no derivatives are taken. Hyperparameter
-            derivatives are not supported at this point. Default is None.
+            with respect to. If None, no derivatives are taken. Default is None.
         symmetric : bool
             Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
             Default is False.
@@ -534,16 +677,11 @@ class Matern52Kernel(Kernel):
         -------
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
-
-        Raises
-        ------
-        NotImplementedError
-            If the `hyper_deriv` keyword is not None.
         """
-        if hyper_deriv is not None:
-            raise NotImplementedError("Hyperparameter derivatives have not been implemented!")
         if scipy.any(scipy.sum(ni, axis=1) > 1) or scipy.any(scipy.sum(nj, axis=1) > 1):
             raise ValueError("Matern52Kernel only supports 0th and 1st order derivatives")
+        if hyper_deriv is not None:
+            return self._compute_hyper_deriv(Xi, Xj, ni, nj, hyper_deriv)
 
         Xi = scipy.asarray(Xi, dtype=scipy.float64)
         Xj = scipy.asarray(Xj, dtype=scipy.float64)
@@ -553,3 +691,130 @@ class Matern52Kernel(Kernel):
 
         value = _matern52(Xi, Xj, ni, nj, var)
         return self.params[0]**2 * value
+
+    def pairwise(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance matrix between all pairs of points in `Xi` and `Xj`.
+
+        Loops over the pairs in compiled code, so no tiled copies of the inputs
+        are formed.
+
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` derivative orders for set `j`.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Derivatives are
+            evaluated with :py:meth:`__call__`. Default is None.
+        symmetric : bool
+            Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
+            Default is False.
+
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        if hyper_deriv is not None:
+            return super(Matern52Kernel, self).pairwise(
+                Xi, Xj, ni, nj, hyper_deriv=hyper_deriv, symmetric=symmetric
+            )
+        if scipy.any(scipy.sum(ni, axis=1) > 1) or scipy.any(scipy.sum(nj, axis=1) > 1):
+            raise ValueError("Matern52Kernel only supports 0th and 1st order derivatives")
+
+        Xi = scipy.ascontiguousarray(Xi, dtype=scipy.float64)
+        Xj = scipy.ascontiguousarray(Xj, dtype=scipy.float64)
+        ni = scipy.array(ni, dtype=scipy.int32)
+        nj = scipy.array(nj, dtype=scipy.int32)
+        var = scipy.square(self.params[-self.num_dim:])
+
+        value = scipy.asarray(_matern52_pairwise(Xi, Xj, ni, nj, var))
+        return self.params[0]**2 * value
+
+    def _compute_hyper_deriv(self, Xi, Xj, ni, nj, hyper_deriv):
+        r"""Evaluate the derivative of the covariance with respect to a hyperparameter.
+
+        With :math:`s=\sqrt{5r^2}`, the derivatives with respect to
+        :math:`\tau=X_i-X_j` are
+
+        .. math::
+
+            \frac{\partial k}{\partial\tau_a} = -\frac{5}{3}\sigma^2(1+s)e^{-s}\frac{\tau_a}{l_a^2} \\
+            \frac{\partial^2 k}{\partial\tau_a\partial\tau_b} = -\frac{5}{3}\sigma^2\left((1+s)e^{-s}\frac{\delta_{ab}}{l_a^2} - 5e^{-s}\frac{\tau_a\tau_b}{l_a^2l_b^2}\right)
+
+        and these are differentiated with respect to the length scales using
+        :math:`\partial s/\partial l_c=-5\tau_c^2/(l_c^3s)`.
+
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `j`.
+        hyper_deriv : non-negative int
+            The index of the hyperparameter to differentiate with respect to.
+
+        Returns
+        -------
+        dKij : :py:class:`Array`, (`M`,)
+            Derivatives of the covariances for each of the `M` `Xi`, `Xj` pairs.
+        """
+        if hyper_deriv == 0:
+            if self.params[0] == 0.0:
+                return scipy.zeros(len(Xi), dtype=float)
+            return 2.0 * self(Xi, Xj, ni, nj) / self.params[0]
+
+        ni = scipy.asarray(ni, dtype=int)
+        nj = scipy.asarray(nj, dtype=int)
+        tau = scipy.asarray(Xi, dtype=float) - scipy.asarray(Xj, dtype=float)
+        l = self.params[-self.num_dim:]
+        s = scipy.sqrt(5.0 * scipy.sum((tau / l)**2, axis=1))
+        e = scipy.exp(-s)
+        g = (1.0 + s) * e
+        c = hyper_deriv - 1
+        l_c = l[c]
+        tau_c = tau[:, c]
+        # tau_c**2 / s, which vanishes as tau goes to zero:
+        tau_c2_s = scipy.zeros_like(s)
+        tau_c2_s[s > 0] = tau_c[s > 0]**2 / s[s > 0]
+
+        rows = scipy.arange(len(tau))
+        has_i = ni.sum(axis=1) == 1
+        has_j = nj.sum(axis=1) == 1
+        a = scipy.argmax(ni, axis=1)
+        b = scipy.argmax(nj, axis=1)
+        tau_a = tau[rows, a]
+        tau_b = tau[rows, b]
+        l_a = l[a]
+        l_b = l[b]
+
+        # No derivative observations:
+        dk = 5.0 / 3.0 * g * tau_c**2 / l_c**3
+        # One derivative observation, with respect to dimension d:
+        def first(tau_d, l_d, d):
+            return -5.0 / 3.0 * (
+                5.0 * e * tau_c**2 * tau_d / (l_c**3 * l_d**2) -
+                2.0 * (d == c) * g * tau_d / l_d**3
+            )
+        dk = scipy.where(has_i, first(tau_a, l_a, a), dk)
+        dk = scipy.where(has_j, -first(tau_b, l_b, b), dk)
+        # Derivative observations on both sides:
+        second = -5.0 / 3.0 * (
+            -25.0 * e * tau_a * tau_b * tau_c2_s / (l_a**2 * l_b**2 * l_c**3) +
+            10.0 * e * tau_a * tau_b / (l_a**2 * l_b**2) * ((a == c) / l_a + (b == c) / l_b) +
+            5.0 * e * tau_c**2 * (a == b) / (l_c**3 * l_a**2) -
+            2.0 * g * (a == b) * (a == c) / l_a**3
+        )
+        dk = scipy.where(has_i & has_j, -second, dk)
+        return self.params[0]**2 * dk
@@ -26,6 +26,7 @@ from ..utils import fixed_poch
 import scipy
 import scipy.special
 import scipy.misc
+import numpy.random
 
 class RationalQuadraticKernel(ChainRuleKernel):
     r"""Rational quadratic (RQ) covariance kernel. Supports arbitrary derivatives.
@@ -71,6 +72,67 @@ class RationalQuadraticKernel(ChainRuleKernel):
                                                       param_names=param_names,
                                                       **kwargs)
     
+    def _draw_frequencies(self, num_features):
+        r"""Draw frequencies from the spectral density of the kernel.
+        
+        The kernel is a scale mixture of squared exponentials with a gamma
+        distributed mixing variable with shape :math:`\alpha` and rate
+        :math:`\alpha`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        var : float
+            The prior variance :math:`\sigma^2`.
+        """
+        alpha = self.params[1]
+        g = numpy.random.gamma(alpha, 1.0 / alpha, size=num_features)
+        return (self._draw_mixture_frequencies(num_features, g=g), self.params[0]**2)
+    
+    def eval_geometry(self, geom, hyper_deriv=None, symmetric=False):
+        r"""Evaluate the covariance for the pairs of points stored in a :py:class:`~gptools.kernel.core.PairGeometry`.
+        
+        When there are no derivative observations, the derivative with respect
+        to :math:`\alpha` has the closed form
+        
+        .. math::
+        
+            \frac{\partial k_{RQ}}{\partial\alpha} = k_{RQ}\left(\frac{z}{\alpha+z} - \ln\left(1+\frac{z}{\alpha}\right)\right)
+        
+        with :math:`z=\frac{1}{2}\sum_i\tau_i^2/l_i^2`. All other cases are
+        handled by :py:meth:`~gptools.kernel.core.ChainRuleKernel.eval_geometry`.
+        
+        Parameters
+        ----------
+        geom : :py:class:`~gptools.kernel.core.PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None.
+        symmetric : bool
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`,)
+            Covariances for each of the `M` pairs.
+        """
+        if hyper_deriv == 1 and geom.only_values:
+            alpha = self.params[1]
+            z = 0.5 * self._compute_r2l2(geom.tau)
+            k = self.params[0]**2 * (1.0 + z / alpha)**(-alpha)
+            return k * (z / (alpha + z) - scipy.log1p(z / alpha))
+        return super(RationalQuadraticKernel, self).eval_geometry(
+            geom, hyper_deriv=hyper_deriv, symmetric=symmetric
+        )
+    
     def _compute_k(self, tau):
         r"""Evaluate the kernel directly at the given values of `tau`.
         
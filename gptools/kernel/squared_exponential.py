@@ -20,17 +20,56 @@
 
 from __future__ import division
 
-from .core import Kernel
+from .core import Kernel, PairGeometry
 
 import scipy
 import scipy.special
+import numpy.random
 import warnings
+try:
+    from ._squared_exponential import _squared_exponential, _squared_exponential_pairwise
+except ImportError:
+    # Fall back on the pure Python implementation:
+    _squared_exponential = None
+    _squared_exponential_pairwise = None
+
+def _hermite_table(n_max, u):
+    """Evaluate the (physicists') Hermite polynomials of all orders up to `n_max`.
+    
+    Uses the three-term recurrence :math:`H_{k+1}(u) = 2uH_k(u) - 2kH_{k-1}(u)`,
+    so that arrays with a different order for each element can be handled
+    with a gather from the table instead of elementwise calls to
+    :py:func:`scipy.special.eval_hermite`.
+    
+    Parameters
+    ----------
+    n_max : non-negative int
+        The highest order to compute.
+    u : :py:class:`Array`
+        The points to evaluate at.
+    
+    Returns
+    -------
+    H : :py:class:`Array`, (`n_max` + 1,) + `u.shape`
+        `H[k]` is :math:`H_k(u)`.
+    """
+    H = scipy.empty((n_max + 1,) + u.shape)
+    H[0] = 1.0
+    if n_max > 0:
+        H[1] = 2.0 * u
+    for k in xrange(1, n_max):
+        H[k + 1] = 2.0 * u * H[k] - 2.0 * k * H[k - 1]
+    return H
 
 class SquaredExponentialKernel(Kernel):
     r"""Squared exponential covariance kernel. Supports arbitrary derivatives.
     
     Supports derivatives with respect to the hyperparameters.
     
+    If the compiled extension :py:mod:`gptools.kernel._squared_exponential`
+    has been built it is used to evaluate the kernel, otherwise the kernel is
+    evaluated with NumPy.
+    
     The squared exponential has the following hyperparameters, always
     referenced in the order listed:
     
@@ -72,6 +111,26 @@ class SquaredExponentialKernel(Kernel):
                                                        param_names=param_names,
                                                        **kwargs)
     
+    def _draw_frequencies(self, num_features):
+        r"""Draw frequencies from the spectral density of the kernel.
+        
+        The spectral density is normal, with standard deviations
+        :math:`1/l_i`.
+        
+        Parameters
+        ----------
+        num_features : positive int
+            The number of frequencies to draw.
+        
+        Returns
+        -------
+        omega : :py:class:`Array`, (`num_features`, `D`)
+            The frequencies.
+        var : float
+            The prior variance :math:`\sigma^2`.
+        """
+        return (self._draw_mixture_frequencies(num_features), self.params[0]**2)
+    
     def __call__(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
         """Evaluate the covariance between points `Xi` and `Xj` with derivative order `ni`, `nj`.
         
@@ -99,44 +158,77 @@ class SquaredExponentialKernel(Kernel):
         Kij : :py:class:`Array`, (`M`,)
             Covariances for each of the `M` `Xi`, `Xj` pairs.
         """
-        only_first_order = (
-            (scipy.asarray(ni, dtype=int) == 0).all() and
-            (scipy.asarray(nj, dtype=int) == 0).all()
+        return self.eval_geometry(
+            PairGeometry(Xi, Xj, ni, nj),
+            hyper_deriv=hyper_deriv,
+            symmetric=symmetric
         )
-        tau = scipy.asarray(Xi - Xj, dtype=float)
+    
+    def eval_geometry(self, geom, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance for the pairs of points stored in a :py:class:`~gptools.kernel.core.PairGeometry`.
+        
+        Parameters
+        ----------
+        geom : :py:class:`~gptools.kernel.core.PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None
+            (no hyperparameter derivatives).
+        symmetric : bool, optional
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`,)
+            Covariances for each of the `M` pairs.
+        """
+        if _squared_exponential is not None:
+            return scipy.asarray(
+                _squared_exponential(
+                    geom.Xi,
+                    geom.Xj,
+                    geom.ni,
+                    geom.nj,
+                    scipy.ascontiguousarray(self.params, dtype=scipy.float64),
+                    -1 if hyper_deriv is None else hyper_deriv
+                )
+            )
+        only_first_order = geom.only_values
+        tau = geom.tau
         r2l2, l_mat = self._compute_r2l2(tau, return_l=True)
         k = self.params[0]**2 * scipy.exp(-r2l2 / 2.0)
         if not only_first_order:
             # Account for derivatives:
             # Get total number of differentiations:
-            n_tot_j = scipy.asarray(scipy.sum(nj, axis=1), dtype=int).flatten()
-            n_combined = scipy.asarray(ni + nj, dtype=int)
+            n_tot_j = geom.n_tot_j
+            n_combined = geom.n_combined
             # Compute factor from the dtau_d/dx_d_j terms in the chain rule:
             j_chain_factors = (-1.0)**(n_tot_j)
-            # Compute Hermite polynomial factor:
+            # Compute Hermite polynomial factor, gathering the order needed
+            # for each element from a table of all orders:
+            u = tau / (scipy.sqrt(2.0) * l_mat)
+            H = _hermite_table(int(n_combined.max()), u)
+            rows = scipy.arange(tau.shape[0])[:, scipy.newaxis]
+            cols = scipy.arange(tau.shape[1])[scipy.newaxis, :]
             hermite_factors = (
                 (-1.0 / (scipy.sqrt(2.0) * l_mat))**(n_combined) *
-                scipy.special.eval_hermite(n_combined, tau / (scipy.sqrt(2.0) * l_mat))
+                H[n_combined, rows, cols]
             )
             # Handle length scale hyperparameter derivatives:
             if hyper_deriv is not None and hyper_deriv > 0:
-                t = (tau[:, hyper_deriv - 1])**2.0 / (self.params[hyper_deriv])**3.0
-                mask = n_combined[:, hyper_deriv - 1] > 0
-                t[mask] -= n_combined[mask, hyper_deriv - 1]  / self.params[hyper_deriv]
-                mask = mask & (tau[:, hyper_deriv - 1] != 0.0)
-                t[mask] -= (
-                    scipy.sqrt(2.0) * n_combined[mask, hyper_deriv - 1] *
-                    tau[mask, hyper_deriv - 1] / (self.params[hyper_deriv])**2.0 *
-                    scipy.special.eval_hermite(
-                        n_combined[mask, hyper_deriv - 1] - 1,
-                        tau[mask, hyper_deriv - 1] / (scipy.sqrt(2.0) * self.params[hyper_deriv])
-                    ) /
-                    scipy.special.eval_hermite(
-                        n_combined[mask, hyper_deriv - 1],
-                        tau[mask, hyper_deriv - 1] / (scipy.sqrt(2.0) * self.params[hyper_deriv])
-                    )
+                d = hyper_deriv - 1
+                l = self.params[hyper_deriv]
+                n = n_combined[:, d]
+                H_n = H[n, rows[:, 0], d]
+                # Derivative of the Hermite factor with respect to l:
+                h = H_n * (tau[:, d]**2.0 / l**3.0 - n / l)
+                mask = n > 0
+                h[mask] -= (
+                    2.0 * n[mask] * u[mask, d] / l * H[n[mask] - 1, rows[mask, 0], d]
                 )
-                hermite_factors[:, hyper_deriv - 1] *= t
+                hermite_factors[:, d] = (-1.0 / (scipy.sqrt(2.0) * l))**n * h
             
             k = j_chain_factors * scipy.prod(hermite_factors, axis=1) * k
         # Take care of hyperparameter derivatives:
@@ -151,3 +243,144 @@ class SquaredExponentialKernel(Kernel):
             else:
                 # Was already computed above:
                 return k
+    
+    def eval_geometry_hyper_derivs(self, geom, hyper_derivs, symmetric=False):
+        """Evaluate several hyperparameter derivatives for the pairs of points stored in a :py:class:`~gptools.kernel.core.PairGeometry`.
+        
+        When there are no derivative observations, the exponential is computed
+        once and shared between all of the derivatives.
+        
+        Parameters
+        ----------
+        geom : :py:class:`~gptools.kernel.core.PairGeometry`
+            The pairs of points to evaluate at.
+        hyper_derivs : list of non-negative int
+            The indices of the hyperparameters to compute the first derivatives
+            with respect to.
+        symmetric : bool, optional
+            Whether or not the pairs are from a symmetric matrix. Default is
+            False.
+        
+        Returns
+        -------
+        dKij : :py:class:`Array`, (`len(hyper_derivs)`, `M`)
+            The derivatives of the covariances for each of the `M` pairs.
+        """
+        if not geom.only_values:
+            return super(SquaredExponentialKernel, self).eval_geometry_hyper_derivs(
+                geom, hyper_derivs, symmetric=symmetric
+            )
+        tau = geom.tau
+        k = self.params[0]**2 * scipy.exp(-self._compute_r2l2(tau) / 2.0)
+        dKij = scipy.zeros((len(hyper_derivs), len(k)))
+        for i, hyper_deriv in enumerate(hyper_derivs):
+            if hyper_deriv == 0:
+                if self.params[0] != 0.0:
+                    dKij[i, :] = 2.0 * k / self.params[0]
+            else:
+                dKij[i, :] = (tau[:, hyper_deriv - 1])**2.0 / (self.params[hyper_deriv])**3.0 * k
+        return dKij
+    
+    def pairwise(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance matrix between all pairs of points in `Xi` and `Xj`.
+        
+        The SE kernel factors over the dimensions, so this works one dimension
+        at a time and never needs more than a few (`M`, `P`) temporaries.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`P`, `D`)
+            `P` derivative orders for set `j`.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Default is None
+            (no hyperparameter derivatives).
+        symmetric : bool, optional
+            Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
+            Default is False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        if _squared_exponential_pairwise is not None:
+            return scipy.asarray(
+                _squared_exponential_pairwise(
+                    scipy.ascontiguousarray(Xi, dtype=scipy.float64),
+                    scipy.ascontiguousarray(Xj, dtype=scipy.float64),
+                    scipy.ascontiguousarray(ni, dtype=scipy.int32),
+                    scipy.ascontiguousarray(nj, dtype=scipy.int32),
+                    scipy.ascontiguousarray(self.params, dtype=scipy.float64),
+                    -1 if hyper_deriv is None else hyper_deriv
+                )
+            )
+        return self._pairwise_by_state(
+            lambda Xi_s, Xj_s, ni_state, nj_state: self._compute_pairwise_block(
+                Xi_s, Xj_s, ni_state, nj_state, hyper_deriv
+            ),
+            scipy.asarray(Xi, dtype=float),
+            scipy.asarray(Xj, dtype=float),
+            ni,
+            nj
+        )
+    
+    def _compute_pairwise_block(self, Xi, Xj, ni_state, nj_state, hyper_deriv):
+        """Evaluate the block of the pairwise covariance matrix for one pair of derivative orders.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Array`, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Array`, (`P`, `D`)
+            `P` inputs with dimension `D`.
+        ni_state : :py:class:`Array`, (`D`,)
+            Derivative orders for all of the points in `Xi`.
+        nj_state : :py:class:`Array`, (`D`,)
+            Derivative orders for all of the points in `Xj`.
+        hyper_deriv : Non-negative int or None
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`, `P`)
+            Covariances between each of the `M` points in `Xi` and each of the
+            `P` points in `Xj`.
+        """
+        n_combined = ni_state + nj_state
+        r2l2 = scipy.zeros((Xi.shape[0], Xj.shape[0]))
+        factor = scipy.ones_like(r2l2)
+        for d in xrange(0, self.num_dim):
+            l = self.params[d + 1]
+            tau = Xi[:, d, scipy.newaxis] - Xj[scipy.newaxis, :, d]
+            tau_over_l = tau / l
+            if l == 0:
+                tau_over_l[tau == 0] = 0.0
+            r2l2 += tau_over_l**2
+            n = n_combined[d]
+            if n > 0 or hyper_deriv == d + 1:
+                u = tau_over_l / scipy.sqrt(2.0)
+                H = _hermite_table(n, u)
+                h = H[n]
+                if hyper_deriv == d + 1:
+                    # Derivative of the Hermite factor with respect to l:
+                    h = h * (tau**2 / l**3 - n / l)
+                    if n > 0:
+                        h -= 2.0 * n * u / l * H[n - 1]
+                factor *= (-1.0 / (scipy.sqrt(2.0) * l))**n * h
+        k = (
+            self.params[0]**2 * (-1.0)**(scipy.sum(nj_state)) *
+            factor * scipy.exp(-r2l2 / 2.0)
+        )
+        if hyper_deriv == 0:
+            return 2.0 * k / self.params[0] if self.params[0] != 0.0 else scipy.zeros_like(k)
+        else:
+            return k
@@ -0,0 +1,105 @@
+/*
+Copyright 2014 Mark Chilenski
+This program is distributed under the terms of the GNU General Purpose License (GPL).
+Refer to http://www.gnu.org/licenses/gpl.txt
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include "math.h"
+#include "gibbs.h"
+
+/**
+ * Evaluate the univariate Gibbs kernel (less the sigma_f^2 prefactor) between
+ * a pair of points x, y, for derivative orders up to 1 with respect to each.
+ *
+ * The derivative expressions are the same ones (obtained from Mathematica,
+ * assuming l > 0) used by the pure Python implementation in
+ * GibbsKernel1d.__call__. Returns NaN for unsupported derivative orders.
+ */
+double gibbs1d(double lx, double ly, double lx1, double ly1, double x_y,
+               int32_t ni, int32_t nj)
+{
+    double lx2 = lx * lx;
+    double ly2 = ly * ly;
+    double lx2ly2 = lx2 + ly2;
+    double x_y2 = x_y * x_y;
+    double e = exp(-x_y2 / lx2ly2);
+
+    if (ni == 0 && nj == 0)
+        return sqrt(2.0 * lx * ly / lx2ly2) * e;
+
+    if (ni == 1 && nj == 0) {
+        return e * ly * (
+            -4 * x_y * lx2 * lx -
+            4 * x_y * lx * ly2 +
+            4 * x_y2 * lx2 * lx1 -
+            lx2 * lx2 * lx1 +
+            ly2 * ly2 * lx1
+        ) / (sqrt(2 * lx * ly) * pow(lx2ly2, 2.5));
+    }
+
+    if (ni == 0 && nj == 1) {
+        return e * lx * (
+            4 * x_y * ly2 * ly +
+            4 * x_y * ly * lx2 +
+            4 * x_y2 * ly2 * ly1 -
+            ly2 * ly2 * ly1 +
+            lx2 * lx2 * ly1
+        ) / (sqrt(2 * lx * ly) * pow(lx2ly2, 2.5));
+    }
+
+    if (ni == 1 && nj == 1) {
+        return e * (
+            -pow(lx, 8) * lx1 * ly1 +
+            4 * pow(lx, 7) * (2 * ly - x_y * ly1) -
+            4 * pow(lx, 5) * ly * (
+                4 * x_y2 -
+                6 * ly2 -
+                3 * x_y * ly * ly1
+            ) + pow(ly, 6) * lx1 * (
+                4 * x_y * ly +
+                4 * x_y2 * ly1 -
+                ly2 * ly1
+            ) + 4 * pow(lx, 6) * lx1 * (
+                -5 * x_y * ly +
+                x_y2 * ly1 +
+                2 * ly2 * ly1
+            ) - 4 * lx * ly2 * ly2 * (
+                4 * x_y2 * ly -
+                2 * ly2 * ly +
+                4 * x_y2 * x_y * ly1 -
+                5 * x_y * ly2 * ly1
+            ) - 4 * lx2 * lx * ly2 * (
+                8 * x_y2 * ly -
+                6 * ly2 * ly +
+                4 * x_y2 * x_y * ly1 -
+                9 * x_y * ly2 * ly1
+            ) + 2 * lx2 * lx2 * ly * lx1 * (
+                8 * x_y2 * x_y -
+                18 * x_y * ly2 -
+                18 * x_y2 * ly * ly1 +
+                9 * ly2 * ly * ly1
+            ) + 4 * lx2 * ly2 * lx1 * (
+                4 * x_y2 * x_y * ly -
+                3 * x_y * ly2 * ly +
+                4 * x_y2 * x_y2 * ly1 -
+                9 * x_y2 * ly2 * ly1 +
+                2 * ly2 * ly2 * ly1
+            )
+        ) / (2 * sqrt(2 * lx * ly) * pow(lx2ly2, 4.5));
+    }
+
+    return NAN;
+}
@@ -0,0 +1,112 @@
+/*
+Copyright 2014 Mark Chilenski
+This program is distributed under the terms of the GNU General Purpose License (GPL).
+Refer to http://www.gnu.org/licenses/gpl.txt
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+*/
+
+#include "math.h"
+#include "squared_exponential.h"
+
+static const double SQRT_2 = 1.4142135623730951;
+
+/**
+ * Evaluate the (physicists') Hermite polynomials H_n(u) and H_{n-1}(u) using
+ * the three-term recurrence
+ *
+ * H_{k+1}(u) = 2 u H_k(u) - 2 k H_{k-1}(u)
+ *
+ * H_{n-1} is stored in hnm1, and is set to zero for n = 0.
+ */
+static double hermite(int32_t n, double u, double *hnm1)
+{
+    int32_t k;
+    double h_prev = 0.0;
+    double h = 1.0;
+    double h_next;
+    for (k = 0; k < n; k++) {
+        h_next = 2.0 * u * h - 2.0 * k * h_prev;
+        h_prev = h;
+        h = h_next;
+    }
+    *hnm1 = h_prev;
+    return h;
+}
+
+/**
+ * Evaluate the squared exponential kernel between a pair of points xi, xj in
+ * R^d, with arbitrary derivative orders.
+ *
+ * The kernel factors over the dimensions, and the derivative of order n of
+ * exp(-tau^2 / (2 l^2)) with respect to tau is
+ *
+ * (-1 / (sqrt(2) l))^n H_n(tau / (sqrt(2) l)) exp(-tau^2 / (2 l^2))
+ *
+ * so the value, input derivatives and length scale derivatives can all be
+ * found in a single pass over the dimensions.
+ *
+ * Parameters
+ * ----------
+ * xi : array, (d,)
+ * xj : array, (d,)
+ * ni : array, (d,)
+ *   The derivative orders with respect to xi
+ * nj : array, (d,)
+ *   The derivative orders with respect to xj
+ * d : int
+ * params : array, (d + 1,)
+ *   The hyperparameters: the prefactor sigma followed by the d length scales
+ * hyper_deriv : int
+ *   The index of the hyperparameter to take the first derivative with respect
+ *   to, or -1 for no hyperparameter derivative
+ */
+double squared_exponential(const double *xi, const double *xj,
+                           const int32_t* ni, const int32_t* nj,
+                           int32_t d, const double* params,
+                           int32_t hyper_deriv)
+{
+    int32_t i, n;
+    int32_t n_tot_j = 0;
+    double l, tau, tau_over_l, u, h, hnm1;
+    double r2l2 = 0.0;
+    double factor = 1.0;
+
+    for (i = 0; i < d; i++) {
+        l = params[i + 1];
+        tau = xi[i] - xj[i];
+        tau_over_l = (l == 0.0 && tau == 0.0) ? 0.0 : tau / l;
+        r2l2 += tau_over_l * tau_over_l;
+        n = ni[i] + nj[i];
+        n_tot_j += nj[i];
+        if (n > 0 || hyper_deriv == i + 1) {
+            u = tau_over_l / SQRT_2;
+            h = hermite(n, u, &hnm1);
+            if (hyper_deriv == i + 1) {
+                /* Derivative of the Hermite factor with respect to l: */
+                h = h * (tau * tau / (l * l * l) - n / l);
+                if (n > 0)
+                    h -= 2.0 * n * u / l * hnm1;
+            }
+            factor *= pow(-1.0 / (SQRT_2 * l), n) * h;
+        }
+    }
+
+    if (n_tot_j % 2 == 1)
+        factor = -factor;
+
+    if (hyper_deriv == 0)
+        return 2.0 * params[0] * factor * exp(-r2l2 / 2.0);
+    return params[0] * params[0] * factor * exp(-r2l2 / 2.0);
+}
@@ -52,10 +52,11 @@ you should use a linear transformation to map them to it::
 
 from __future__ import division
 
-from .core import Kernel
+from .core import Kernel, _bounded_steps
 from ..utils import UniformJointPrior, LogNormalJointPrior, CombinedBounds, MaskedBounds, fixed_poch
 from ..splines import spev
 
+import copy
 import inspect
 import scipy
 import scipy.special
@@ -207,7 +208,7 @@ class WarpingFunction(object):
         self.fixed_params = scipy.asarray(fixed_params, dtype=bool)
         self.hyperprior = hyperprior
     
-    def __call__(self, X, d, n):
+    def __call__(self, X, d, n, hyper_deriv=None):
         """Evaluate the warping function.
         
         Parameters
@@ -218,8 +219,42 @@ class WarpingFunction(object):
             Index of the dimension that `X` is from.
         n : non-negative int
             Derivative order to compute.
+        hyper_deriv : non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. Since `fun` only provides derivatives with respect
+            to `X`, this is found with a central difference using the steps from
+            :py:meth:`_hyper_deriv_steps`. If None, no derivatives are taken.
+            Default is None.
         """
-        return self.fun(X, d, n, *self.params)
+        if hyper_deriv is None:
+            return self.fun(X, d, n, *self.params)
+        h_plus, h_minus = self._hyper_deriv_steps(hyper_deriv)
+        values = []
+        for step in (h_plus, -h_minus):
+            params = scipy.array(self.params, dtype=float)
+            params[hyper_deriv] += step
+            values.append(scipy.asarray(self.fun(X, d, n, *params), dtype=float))
+        return (values[0] - values[1]) / (h_plus + h_minus)
+    
+    def _hyper_deriv_steps(self, hyper_deriv):
+        """Find the steps to take in a hyperparameter for a finite difference.
+        
+        See :py:func:`~gptools.kernel.core._bounded_steps` for how the steps
+        are chosen.
+        
+        Parameters
+        ----------
+        hyper_deriv : non-negative int
+            The index of the hyperparameter to differentiate with respect to.
+        
+        Returns
+        -------
+        h_plus : float
+            The (non-negative) step to take upwards.
+        h_minus : float
+            The (non-negative) step to take downwards.
+        """
+        return _bounded_steps(self.params[hyper_deriv], self.param_bounds[hyper_deriv])
     
     @property
     def param_bounds(self):
@@ -489,6 +524,39 @@ class WarpedKernel(Kernel):
         )
     
     def __call__(self, Xi, Xj, ni, nj, hyper_deriv=None, symmetric=False):
+        """Evaluate the covariance between points `Xi` and `Xj` with derivative order `ni`, `nj`.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        ni : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix` or other Array-like, (`M`, `D`)
+            `M` derivative orders for set `j`.
+        hyper_deriv : Non-negative int or None, optional
+            The index of the hyperparameter to compute the first derivative
+            with respect to. If None, no derivatives are taken. Derivatives
+            with respect to the parameters of the warping are found with the
+            chain rule, which requires the derivatives of :py:attr:`k` with
+            respect to its inputs. Default is None (no hyperparameter
+            derivatives).
+        symmetric : bool, optional
+            Whether or not the input `Xi`, `Xj` are from a symmetric matrix.
+            Default is False.
+        
+        Returns
+        -------
+        Kij : :py:class:`Array`, (`M`,)
+            Covariances for each of the `M` `Xi`, `Xj` pairs.
+        
+        Raises
+        ------
+        ValueError
+            If any of the derivative orders are greater than one.
+        """
         if (ni > 1).any() or (nj > 1).any():
             raise ValueError("Derivative orders greater than one are not supported!")
         wXi = scipy.zeros_like(Xi)
@@ -496,6 +564,10 @@ class WarpedKernel(Kernel):
         for d in xrange(0, self.num_dim):
             wXi[:, d] = self.w(Xi[:, d], d, 0)
             wXj[:, d] = self.w(Xj[:, d], d, 0)
+        if hyper_deriv is not None and hyper_deriv >= self.k.num_params:
+            return self._compute_warp_hyper_deriv(
+                Xi, Xj, wXi, wXj, ni, nj, hyper_deriv - self.k.num_params
+            )
         out = self.k(wXi, wXj, ni, nj, hyper_deriv=hyper_deriv, symmetric=symmetric)
         for d in xrange(0, self.num_dim):
             first_deriv_mask_i = ni[:, d] == 1
@@ -504,6 +576,97 @@ class WarpedKernel(Kernel):
             out[first_deriv_mask_j] *= self.w(Xj[first_deriv_mask_j, d], d, 1)
         return out
     
+    def _compute_warp_hyper_deriv(self, Xi, Xj, wXi, wXj, ni, nj, p):
+        r"""Evaluate the derivative of the covariance with respect to a parameter of the warping.
+        
+        The covariance is :math:`k(w(X_i), w(X_j))` times a factor of
+        :math:`w'` for each derivative observation, so the derivative with
+        respect to the warping parameter :math:`p` is
+        
+        .. math::
+            
+            \sum_d\left(\frac{\partial k}{\partial w_{i,d}}\frac{\partial w_{i,d}}{\partial p} + \frac{\partial k}{\partial w_{j,d}}\frac{\partial w_{j,d}}{\partial p}\right)\prod w' + k\frac{\partial}{\partial p}\prod w'
+        
+        Dimensions whose warping does not depend on :math:`p` are skipped. If
+        :py:attr:`k` is itself a :py:class:`WarpedKernel` it cannot provide the
+        second derivatives needed for derivative observations, so a central
+        difference is used in that case.
+        
+        Parameters
+        ----------
+        Xi : :py:class:`Matrix`, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        Xj : :py:class:`Matrix`, (`M`, `D`)
+            `M` inputs with dimension `D`.
+        wXi : :py:class:`Matrix`, (`M`, `D`)
+            The warped values of `Xi`.
+        wXj : :py:class:`Matrix`, (`M`, `D`)
+            The warped values of `Xj`.
+        ni : :py:class:`Matrix`, (`M`, `D`)
+            `M` derivative orders for set `i`.
+        nj : :py:class:`Matrix`, (`M`, `D`)
+            `M` derivative orders for set `j`.
+        p : non-negative int
+            The index of the parameter of :py:attr:`w` to differentiate with
+            respect to.
+        
+        Returns
+        -------
+        dKij : :py:class:`Array`, (`M`,)
+            Derivatives of the covariances for each of the `M` `Xi`, `Xj` pairs.
+        """
+        ni = scipy.asarray(ni, dtype=int)
+        nj = scipy.asarray(nj, dtype=int)
+        if isinstance(self.k, WarpedKernel) and ((ni > 0).any() or (nj > 0).any()):
+            # Perturb copies of the warping so the kernel itself is unchanged:
+            h_plus, h_minus = self.w._hyper_deriv_steps(p)
+            values = []
+            for step in (h_plus, -h_minus):
+                k = copy.copy(self)
+                k.w = copy.copy(self.w)
+                k.w.params = scipy.array(self.w.params, dtype=float)
+                k.w.params[p] += step
+                values.append(k(Xi, Xj, ni, nj))
+            return (values[0] - values[1]) / (h_plus + h_minus)
+        # The factors of w' for the derivative observations, and their
+        # derivatives with respect to p:
+        fac_i = scipy.ones_like(wXi)
+        fac_j = scipy.ones_like(wXj)
+        dfac_i = scipy.zeros_like(wXi)
+        dfac_j = scipy.zeros_like(wXj)
+        for d in xrange(0, self.num_dim):
+            mask_i = ni[:, d] == 1
+            mask_j = nj[:, d] == 1
+            fac_i[mask_i, d] = self.w(Xi[mask_i, d], d, 1)
+            fac_j[mask_j, d] = self.w(Xj[mask_j, d], d, 1)
+            dfac_i[mask_i, d] = self.w(Xi[mask_i, d], d, 1, hyper_deriv=p)
+            dfac_j[mask_j, d] = self.w(Xj[mask_j, d], d, 1, hyper_deriv=p)
+        fac = fac_i.prod(axis=1) * fac_j.prod(axis=1)
+        
+        out = scipy.zeros(Xi.shape[0], dtype=float)
+        k = None
+        for d in xrange(0, self.num_dim):
+            dwXi = self.w(Xi[:, d], d, 0, hyper_deriv=p)
+            dwXj = self.w(Xj[:, d], d, 0, hyper_deriv=p)
+            if (dwXi != 0).any() or (dwXj != 0).any():
+                e_d = scipy.zeros_like(ni)
+                e_d[:, d] = 1
+                out += self.k(wXi, wXj, ni + e_d, nj) * dwXi * fac
+                out += self.k(wXi, wXj, ni, nj + e_d) * dwXj * fac
+            if (dfac_i[:, d] != 0).any() or (dfac_j[:, d] != 0).any():
+                # Product rule for the factors of w', one at a time:
+                if k is None:
+                    k = self.k(wXi, wXj, ni, nj)
+                fac_di = fac_i.copy()
+                fac_di[:, d] = dfac_i[:, d]
+                fac_dj = fac_j.copy()
+                fac_dj[:, d] = dfac_j[:, d]
+                out += k * (
+                    fac_di.prod(axis=1) * fac_j.prod(axis=1) * (ni[:, d] == 1) +
+                    fac_i.prod(axis=1) * fac_dj.prod(axis=1) * (nj[:, d] == 1)
+                )
+        return out
+    
     def w_func(self, X, d, n):
         """Evaluate the (possibly recursive) warping function and its derivatives.
         
@@ -1394,6 +1394,34 @@ def fixed_poch(a, n):
     terms = [a + k for k in range(0, n)]
     return scipy.prod(terms)
 
+def cholupdate(L, x):
+    r"""Perform a rank-one update of a lower-triangular Cholesky factor in place.
+    
+    Given :math:`A = LL^T`, finds the Cholesky factor of :math:`A + xx^T` in
+    :math:`O(N^2)` operations using Givens-like rotations.
+    
+    Parameters
+    ----------
+    L : array, (`N`, `N`)
+        The lower-triangular Cholesky factor. It is overwritten with the
+        updated factor.
+    x : array, (`N`,)
+        The update vector. It is overwritten.
+    
+    Returns
+    -------
+    L : array, (`N`, `N`)
+        The updated Cholesky factor.
+    """
+    for k in xrange(0, len(x)):
+        r = scipy.sqrt(L[k, k]**2 + x[k]**2)
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        L[k + 1:, k] = (L[k + 1:, k] + s * x[k + 1:]) / c
+        x[k + 1:] = c * x[k + 1:] - s * L[k + 1:, k]
+    return L
+
 def Kn2Der(nu, y, n=0):
     r"""Find the derivatives of :math:`K_\nu(y^{1/2})`.
     
@@ -1694,7 +1722,8 @@ def unique_rows(arr, return_index=False, return_inverse=False):
         dum = out[0]
         idx = out[1]
         if return_inverse:
-            inv = out[2]
+            # Some versions of numpy return this with the shape of b:
+            inv = out[2].ravel()
     except TypeError:
         if return_inverse:
             raise RuntimeError(
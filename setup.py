@@ -14,6 +14,18 @@ _matern = Extension(
     include_dirs=[numpy.get_include(), 'gptools/kernel/include']
 )
 
+_squared_exponential = Extension(
+    "gptools.kernel._squared_exponential",
+    ["gptools/kernel/_squared_exponential.pyx", "gptools/kernel/src/squared_exponential.c"],
+    include_dirs=[numpy.get_include(), 'gptools/kernel/include']
+)
+
+_gibbs = Extension(
+    "gptools.kernel._gibbs",
+    ["gptools/kernel/_gibbs.pyx", "gptools/kernel/src/gibbs.c"],
+    include_dirs=[numpy.get_include(), 'gptools/kernel/include']
+)
+
 setup(
     name='gptools',
     version='0.2.3',
@@ -25,7 +37,11 @@ setup(
     description='Gaussian process regression with derivative constraints and predictions.',
     long_description=open('README.rst', 'r').read(),
     cmdclass={'build_ext': build_ext},
-    ext_modules = [_matern],
+    ext_modules = [_matern, _squared_exponential, _gibbs],
     license='GPL',
-    headers=['gptools/kernel/include/matern.h']
+    headers=[
+        'gptools/kernel/include/matern.h',
+        'gptools/kernel/include/squared_exponential.h',
+        'gptools/kernel/include/gibbs.h'
+    ]
 )
\ No newline at end of file
@@ -0,0 +1,598 @@
+import numpy as np
+import gptools
+
+def _make_derivative_data():
+    X = np.random.RandomState(0).randn(8, 2)
+    # Each point is either a value or a first derivative in one dimension:
+    n = np.array([[0, 0], [1, 0], [0, 1]])[np.random.RandomState(1).randint(0, 3, size=len(X))]
+    return X, n
+
+def test_symmetric_compute_Kij():
+    # The symmetric path only evaluates the upper triangle, so it must agree
+    # with the explicit evaluation of all pairs, including derivatives.
+    X, n = _make_derivative_data()
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k)
+
+    K_sym = gp.compute_Kij(X, None, n, None)
+    K_full = gp.compute_Kij(X, X, n, n)
+
+    np.testing.assert_array_almost_equal(K_sym, K_full, decimal=12)
+    np.testing.assert_array_equal(K_sym, K_sym.T)
+
+def test_pairwise_matches_flat():
+    # The native pairwise implementations must agree with the tiled fallback.
+    X, n = _make_derivative_data()
+    Xstar = np.random.RandomState(2).randn(5, 2)
+    nstar = np.array([[0, 0], [1, 0], [0, 1]])[np.random.RandomState(3).randint(0, 3, size=len(Xstar))]
+    for k in [
+        gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2]),
+        gptools.RationalQuadraticKernel(num_dim=2, initial_params=[1.5, 2.0, 0.7, 1.2]),
+        gptools.Matern52Kernel(num_dim=2, initial_params=[1.5, 0.7, 1.2]),
+    ]:
+        K_pairwise = k.pairwise(X, Xstar, n, nstar)
+        K_flat = gptools.Kernel.pairwise(k, X, Xstar, n, nstar)
+        np.testing.assert_array_almost_equal(K_pairwise, K_flat, decimal=12)
+
+def test_max_bytes():
+    # Blockwise assembly must give the same results as the unblocked path,
+    # including for derivative observations and transformed data.
+    X, n = _make_derivative_data()
+    Xstar = np.random.RandomState(2).randn(7, 2)
+    nstar = np.array([[0, 0], [1, 0], [0, 1]])[np.random.RandomState(3).randint(0, 3, size=len(Xstar))]
+    y = np.random.RandomState(4).randn(len(X))
+    T = np.random.RandomState(5).rand(3, len(X))
+    gps = []
+    for max_bytes in [None, 2000]:
+        k = gptools.SquaredExponentialKernel(num_dim=2, param_bounds=[(0, 10)] * 3)
+        gp = gptools.GaussianProcess(k, max_bytes=max_bytes, use_hyper_deriv=True)
+        gp.add_data(X, y[:3], err_y=0.1, T=T)
+        gp.add_data(Xstar, y[:len(Xstar)], err_y=0.2, n=nstar)
+        gp.update_hyperparameters([1.5, 0.7, 1.2])
+        gps.append(gp)
+    gp, gp_blocked = gps
+    # There must actually be several blocks:
+    assert gp_blocked._compute_block_size(2) < len(gp.X) / 2
+    np.testing.assert_allclose(
+        gp_blocked.compute_Kij(X, None, n, None),
+        gp.compute_Kij(X, None, n, None),
+        rtol=1e-14
+    )
+    np.testing.assert_allclose(
+        gp_blocked.compute_Kij(X, Xstar, n, nstar),
+        gp.compute_Kij(X, Xstar, n, nstar),
+        rtol=1e-14
+    )
+    np.testing.assert_allclose(gp_blocked.K, gp.K, rtol=1e-14)
+    np.testing.assert_allclose(gp_blocked.ll, gp.ll, rtol=1e-12)
+    np.testing.assert_allclose(gp_blocked.ll_deriv, gp.ll_deriv, rtol=1e-10)
+
+def test_training_geometry_cache():
+    # The pair geometry is reused between hyperparameter updates and must be
+    # rebuilt whenever the training data change.
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    def check(gp):
+        # The cached geometry must give the same ll as a fresh instance:
+        gp_new = gptools.GaussianProcess(k)
+        gp_new.add_data(gp.X, gp.y, err_y=gp.err_y, n=gp.n, T=gp.T)
+        np.testing.assert_allclose(
+            gp.update_hyperparameters([1.3, 0.8, 1.1]),
+            gp_new.update_hyperparameters([1.3, 0.8, 1.1])
+        )
+        triu_i, triu_j, chunks = gp._K_geometry[1]
+        assert len(triu_i) == len(gp.X) * (len(gp.X) + 1) // 2
+        # Only the indices are held, not the pairs themselves:
+        for start, stop, groups in chunks:
+            assert not isinstance(groups, gptools.PairGeometry)
+            assert sum(np.size(idx) for state, idx in groups if not isinstance(idx, slice)) <= stop - start
+        return gp._K_geometry
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(X[:6], y[:6], err_y=0.1, n=n[:6])
+    geometry = check(gp)
+    gp.update_hyperparameters([1.4, 0.6, 1.0])
+    assert gp._K_geometry is geometry
+    gp.add_data(X[6:], y[6:], err_y=0.1, n=n[6:])
+    assert gp._K_geometry is None
+    geometry = check(gp)
+    gp.remove_data([0, 3])
+    assert gp._K_geometry is None
+    geometry = check(gp)
+    gp.add_data(gp.X[:2], [0.1, 0.2], err_y=0.1, n=gp.n[:2])
+    check(gp)
+    gp.condense_duplicates()
+    assert gp._K_geometry is None
+    geometry = check(gp)
+    # The geometry is split for the number of threads:
+    gp.num_threads = 2
+    assert check(gp) is not geometry
+    # It is not held at all when the memory is bounded:
+    gp.max_bytes = 2000
+    gp.add_data([[0.3, 0.4]], [0.5], err_y=0.1)
+    gp.update_hyperparameters([1.3, 0.8, 1.1])
+    assert gp._K_geometry is None
+
+def test_factor_cache():
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k, factor_cache_bytes=10**6)
+    gp.add_data(X, y, err_y=0.1, n=n)
+    ll1 = gp.update_hyperparameters([1.3, 0.8, 1.1])
+    L1 = gp.L
+    ll2 = gp.update_hyperparameters([1.4, 0.8, 1.1])
+    assert ll1 != ll2
+    assert gp.update_hyperparameters([1.3, 0.8, 1.1]) == ll1
+    assert gp.L is L1
+    assert (gp.factor_cache_hits, gp.factor_cache_misses) == (1, 2)
+    # New data must invalidate the cache:
+    gp.add_data([[0.1, 0.2]], [0.3], err_y=0.1)
+    gp_new = gptools.GaussianProcess(k)
+    gp_new.add_data(gp.X, gp.y, err_y=gp.err_y, n=gp.n)
+    np.testing.assert_allclose(
+        gp.update_hyperparameters([1.3, 0.8, 1.1]),
+        gp_new.update_hyperparameters([1.3, 0.8, 1.1])
+    )
+
+def test_single_precision():
+    X = np.linspace(0, 10, 50)[:, None]
+    y = np.sin(X[:, 0])
+    ll = {}
+    for dtype in [float, np.float32]:
+        k = gptools.SquaredExponentialKernel(initial_params=[1.0, 1.0])
+        # Keep the (dtype-relative) jitter small compared to err_y**2:
+        gp = gptools.GaussianProcess(k, dtype=dtype, high_precision_ll=True, diag_factor=1.0)
+        gp.add_data(X, y, err_y=0.05)
+        ll[dtype] = gp.update_hyperparameters([1.0, 1.0])
+        assert gp.K.dtype == dtype
+    np.testing.assert_allclose(ll[np.float32], ll[float], rtol=1e-4)
+
+def test_threaded_compute_Kij():
+    X, n = _make_derivative_data()
+    Xstar = np.random.RandomState(2).randn(5, 2)
+    nstar = np.zeros_like(Xstar, dtype=int)
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    for max_bytes in [None, 2000]:
+        gp_serial = gptools.GaussianProcess(k, max_bytes=max_bytes)
+        gp_threaded = gptools.GaussianProcess(k, max_bytes=max_bytes, num_threads=3)
+        np.testing.assert_array_equal(
+            gp_serial.compute_Kij(X, None, n, None),
+            gp_threaded.compute_Kij(X, None, n, None)
+        )
+        np.testing.assert_array_equal(
+            gp_serial.compute_Kij(X, Xstar, n, nstar),
+            gp_threaded.compute_Kij(X, Xstar, n, nstar)
+        )
+
+def test_thread_pool_reuse():
+    # One pool is kept per instance, and is neither copied nor pickled.
+    import gc
+    import pickle
+    import multiprocessing.pool
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k, num_threads=2)
+    gp.add_data(X, y, err_y=0.1, n=n)
+    assert gp._thread_pool is None
+    ll = gp.update_hyperparameters([1.3, 0.8, 1.1])
+    pool = gp._thread_pool[1]
+    gp.update_hyperparameters([1.4, 0.8, 1.1])
+    gp.compute_Kij(X, None, n, None)
+    assert gp._thread_pool[1] is pool
+    gp_copy = pickle.loads(pickle.dumps(gp))
+    assert gp_copy._thread_pool is None
+    assert gp._lean_copy()._thread_pool is None
+    np.testing.assert_allclose(gp_copy.update_hyperparameters([1.3, 0.8, 1.1]), ll)
+    assert gp_copy._thread_pool[1] is not pool
+    # Changing the number of threads replaces the pool:
+    gp.num_threads = 3
+    gp.update_hyperparameters([1.3, 0.8, 1.1])
+    assert gp._thread_pool[1] is not pool
+    assert pool._state != multiprocessing.pool.RUN
+    # The pool is closed along with the instance:
+    pool = gp._thread_pool[1]
+    del gp
+    gc.collect()
+    assert pool._state != multiprocessing.pool.RUN
+
+def test_add_data_cholesky_append():
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(X[:5], y[:5], err_y=0.1, n=n[:5])
+    gp.compute_K_L_alpha_ll()
+    gp.add_data(X[5:], y[5:], err_y=0.1, n=n[5:])
+    assert gp.K_up_to_date
+    gp_full = gptools.GaussianProcess(k)
+    gp_full.add_data(X, y, err_y=0.1, n=n)
+    gp_full.compute_K_L_alpha_ll()
+    np.testing.assert_allclose(gp.L, gp_full.L, atol=1e-12)
+    np.testing.assert_allclose(gp.alpha, gp_full.alpha, rtol=1e-8)
+    np.testing.assert_allclose(gp.ll, gp_full.ll)
+
+def test_remove_data_cholesky_downdate():
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(X, y, err_y=0.1, n=n)
+    gp.compute_K_L_alpha_ll()
+    X_bad, y_bad, err_y_bad, n_bad = gp.remove_data([1, 4, 5])
+    assert gp.K_up_to_date
+    np.testing.assert_array_equal(y_bad, y[[1, 4, 5]])
+    keep = [0, 2, 3, 6, 7]
+    gp_full = gptools.GaussianProcess(k)
+    gp_full.add_data(X[keep], y[keep], err_y=0.1, n=n[keep])
+    gp_full.compute_K_L_alpha_ll()
+    np.testing.assert_allclose(gp.L, gp_full.L, atol=1e-12)
+    np.testing.assert_allclose(gp.alpha, gp_full.alpha, rtol=1e-8)
+    np.testing.assert_allclose(gp.ll, gp_full.ll)
+
+def test_remove_outliers_T():
+    # With a transformation the mask must come before T_bad, as documented.
+    x = np.linspace(0, 4, 16)
+    T = np.kron(np.eye(8), [[0.5, 0.5]])
+    y = np.sin(x).dot(T.T)
+    y[2] += 5.0
+    k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.4])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(x, y, err_y=0.5, T=T)
+    X_bad, y_bad, err_y_bad, n_bad, bad_idxs, T_bad = gp.remove_outliers()
+    np.testing.assert_array_equal(bad_idxs, np.arange(8) == 2)
+    np.testing.assert_array_equal(y_bad, y[2:3])
+    np.testing.assert_array_equal(T_bad, [[0.5, 0.5]])
+    np.testing.assert_array_equal(X_bad[:, 0], x[4:6])
+    assert gp.T.shape == (7, 14)
+
+def test_loo_predict():
+    # The closed-form LOO predictions must match refitting without each point.
+    X = np.random.RandomState(0).rand(10, 1)
+    y = np.sin(5 * X[:, 0])
+    k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.3])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(X, y, err_y=0.1)
+    mean, var, lpd = gp.loo_predict()
+    for i in [0, 5]:
+        keep = np.arange(len(y)) != i
+        gp_i = gptools.GaussianProcess(k)
+        gp_i.add_data(X[keep], y[keep], err_y=0.1)
+        mean_i, std_i = gp_i.predict(X[i:i + 1])
+        np.testing.assert_allclose(mean[i], mean_i[0])
+        np.testing.assert_allclose(var[i], std_i[0]**2 + 0.1**2)
+
+def test_sparse_T():
+    # Sparse and dense transformation matrices must give the same results.
+    import scipy.sparse
+    x = np.linspace(0, 1, 6)
+    ll = []
+    mean = []
+    for sparse in [False, True]:
+        k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.4])
+        gp = gptools.GaussianProcess(k)
+        gp.add_data(x, np.sin(x), err_y=0.05)
+        for a, b in [(0.0, 0.5), (0.2, 0.9)]:
+            x_q = np.linspace(a, b, 5)
+            T = np.full((1, 5), (b - a) / 4.0)
+            T[0, [0, -1]] /= 2.0
+            if sparse:
+                T = scipy.sparse.csr_matrix(T)
+            gp.add_data(x_q, [np.cos(a) - np.cos(b)], err_y=0.02, T=T)
+        gp.condense_duplicates()
+        assert scipy.sparse.issparse(gp.T) == sparse
+        ll.append(gp.update_hyperparameters([1.0, 0.4]))
+        mean.append(gp.predict(x, return_std=False))
+    np.testing.assert_allclose(ll[0], ll[1])
+    np.testing.assert_allclose(mean[0], mean[1])
+
+def test_condense():
+    # Condensing as the data arrive must match condensing afterwards.
+    x = np.array([0.0, 0.5, 0.5, 1.0])
+    T = np.array([[1.0, 0.5, 0.0, 0.0], [0.0, 0.25, 0.25, 0.5]])
+    k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.4])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(x, [0.1, 0.2], err_y=0.05, T=T)
+    gp.add_data([0.5, 0.2], [0.3, 0.4], err_y=0.05)
+    gp.condense_duplicates()
+    gp_stream = gptools.GaussianProcess(k)
+    gp_stream.add_data(x, [0.1, 0.2], err_y=0.05, T=T, condense=True)
+    gp_stream.add_data([0.5, 0.2], [0.3, 0.4], err_y=0.05, condense=True)
+    assert len(gp_stream.X) == 4
+    np.testing.assert_allclose(
+        gp_stream.T[:, np.argsort(gp_stream.X[:, 0])],
+        gp.T[:, np.argsort(gp.X[:, 0])]
+    )
+    np.testing.assert_allclose(
+        gp_stream.update_hyperparameters([1.0, 0.4]),
+        gp.update_hyperparameters([1.0, 0.4])
+    )
+
+def test_condense_stream_sparse():
+    # Condensing plain points as they arrive must not create a dense T.
+    import scipy.sparse
+    x = np.linspace(0, 1, 200)
+    k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.4])
+    gp = gptools.GaussianProcess(k)
+    gp_dense = gptools.GaussianProcess(k)
+    for i in range(3):
+        y = np.sin(x) + 0.01 * i
+        gp.add_data(x, y, err_y=0.05, condense=True)
+        gp_dense.add_data(x, y, err_y=0.05)
+        assert scipy.sparse.issparse(gp.T)
+    assert gp.T.shape == (600, 200)
+    gp_dense.condense_duplicates()
+    assert scipy.sparse.issparse(gp_dense.T)
+    np.testing.assert_allclose(
+        gp.update_hyperparameters([1.0, 0.4]),
+        gp_dense.update_hyperparameters([1.0, 0.4])
+    )
+
+def test_in_place_factorization():
+    # Factoring K_tot in place must leave K and noise_K untouched.
+    import warnings
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    T = np.random.RandomState(5).rand(3, len(X))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        noise_se = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[0.3, 0.5, 0.5])
+        for noise_k, noise_K in [
+            (None, np.zeros((len(X), len(X)))),
+            (gptools.DiagonalNoiseKernel(num_dim=2, initial_noise=0.2), 0.2**2 * np.eye(len(X))),
+            (noise_se, gptools.GaussianProcess(noise_se).compute_Kij(X, None, n, None)),
+        ]:
+            for T_i in [None, T]:
+                k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+                gp = gptools.GaussianProcess(k, noise_k=noise_k)
+                if T_i is None:
+                    gp.add_data(X, y, err_y=0.1, n=n)
+                else:
+                    gp.add_data(X, y[:3], err_y=0.1, n=n, T=T_i)
+                gp.compute_K_L_alpha_ll()
+                np.testing.assert_array_equal(gp.K, gp.compute_Kij(X, None, n, None))
+                np.testing.assert_array_equal(gp.noise_K, noise_K)
+
+def test_single_precision_retry():
+    # A factorization which fails in single precision is redone in double
+    # precision, giving the same ll and counting one cache miss.
+    import warnings
+    x = np.linspace(0, 1, 30)
+    ll = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for dtype in [float, np.float32]:
+            k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.5])
+            gp = gptools.GaussianProcess(
+                k, dtype=dtype, factor_cache_bytes=10**7, diag_factor=1.0
+            )
+            gp.add_data(x, np.sin(x), err_y=1e-5)
+            ll[dtype] = gp.update_hyperparameters([1.0, 0.5])
+            assert gp.L.dtype == float
+            assert (gp.factor_cache_hits, gp.factor_cache_misses) == (0, 1)
+            assert gp.dtype == dtype
+    assert ll[np.float32] == ll[float]
+
+def test_predict_std_diagonal():
+    # The variance-only path must match the diagonal of the full covariance.
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.Matern52Kernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    noise_k = gptools.DiagonalNoiseKernel(num_dim=2, initial_noise=0.2)
+    gp = gptools.GaussianProcess(k, noise_k=noise_k)
+    gp.add_data(X, y, err_y=0.1, n=n)
+    for noise in [False, True]:
+        mean, std = gp.predict(X, n=n, noise=noise)
+        mean_cov, cov = gp.predict(X, n=n, noise=noise, return_cov=True)
+        np.testing.assert_allclose(mean, mean_cov)
+        np.testing.assert_allclose(std, np.sqrt(np.diag(cov)), atol=1e-12)
+
+def test_freeze():
+    import pickle
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k, mu=gptools.LinearMeanFunction(num_dim=2))
+    gp.add_data(X, y, err_y=0.1, n=n)
+    frozen = pickle.loads(pickle.dumps(gp.freeze()))
+    Xstar = np.random.RandomState(2).randn(5, 2)
+    mean, std = gp.predict(Xstar)
+    mean_frozen, std_frozen = frozen.predict(Xstar)
+    np.testing.assert_allclose(mean_frozen, mean)
+    np.testing.assert_allclose(std_frozen, std)
+    # Changing the GP must not affect the frozen predictor:
+    gp.update_hyperparameters([1.0, 0.5, 0.5, 0.1, 0.1, 0.1])
+    np.testing.assert_allclose(frozen.mean(Xstar), mean)
+
+def test_concurrent_predict():
+    import copy
+    import pickle
+    import threading
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(X, y, err_y=0.1, n=n)
+    Xstar = np.random.RandomState(2).randn(50, 2)
+    gp_ref = pickle.loads(pickle.dumps(copy.deepcopy(gp)))
+    mean_ref, std_ref = gp_ref.predict(Xstar)
+    # The first calls race to compute the factorization:
+    results = [None] * 4
+    def worker(i):
+        results[i] = gp.predict(Xstar)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(results))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for mean, std in results:
+        np.testing.assert_allclose(mean, mean_ref)
+        np.testing.assert_allclose(std, std_ref)
+
+def test_posterior_sampler():
+    # Samples are linear in the random variables, so drawing with the identity
+    # gives a square root of the posterior covariance.
+    x = np.linspace(0, 1, 6)
+    T = np.array([[0.5, 0.5, 0.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.25, 0.25, 0.25, 0.25]])
+    k = gptools.SquaredExponentialKernel(initial_params=[1.0, 0.4])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(x, np.sin(x), err_y=0.1)
+    gp.add_data(x, [0.2, 0.7], err_y=0.05, T=T)
+    gp.add_data([0.3, 0.6], [0.9, 0.8], err_y=0.1, n=1)
+    Xstar = np.linspace(-0.2, 1.2, 7)
+    nstar = [0, 1, 0, 0, 1, 0, 0]
+    mean, cov = gp.predict(Xstar, n=nstar, return_cov=True)
+    np.random.seed(0)
+    # The pathwise samples use an approximate (random Fourier feature) prior:
+    for method, atol in [('cholesky', 1e-8), ('pathwise', 0.05)]:
+        sampler = gp.posterior_sampler(Xstar, n=nstar, method=method, num_features=2000)
+        np.testing.assert_allclose(sampler.mean, mean)
+        A = sampler.draw(rand_vars=np.eye(sampler.num_rand_vars)) - mean[:, None]
+        np.testing.assert_allclose(A.dot(A.T), cov, atol=atol)
+        chunks = list(sampler.iter_draws(25, chunk_size=10))
+        assert [c.shape for c in chunks] == [(7, 10), (7, 10), (7, 5)]
+    np.testing.assert_raises(
+        ValueError, gp.posterior_sampler, Xstar, method='pathwise', noise=True
+    )
+
+def _check_ll_deriv(make_gp, params, h=1e-6, rtol=1e-5):
+    # Compare the analytic gradient of the log-likelihood to central differences.
+    gp = make_gp(True)
+    gp.update_hyperparameters(params)
+    ll_deriv_fd = []
+    for i in range(len(params)):
+        ll = []
+        for step in [h, -h]:
+            p = np.array(params, dtype=float)
+            p[i] += step
+            gp_fd = make_gp(False)
+            gp_fd.update_hyperparameters(p)
+            ll.append(gp_fd.ll)
+        ll_deriv_fd.append((ll[0] - ll[1]) / (2.0 * h))
+    np.testing.assert_allclose(gp.ll_deriv, ll_deriv_fd, rtol=rtol, atol=1e-6)
+
+def test_ll_deriv():
+    import warnings
+    X, n = _make_derivative_data()
+    y = np.random.RandomState(4).randn(len(X))
+    T = np.random.RandomState(5).rand(3, len(X))
+    def make_gp(use_hyper_deriv, noise, T):
+        k = gptools.SquaredExponentialKernel(num_dim=2, param_bounds=[(0, 10)] * 3)
+        if noise:
+            noise_k = gptools.DiagonalNoiseKernel(num_dim=2, fixed_noise=False, noise_bound=(0, 5))
+        else:
+            noise_k = None
+        gp = gptools.GaussianProcess(k, noise_k=noise_k, use_hyper_deriv=use_hyper_deriv)
+        if T is None:
+            gp.add_data(X, y, err_y=0.1, n=n)
+        else:
+            gp.add_data(X, y[:len(T)], err_y=0.1, T=T)
+        return gp
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        _check_ll_deriv(lambda d: make_gp(d, False, None), [1.5, 0.7, 1.2])
+        _check_ll_deriv(lambda d: make_gp(d, True, T), [1.5, 0.7, 1.2, 0.3])
+
+def test_ll_deriv_composite():
+    import warnings
+    X = np.random.RandomState(5).rand(7, 2)
+    n = np.array([[0, 0], [1, 0], [0, 1]])[np.random.RandomState(6).randint(0, 3, size=len(X))]
+    y = np.random.RandomState(4).randn(len(X))
+    def make_gp(use_hyper_deriv, kernel):
+        gp = gptools.GaussianProcess(kernel(), use_hyper_deriv=use_hyper_deriv)
+        gp.add_data(X, y, err_y=0.1, n=n)
+        return gp
+    def product():
+        k1 = gptools.SquaredExponentialKernel(num_dim=2, param_bounds=[(0, 10)] * 3)
+        k2 = gptools.MaskedKernel(
+            gptools.Matern52Kernel(param_bounds=[(0, 10)] * 2), total_dim=2, mask=[1]
+        )
+        return k1 * k2
+    def warped():
+        return gptools.BetaWarpedKernel(
+            gptools.SquaredExponentialKernel(num_dim=2, param_bounds=[(0, 10)] * 3)
+        )
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        _check_ll_deriv(lambda d: make_gp(d, product), [1.5, 0.7, 1.2, 0.8, 0.6])
+        _check_ll_deriv(lambda d: make_gp(d, warped), [1.5, 0.7, 1.2, 1.3, 0.8, 2.0, 1.5])
+
+def test_optimize_pool():
+    import multiprocessing
+    import pickle
+    x = np.linspace(0, 5, 50)
+    def make_gp():
+        k = gptools.SquaredExponentialKernel(param_bounds=[(0.1, 5), (0.1, 5)])
+        gp = gptools.GaussianProcess(k, use_hyper_deriv=True)
+        gp.add_data(x, np.sin(x), err_y=0.1)
+        return gp
+    gp = make_gp()
+    gp.compute_K_L_alpha_ll()
+    # The copy sent to the workers must not carry the covariance matrices:
+    assert 'K' not in gp._lean_copy().__dict__
+    assert len(pickle.dumps(gp._lean_copy())) < len(pickle.dumps(gp.K))
+    assert gp.K_up_to_date
+    x_opt = []
+    for kwargs in [{'num_proc': 0}, {'num_proc': 2}, {'pool': multiprocessing.Pool(2)}]:
+        np.random.seed(0)
+        gp = make_gp()
+        res, num_starts = gp.optimize_hyperparameters(random_starts=3, **kwargs)
+        assert num_starts == 3
+        x_opt.append(res.x)
+        if 'pool' in kwargs:
+            kwargs['pool'].close()
+    np.testing.assert_allclose(x_opt[1], x_opt[0])
+    np.testing.assert_allclose(x_opt[2], x_opt[0])
+    # A pool reused for a new fit must pick up the new data:
+    pool = multiprocessing.Pool(2)
+    for y in [np.sin(x), np.cos(3 * x)]:
+        x_pool = []
+        for kwargs in [{'num_proc': 0}, {'pool': pool}]:
+            np.random.seed(1)
+            gp = make_gp()
+            gp.y = y
+            x_pool.append(gp.optimize_hyperparameters(random_starts=4, **kwargs)[0].x)
+        np.testing.assert_allclose(x_pool[1], x_pool[0])
+    pool.close()
+    np.testing.assert_allclose(x_opt[2], x_opt[0])
+
+def test_optimize_race():
+    x = np.linspace(0, 5, 50)
+    results = []
+    for race_margin in [None, 5.0]:
+        np.random.seed(1)
+        k = gptools.SquaredExponentialKernel(param_bounds=[(0.01, 10), (0.01, 10)])
+        gp = gptools.GaussianProcess(k, use_hyper_deriv=True)
+        gp.add_data(x, np.sin(3 * x), err_y=0.05)
+        results.append(gp.optimize_hyperparameters(
+            random_starts=8, num_proc=0, race_margin=race_margin, race_iter=2
+        ))
+    (res_full, num_full), (res_race, num_race) = results
+    # Cancelled starts are not counted, but the best start must survive:
+    assert num_full == 8
+    assert num_race < num_full
+    np.testing.assert_allclose(res_race.fun, res_full.fun, rtol=1e-6)
+
+def test_optimize_race_failed_start():
+    # A start which fails after some iterations must not publish its value.
+    import threading
+    from gptools.gaussian_process import _RaceState, _OptimizeHyperparametersEval
+    x = np.linspace(0, 5, 50)
+    k = gptools.SquaredExponentialKernel(param_bounds=[(0.01, 10), (0.01, 10)])
+    gp = gptools.GaussianProcess(k, use_hyper_deriv=True)
+    gp.add_data(x, np.sin(3 * x), err_y=0.05)
+    class Best(object):
+        value = np.inf
+    race = _RaceState(5.0, 2, Best(), threading.Lock())
+    def fail(xk):
+        if gp.free_params[0] < 5.0:
+            raise ValueError("failed start")
+    opt_kwargs = {'method': 'SLSQP', 'jac': True, 'bounds': gp.free_param_bounds}
+    opt_eval = _OptimizeHyperparametersEval(gp, dict(opt_kwargs, callback=fail), race=race)
+    assert opt_eval(np.array([8.0, 1.0])) is None
+    assert race.best.value == np.inf
+    res = _OptimizeHyperparametersEval(gp, opt_kwargs, race=race)(np.array([8.0, 1.0]))
+    assert race.best.value == res.fun
+    race.reset()
+    assert race.best.value == np.inf
@@ -0,0 +1,42 @@
+import numpy as np
+import gptools
+import gptools.kernel.gibbs as gibbs
+from nose import SkipTest
+
+def test_compiled_gibbs():
+    # The compiled Gibbs kernel must agree with the NumPy implementation for
+    # all of the supported derivative orders.
+    if gibbs._gibbs1d is None:
+        raise SkipTest("The compiled Gibbs kernel has not been built.")
+    X = np.linspace(-1, 1, 7)[:, None]
+    k = gptools.GibbsKernel1dTanh(initial_params=[1.0, 1.0, 0.5, 0.3, 0.1])
+    gp = gptools.GaussianProcess(k)
+    gp.add_data(X, np.sin(X[:, 0]))
+    gp.add_data(X[:3], np.cos(X[:3, 0]), n=1)
+    K_compiled = gp.compute_Kij(gp.X, None, gp.n, None)
+    _gibbs1d = gibbs._gibbs1d
+    try:
+        gibbs._gibbs1d = None
+        K_python = gp.compute_Kij(gp.X, None, gp.n, None)
+    finally:
+        gibbs._gibbs1d = _gibbs1d
+    np.testing.assert_allclose(K_compiled, K_python, rtol=1e-12, atol=1e-14)
+
+def test_hyper_deriv():
+    # The chain rule derivatives must agree with central differences.
+    X = np.random.RandomState(0).randn(7, 1)
+    X[3] = X[1]
+    n = np.random.RandomState(1).randint(0, 2, size=(7, 1))
+    i, j = [idx.ravel() for idx in np.meshgrid(range(len(X)), range(len(X)))]
+    h = 1e-6
+    k = gptools.GibbsKernel1dTanh(initial_params=[1.3, 1.0, 0.5, 0.3, 0.1])
+    params = np.array(k.params, dtype=float)
+    for p in range(len(params)):
+        dK = k(X[i], X[j], n[i], n[j], hyper_deriv=p)
+        K = []
+        for step in [h, -h]:
+            k.params = params.copy()
+            k.params[p] += step
+            K.append(k(X[i], X[j], n[i], n[j]))
+        k.params = params
+        np.testing.assert_allclose(dK, (K[0] - K[1]) / (2.0 * h), atol=1e-6)
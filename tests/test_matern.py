@@ -29,3 +29,78 @@ def test_matern_52():
     k2 = gp2.compute_Kij(gp1.X, None, gp1.n, None)
 
     np.testing.assert_array_almost_equal(k1, k2, decimal=8)
+
+def test_hyper_deriv():
+    # The hyperparameter derivatives must agree with central differences.
+    X = np.random.RandomState(0).randn(6, 2)
+    n = np.array([[0, 0], [1, 0], [0, 1]])[np.random.RandomState(1).randint(0, 3, size=len(X))]
+    i, j = [idx.ravel() for idx in np.meshgrid(range(len(X)), range(len(X)))]
+    h = 1e-6
+    for k in [
+        gptools.Matern52Kernel(num_dim=2, initial_params=[1.5, 0.7, 1.2]),
+        gptools.MaternKernel(num_dim=2, initial_params=[1.5, 3.5, 0.7, 1.2]),
+        gptools.RationalQuadraticKernel(num_dim=2, initial_params=[1.5, 2.0, 0.7, 1.2]),
+    ]:
+        params = np.array(k.params, dtype=float)
+        for p in range(len(params)):
+            dK = k(X[i], X[j], n[i], n[j], hyper_deriv=p)
+            K = []
+            for step in [h, -h]:
+                k.params = params.copy()
+                k.params[p] += step
+                K.append(k(X[i], X[j], n[i], n[j]))
+            k.params = params
+            np.testing.assert_allclose(dK, (K[0] - K[1]) / (2.0 * h), atol=1e-6)
+
+def test_hyper_deriv_1d():
+    # Includes coincident points, where the length scale derivative is a limit.
+    X = np.random.RandomState(0).randn(6, 1)
+    X[3] = X[1]
+    n = np.random.RandomState(1).randint(0, 2, size=(6, 1))
+    i, j = [idx.ravel() for idx in np.meshgrid(range(len(X)), range(len(X)))]
+    h = 1e-6
+    k = gptools.MaternKernel1d(initial_params=[1.5, 2.7, 0.8])
+    params = np.array(k.params, dtype=float)
+    for p in range(len(params)):
+        dK = k(X[i], X[j], n[i], n[j], hyper_deriv=p)
+        K = []
+        for step in [h, -h]:
+            k.params = params.copy()
+            k.params[p] += step
+            K.append(k(X[i], X[j], n[i], n[j]))
+        k.params = params
+        np.testing.assert_allclose(dK, (K[0] - K[1]) / (2.0 * h), atol=1e-6)
+
+def test_hyper_deriv_bounds():
+    # Finite differences must not step outside of the bounds.
+    k = gptools.MaternKernel(
+        num_dim=1, initial_params=[1.0, 1.5, 1.0],
+        param_bounds=[(0.0, 10.0), (1.5, 10.0), (0.0, 10.0)]
+    )
+    np.testing.assert_allclose(k._hyper_deriv_steps(1), [1.5e-5, 0.0])
+    k.params[1] = 10.0
+    np.testing.assert_allclose(k._hyper_deriv_steps(1), [0.0, 1e-4])
+
+def test_rq_alpha_deriv():
+    # The closed form alpha derivative used without derivative observations.
+    X = np.random.RandomState(0).randn(6, 2)
+    n = np.zeros_like(X, dtype=int)
+    i, j = [idx.ravel() for idx in np.meshgrid(range(len(X)), range(len(X)))]
+    h = 1e-6
+    k = gptools.RationalQuadraticKernel(num_dim=2, initial_params=[1.5, 2.0, 0.7, 1.2])
+    dK = k(X[i], X[j], n[i], n[j], hyper_deriv=1)
+    K = []
+    for alpha in [2.0 + h, 2.0 - h]:
+        k.params[1] = alpha
+        K.append(k(X[i], X[j], n[i], n[j]))
+    np.testing.assert_allclose(dK, (K[0] - K[1]) / (2.0 * h), atol=1e-6)
+
+def test_warping_hyper_deriv_bounds():
+    # The warping parameter derivatives must not step outside of the bounds.
+    w = gptools.kernel.warping.WarpingFunction(
+        lambda X, d, n, a: X**(a + 1) if n == 0 else (a + 1) * X**a,
+        num_dim=1, num_params=1, initial_params=[0.0], param_bounds=[(0.0, 1.0)]
+    )
+    X = np.linspace(0.5, 2.0, 5)
+    np.testing.assert_allclose(w._hyper_deriv_steps(0), [1e-5, 0.0])
+    np.testing.assert_allclose(w(X, 0, 0, hyper_deriv=0), X * np.log(X), rtol=1e-4)
@@ -0,0 +1,47 @@
+import numpy as np
+import gptools
+from nose import SkipTest
+
+def test_compiled_squared_exponential():
+    # The compiled SE kernel must agree with the NumPy implementation,
+    # including higher-order and hyperparameter derivatives.
+    import gptools.kernel.squared_exponential as se
+    if se._squared_exponential is None:
+        raise SkipTest("The compiled squared exponential kernel has not been built.")
+    rs = np.random.RandomState(5)
+    X = rs.randn(10, 2)
+    n = rs.randint(0, 3, size=X.shape)
+    Xstar = rs.randn(4, 2)
+    nstar = rs.randint(0, 3, size=Xstar.shape)
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    for hyper_deriv in [None, 0, 1, 2]:
+        K_compiled = k.pairwise(X, Xstar, n, nstar, hyper_deriv=hyper_deriv)
+        K_python = k._pairwise_by_state(
+            lambda Xi_s, Xj_s, ni_state, nj_state: k._compute_pairwise_block(
+                Xi_s, Xj_s, ni_state, nj_state, hyper_deriv
+            ),
+            X, Xstar, n, nstar
+        )
+        np.testing.assert_allclose(K_compiled, K_python, rtol=1e-10, atol=1e-12)
+
+def test_hermite_fallback():
+    # Force the NumPy Hermite-table path and compare it with the compiled
+    # kernel for second, third and mixed derivatives.
+    import gptools.kernel.squared_exponential as se
+    if se._squared_exponential is None:
+        raise SkipTest("The compiled squared exponential kernel has not been built.")
+    rs = np.random.RandomState(6)
+    X = rs.randn(12, 2)
+    Xj = rs.randn(12, 2)
+    n = np.array([[2, 0], [0, 3], [1, 1], [2, 1], [0, 0], [1, 0]] * 2)
+    nj = np.array([[0, 2], [1, 1], [2, 0], [0, 0], [3, 0], [1, 2]] * 2)
+    k = gptools.SquaredExponentialKernel(num_dim=2, initial_params=[1.5, 0.7, 1.2])
+    K_compiled = [k(X, Xj, n, nj, hyper_deriv=h) for h in [None, 0, 1, 2]]
+    _squared_exponential = se._squared_exponential
+    try:
+        se._squared_exponential = None
+        K_python = [k(X, Xj, n, nj, hyper_deriv=h) for h in [None, 0, 1, 2]]
+    finally:
+        se._squared_exponential = _squared_exponential
+    for Kc, Kp in zip(K_compiled, K_python):
+        np.testing.assert_allclose(Kp, Kc, rtol=1e-12, atol=1e-13)